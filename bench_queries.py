@@ -0,0 +1,352 @@
+"""
+Бенчмарк SQL бота на большом синтетическом каталоге:
+
+    python bench_queries.py --rows 1000000
+
+Заполняет steam_apps_info синтетическим каталогом, замеряет каждый запрос и выражение
+юзкейсов и через EXPLAIN QUERY PLAN проверяет, что они идут по индексу. В начало очереди публикации
+кладется большой хвост записей, которые правила не пропускают, и для выборок из головы очереди
+считается число инструкций SQLite: план с SEARCH не показывает, сколько строк индекса перебрано.
+Если хоть один план сканирует таблицу или сортирует ее во временном B-дереве, или выборка из
+головы очереди перебирает хвост, завершается с кодом 1
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+from random import Random
+from typing import NamedTuple
+
+import aiosqlite
+
+import db
+import deals_api
+import translation
+import usecases
+from rules import PriceBandRule, PublishRules
+
+FILL_CHUNK_SIZE = 50_000
+# Как часто SQLite вызывает счетчик инструкций
+PROGRESS_STEP = 100
+# Сколько инструкций SQLite может занять выборка из головы очереди. Перебор тысяч записей BLOCKED
+# стоит сотни тысяч инструкций
+HEAD_OF_QUEUE_MAX_STEPS = 20_000
+
+# Части плана, которые означают полный проход по таблице или сортировку всей выборки
+BAD_PLAN_MARKERS = ("SCAN ", "USE TEMP B-TREE")
+ALLOWED_PLAN_DETAILS = ("SCAN CONSTANT ROW", )
+
+# Правила публикации, на которых проверяются скомпилированные условия
+BENCH_RULES = PublishRules(
+    min_discount=10,
+    price_bands=[
+        PriceBandRule(max_price=300, min_discount=50, cooldown_days=60),
+        PriceBandRule(min_price=300, max_price=2000, min_discount=25),
+        PriceBandRule(min_price=2000, min_discount=15, cooldown_days=14),
+    ],
+    excluded_apps=[10, 20, 30],
+)
+
+DISCOUNTS = (10, 15, 20, 25, 30, 33, 40, 50, 60, 67, 70, 75, 80, 85, 90)
+PRICES = (99.0, 149.0, 199.0, 249.0, 349.0, 435.0, 599.0, 799.0, 1199.0, 1599.0, 1999.0, 2999.0, 3999.0, 4999.0)
+
+
+class BenchQuery(NamedTuple):
+    name: str
+    sql: str
+    params: tuple
+    is_write: bool = False
+    # Для выборок из головы очереди: сколько инструкций SQLite запрос может выполнить
+    max_steps: int | None = None
+
+
+def synthetic_rows(count: int, seed: int = 0):
+    """
+    Генерирует строки steam_apps_info, похожие на реальные: app_id в основном с шагом 10,
+    ~90% записей уже опубликованы, у ~75% нет скидки, даты обновления за последние 2 года,
+    последняя проверка - между обновлением и текущим моментом
+    """
+    rnd = Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    app_id = 0
+    for _ in range(count):
+        app_id += 10 if rnd.random() < 0.9 else rnd.randint(1, 9)
+        status = (usecases.PostStatus.PUBLISHED.value if rnd.random() < 0.9
+                  else usecases.PostStatus.PENDING_PUBLISH.value)
+        discount_percent = 0 if rnd.random() < 0.75 else rnd.choice(DISCOUNTS)
+        age = rnd.randint(0, 730 * 24 * 3600)
+        updated_at = now - datetime.timedelta(seconds=age)
+        checked_at = now - datetime.timedelta(seconds=rnd.randint(0, age))
+        yield (app_id, discount_percent, rnd.choice(PRICES), status,
+               updated_at.strftime("%Y-%m-%d %H:%M:%S"), checked_at.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+async def fill_catalog(conn: aiosqlite.Connection, count: int, seed: int = 0) -> int:
+    """
+    Заполняет каталог count строками. Возвращает максимальный app_id
+    """
+    rows = synthetic_rows(count, seed)
+    max_app_id = 0
+    while True:
+        chunk = [row for _, row in zip(range(FILL_CHUNK_SIZE), rows)]
+        if not chunk:
+            break
+        await conn.executemany("""
+        INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at, checked_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, chunk)
+        max_app_id = chunk[-1][0]
+    await conn.commit()
+    return max_app_id
+
+
+async def fill_blocked_backlog(conn: aiosqlite.Connection, max_app_id: int, count: int):
+    """
+    Кладет в самое начало очереди публикации count найденных без скидки игр. Так выглядит очередь
+    с правилами публикации: такие игры не публикуются и годами лежат в начале очереди, потому что
+    их updated_at не меняется, пока не изменится цена
+    """
+    rows = (
+        (max_app_id + (number + 1) * 10, 0, PRICES[number % len(PRICES)], usecases.PostStatus.PENDING_PUBLISH.value,
+         "2000-01-01 00:00:00", "2000-01-01 00:00:00")
+        for number in range(count)
+    )
+    await conn.executemany("""
+    INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at, checked_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    await conn.commit()
+
+
+async def sort_queue(conn: aiosqlite.Connection, rules: PublishRules):
+    """
+    Раскладывает очередь публикации по статусам, как usecases.apply_publish_rules при запуске бота
+    """
+    publishable = rules.publish_predicate()
+    pending = usecases.PostStatus.PENDING_PUBLISH.value
+    blocked = usecases.PostStatus.BLOCKED.value
+    await conn.execute(usecases.UNBLOCK_PUBLISHABLE_TEMPLATE.format(publishable=publishable), (pending, blocked))
+    await conn.execute(usecases.BLOCK_ALL_REJECTED_TEMPLATE.format(publishable=publishable), (blocked, pending))
+    await conn.commit()
+
+
+def production_queries(max_app_id: int) -> list[BenchQuery]:
+    """
+    Все запросы и выражения, которые юзкейсы выполняют на steam_apps_info и job_checkpoints,
+    с правилами публикации по умолчанию и с BENCH_RULES.
+    Граница архивации задевает малую часть каталога, как и в реальном обслуживании
+    """
+    published = usecases.PostStatus.PUBLISHED.value
+    pending = usecases.PostStatus.PENDING_PUBLISH.value
+    unavailable = usecases.PostStatus.UNAVAILABLE.value
+    blocked = usecases.PostStatus.BLOCKED.value
+    existing_app_id = max_app_id // 2 // 10 * 10
+    archive_cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                      - datetime.timedelta(days=700)).strftime("%Y-%m-%d %H:%M:%S")
+    queries = []
+    for suffix, rules in (("", usecases.DEFAULT_RULES), (" (rules)", BENCH_RULES)):
+        select_rows_to_refresh_sql = usecases.SELECT_ROWS_TO_REFRESH_TEMPLATE.format(refreshable=rules.refresh_predicate())
+        queries += [
+            BenchQuery(f"refresh: select first page{suffix}", select_rows_to_refresh_sql, (published, "", 0, 100)),
+            BenchQuery(f"refresh: select next page{suffix}", select_rows_to_refresh_sql,
+                       (published, "2025-01-01 00:00:00", existing_app_id, 100)),
+            BenchQuery(f"publish: select next post{suffix}",
+                       usecases.SELECT_NEXT_POST_TEMPLATE.format(publishable=rules.publish_predicate()), (pending, ),
+                       max_steps=HEAD_OF_QUEUE_MAX_STEPS),
+            BenchQuery(f"digest: select top discounts{suffix}",
+                       usecases.SELECT_DIGEST_TEMPLATE.format(publishable=rules.publish_predicate()), (pending, 10)),
+            BenchQuery(f"translation: select upcoming{suffix}",
+                       translation.SELECT_UPCOMING_TEMPLATE.format(publishable=rules.publish_predicate()),
+                       (pending, 20), max_steps=HEAD_OF_QUEUE_MAX_STEPS),
+        ]
+    queries.append(BenchQuery(
+        "refresh: select unavailable", select_rows_to_refresh_sql, (unavailable, "", 0, 100)
+    ))
+    queries.append(BenchQuery(
+        "refresh: select blocked (rules)", select_rows_to_refresh_sql, (blocked, "", 0, 100)
+    ))
+    queries.append(BenchQuery(
+        "refresh: select archived (rules)",
+        usecases.SELECT_ARCHIVED_ROWS_TO_REFRESH_TEMPLATE.format(refreshable=BENCH_RULES.refresh_predicate()),
+        ("", 0, 100)
+    ))
+    queries.append(BenchQuery(
+        "refresh: block rejected (rules)",
+        usecases.BLOCK_REJECTED_TEMPLATE.format(publishable=BENCH_RULES.publish_predicate()),
+        (blocked, existing_app_id, pending), True
+    ))
+    queries.append(BenchQuery(
+        "startup: unblock publishable (rules)",
+        usecases.UNBLOCK_PUBLISHABLE_TEMPLATE.format(publishable=BENCH_RULES.publish_predicate()),
+        (pending, blocked), True
+    ))
+
+    return queries + [
+        BenchQuery("checkpoint: load", db.LOAD_CHECKPOINT_SQL, (usecases.REFRESH_CURSOR_CHECKPOINT, )),
+        BenchQuery("discovery: insert app", usecases.INSERT_APP_INFO_SQL,
+                   (max_app_id + 10, 20, 599.0, pending), True),
+        BenchQuery("refresh: update price", usecases.UPDATE_APP_PRICE_SQL,
+                   (799.0, 30, pending, existing_app_id), True),
+        BenchQuery("refresh: mark checked", usecases.MARK_CHECKED_SQL, (existing_app_id, ), True),
+        BenchQuery("refresh: mark archived checked", usecases.MARK_ARCHIVED_CHECKED_SQL, (existing_app_id, ), True),
+        BenchQuery("refresh: restore archived", usecases.RESTORE_ARCHIVED_SQL,
+                   (existing_app_id, 30, 799.0, pending), True),
+        BenchQuery("refresh: delete restored", usecases.DELETE_RESTORED_SQL, (existing_app_id, ), True),
+        BenchQuery("publish: mark published", usecases.UPDATE_STATUS_SQL, (published, existing_app_id), True),
+        BenchQuery("publish: mark unavailable", usecases.MARK_UNAVAILABLE_SQL, (unavailable, existing_app_id), True),
+        BenchQuery("checkpoint: save", db.SAVE_CHECKPOINT_SQL,
+                   (usecases.REFRESH_CURSOR_CHECKPOINT, '["", 0]'), True),
+        BenchQuery("publish: load translation", translation.SELECT_TRANSLATION_SQL, (existing_app_id, "0" * 64)),
+        BenchQuery("translation: save", translation.SAVE_TRANSLATION_SQL,
+                   (existing_app_id, "0" * 64, "Описание"), True),
+        BenchQuery("deals api: full snapshot", deals_api.SELECT_DEALS_SQL, (published, pending, blocked)),
+        BenchQuery("deals api: changed since", deals_api.SELECT_CHANGED_DEALS_SQL,
+                   (published, pending, blocked, unavailable, "2025-01-01 00:00:00")),
+        BenchQuery("maintenance: count archivable", usecases.COUNT_ARCHIVABLE_SQL,
+                   (published, archive_cutoff)),
+        BenchQuery("maintenance: archive rows", usecases.ARCHIVE_PUBLISHED_SQL,
+                   (published, archive_cutoff), True),
+        BenchQuery("maintenance: delete archived", usecases.DELETE_ARCHIVED_SQL,
+                   (published, archive_cutoff), True),
+    ]
+
+
+async def query_plan(conn: aiosqlite.Connection, query: BenchQuery) -> list[str]:
+    async with conn.execute(f"EXPLAIN QUERY PLAN {query.sql}", query.params) as c:
+        return [row[3] for row in await c.fetchall()]
+
+
+def bad_plan_details(plan: list[str]) -> list[str]:
+    return [
+        detail for detail in plan
+        if detail not in ALLOWED_PLAN_DETAILS and any(marker in detail for marker in BAD_PLAN_MARKERS)
+    ]
+
+
+async def check_plans(conn: aiosqlite.Connection, queries: list[BenchQuery]) -> list[tuple[str, list[str]]]:
+    """
+    Возвращает запросы, план которых сканирует таблицу или сортирует выборку, вместе с их планом
+    """
+    violations = []
+    for query in queries:
+        plan = await query_plan(conn, query)
+        if bad_plan_details(plan):
+            violations.append((query.name, plan))
+    return violations
+
+
+async def count_steps(conn: aiosqlite.Connection, query: BenchQuery) -> int:
+    """
+    Сколько инструкций SQLite выполняет запрос, с точностью до PROGRESS_STEP. Растет с числом
+    перебранных строк, даже когда план идет по индексу
+    """
+    calls = 0
+
+    def progress() -> int:
+        nonlocal calls
+        calls += 1
+        return 0
+
+    await conn.set_progress_handler(progress, PROGRESS_STEP)
+    try:
+        async with conn.execute(query.sql, query.params) as c:
+            await c.fetchall()
+    finally:
+        await conn.set_progress_handler(None, PROGRESS_STEP)
+    return calls * PROGRESS_STEP
+
+
+async def check_steps(conn: aiosqlite.Connection, queries: list[BenchQuery]) -> list[tuple[str, int]]:
+    """
+    Возвращает выборки из головы очереди, которые выполнили больше max_steps инструкций SQLite
+    """
+    violations = []
+    for query in queries:
+        if query.max_steps is not None:
+            steps = await count_steps(conn, query)
+            if steps > query.max_steps:
+                violations.append((query.name, steps))
+    return violations
+
+
+async def time_query(conn: aiosqlite.Connection, query: BenchQuery, repeat: int) -> list[float]:
+    """
+    Время выполнения запроса в миллисекундах. Выражения записи откатываются, чтобы каталог не менялся
+    """
+    timings = []
+    for _ in range(repeat):
+        if query.is_write:
+            await conn.execute("SAVEPOINT bench")
+        start = time.perf_counter()
+        async with conn.execute(query.sql, query.params) as c:
+            await c.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+        if query.is_write:
+            await conn.execute("ROLLBACK TO bench")
+            await conn.execute("RELEASE bench")
+    return timings
+
+
+async def run(path: str, rows: int, repeat: int, analyze: bool, seed: int, profile: str) -> int:
+    conn = await aiosqlite.connect(path)
+    await conn.execute("PRAGMA journal_mode=WAL;")
+    await db.apply_profile(conn, profile)
+    await db.create_schema(conn)
+
+    print(f"Filling steam_apps_info with {rows} synthetic rows...")
+    start = time.perf_counter()
+    max_app_id = await fill_catalog(conn, rows, seed)
+    await fill_blocked_backlog(conn, max_app_id, rows // 3)
+    await sort_queue(conn, BENCH_RULES)
+    print(f"Filled in {time.perf_counter() - start:.1f}s")
+
+    if analyze:
+        await conn.execute("ANALYZE")
+        await conn.commit()
+
+    queries = production_queries(max_app_id)
+    failed = False
+    print(f"{'query':<32} {'median ms':>10} {'p95 ms':>10} {'steps':>9}  plan")
+    for query in queries:
+        plan = await query_plan(conn, query)
+        timings = sorted(await time_query(conn, query, repeat))
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        steps = await count_steps(conn, query) if not query.is_write else None
+        bad = bool(bad_plan_details(plan)) or (query.max_steps is not None and steps > query.max_steps)
+        failed = failed or bad
+        print(f"{query.name:<32} {statistics.median(timings):>10.3f} {p95:>10.3f} "
+              f"{steps if steps is not None else '-':>9}  {'FAIL ' if bad else ''}{'; '.join(plan) or '-'}")
+
+    await conn.close()
+
+    if failed:
+        print("Some queries scan or sort steam_apps_info instead of using an index "
+              "or walk the blocked rows at the head of the queue", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the bot's SQL on a large synthetic catalog")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="catalog size")
+    parser.add_argument("--repeat", type=int, default=50, help="runs of every query")
+    parser.add_argument("--db", help="database file. By default a temporary file is used and removed")
+    parser.add_argument("--analyze", action="store_true", help="run ANALYZE before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", default=db.DEFAULT_PROFILE, choices=sorted(db.PERFORMANCE_PROFILES),
+                        help="SQLite performance profile")
+    args = parser.parse_args()
+
+    if args.db:
+        return asyncio.run(run(args.db, args.rows, args.repeat, args.analyze, args.seed, args.profile))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return asyncio.run(run(os.path.join(tmp_dir, "bench.db"), args.rows, args.repeat, args.analyze, args.seed, args.profile))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
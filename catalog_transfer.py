@@ -0,0 +1,257 @@
+"""
+Выгрузка и загрузка каталога игр, чтобы новый экземпляр бота не искал игры с app_id=1:
+
+    python catalog_transfer.py export catalog.jsonl.gz
+    python catalog_transfer.py import catalog.jsonl.gz
+
+Файл - JSON по строке на запись (сжимается gzip, если имя кончается на .gz). Первая строка -
+заголовок со столбцами таблиц и счетчиком поиска игр, дальше строки вида ["таблица", значения...].
+Обе команды идут потоком пачками по --chunk-size строк и не держат каталог в памяти.
+Загрузка работает с выключенным ботом: удаляет вторичные индексы, пишет пачки одной транзакцией
+на пачку с семантикой upsert (побеждает более свежая запись), затем строит индексы заново и
+обновляет статистику планировщика. Счетчик поиска игр становится максимумом из своего и загруженного
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import sys
+import time
+from typing import IO, NamedTuple
+
+import aiosqlite
+
+import db
+from counter_file import read_counter, write_counter
+from usecases import DISCOVERY_COUNTER_CHECKPOINT
+
+FORMAT = "steam-catalog"
+FORMAT_VERSION = 1
+CHUNK_SIZE = 50_000
+
+
+class TableSpec(NamedTuple):
+    name: str
+    columns: tuple[str, ...]
+    upsert_sql: str
+
+
+# job_checkpoints не переносится: прогресс юзкейсов относится к конкретному экземпляру бота
+TABLES = (
+    # checked_at не выгружается, чтобы не менять формат файла: загруженная запись считается
+    # проверенной тогда же, когда изменилась, и проверяется по сроку правил от этого времени
+    TableSpec("steam_apps_info", ("app_id", "discount_percent", "init_price", "status", "updated_at"), """
+    INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at, checked_at)
+    VALUES (?, ?, ?, ?, ?, ?5)
+    ON CONFLICT(app_id) DO UPDATE SET
+        discount_percent = excluded.discount_percent,
+        init_price = excluded.init_price,
+        status = excluded.status,
+        updated_at = excluded.updated_at,
+        checked_at = excluded.checked_at
+    WHERE excluded.updated_at > steam_apps_info.updated_at
+    """),
+    # Архивная запись перед переносом была проверена, поэтому ее checked_at берется из archived_at
+    TableSpec("steam_apps_archive", ("app_id", "discount_percent", "init_price", "status", "updated_at", "archived_at"), """
+    INSERT INTO steam_apps_archive (app_id, discount_percent, init_price, status, updated_at, archived_at, checked_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?6)
+    ON CONFLICT(app_id) DO UPDATE SET
+        discount_percent = excluded.discount_percent,
+        init_price = excluded.init_price,
+        status = excluded.status,
+        updated_at = excluded.updated_at,
+        archived_at = excluded.archived_at,
+        checked_at = excluded.checked_at
+    WHERE excluded.updated_at > steam_apps_archive.updated_at
+    """),
+    # Повторная загрузка того же файла не должна удваивать статистику, поэтому берется более полная
+    TableSpec("id_space_stats", ("kind", "key", "probes", "hits"), """
+    INSERT INTO id_space_stats (kind, key, probes, hits) VALUES (?, ?, ?, ?)
+    ON CONFLICT(kind, key) DO UPDATE SET
+        probes = excluded.probes,
+        hits = excluded.hits
+    WHERE excluded.probes > id_space_stats.probes
+    """),
+    TableSpec("id_skipped_ranges", ("first_id", "last_id"), """
+    INSERT INTO id_skipped_ranges (first_id, last_id) VALUES (?, ?)
+    ON CONFLICT(first_id) DO NOTHING
+    """),
+    TableSpec("translations", ("app_id", "source_hash", "translated_text", "created_at"), """
+    INSERT INTO translations (app_id, source_hash, translated_text, created_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(app_id, source_hash) DO NOTHING
+    """),
+)
+TABLES_BY_NAME = {table.name: table for table in TABLES}
+
+
+class CatalogFormatError(Exception):
+    """
+    Файл не является выгрузкой каталога или поврежден
+    """
+
+
+def _open_text(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        # Уровень 6 сжимает почти как 9, но в разы быстрее
+        return gzip.open(path, mode + "t", compresslevel=6, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+async def export_catalog(db_path: str, output_path: str, counter_path: str,
+                         chunk_size: int = CHUNK_SIZE) -> dict[str, int]:
+    """
+    Выгружает таблицы TABLES в output_path. Читает через read-only соединение, поэтому
+    работающий бот не мешает выгрузке. Возвращает число выгруженных строк по таблицам
+    """
+    conn = await aiosqlite.connect(f"file:{db_path}?mode=ro", uri=True)
+    counts = {}
+    try:
+        # Поиск игр сохраняет счетчик и в job_checkpoints, и там он бывает впереди файла
+        async with conn.execute(db.LOAD_CHECKPOINT_SQL, (DISCOVERY_COUNTER_CHECKPOINT, )) as c:
+            checkpoint = await c.fetchone()
+        counters = [int(checkpoint[0])] if checkpoint is not None else []
+        file_counter = read_counter(counter_path)
+        if file_counter is not None:
+            counters.append(file_counter)
+
+        if counters:
+            counter = max(counters)
+        else:
+            # Без файла счетчика поиск продолжается за последней известной игрой
+            async with conn.execute(
+                "SELECT MAX(app_id) FROM (SELECT MAX(app_id) AS app_id FROM steam_apps_info "
+                "UNION ALL SELECT MAX(app_id) FROM steam_apps_archive)"
+            ) as c:
+                counter = (await c.fetchone())[0] or 0
+
+        with _open_text(output_path, "w") as f:
+            header = {
+                "format": FORMAT, "version": FORMAT_VERSION, "counter": counter,
+                "tables": {table.name: table.columns for table in TABLES},
+            }
+            f.write(json.dumps(header) + "\n")
+
+            for table in TABLES:
+                counts[table.name] = 0
+                async with conn.execute(f"SELECT {', '.join(table.columns)} FROM {table.name}") as c:
+                    while rows := await c.fetchmany(chunk_size):
+                        f.writelines(
+                            json.dumps([table.name, *row], ensure_ascii=False, separators=(",", ":")) + "\n"
+                            for row in rows
+                        )
+                        counts[table.name] += len(rows)
+    finally:
+        await conn.close()
+    return counts
+
+
+def _read_header(f: IO[str]) -> dict:
+    try:
+        header = json.loads(f.readline())
+    except json.JSONDecodeError as e:
+        raise CatalogFormatError("The file has no catalog header") from e
+
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise CatalogFormatError("The file is not a catalog export")
+    if header.get("version") != FORMAT_VERSION:
+        raise CatalogFormatError(f"Unsupported catalog version {header.get('version')}")
+    for name, columns in header.get("tables", {}).items():
+        if name not in TABLES_BY_NAME or tuple(columns) != TABLES_BY_NAME[name].columns:
+            raise CatalogFormatError(f"Unknown table {name} or its columns in the catalog")
+    return header
+
+
+async def _drop_secondary_indexes(conn: aiosqlite.Connection):
+    # У автоматических индексов первичных ключей sql пустой, они остаются и нужны для upsert
+    async with conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL") as c:
+        names = [name for name, in await c.fetchall()]
+    for name in names:
+        await conn.execute(f"DROP INDEX {name}")
+    await conn.commit()
+
+
+async def import_catalog(input_path: str, db_path: str, counter_path: str,
+                         chunk_size: int = CHUNK_SIZE, profile: str = db.DEFAULT_PROFILE) -> dict[str, int]:
+    """
+    Загружает выгрузку в базу db_path и сдвигает счетчик поиска игр. Запускается при выключенном боте.
+    Возвращает число прочитанных строк по таблицам
+    """
+    with _open_text(input_path, "r") as f:
+        header = _read_header(f)
+
+        conn = await aiosqlite.connect(db_path)
+        try:
+            # Как в Storage.open: действует только для новой базы
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+            await conn.execute("PRAGMA journal_mode=WAL;")
+            await db.apply_profile(conn, profile)
+            await db.create_schema(conn)
+            await _drop_secondary_indexes(conn)
+
+            counts = dict.fromkeys(TABLES_BY_NAME, 0)
+            pending: dict[str, list] = {name: [] for name in TABLES_BY_NAME}
+
+            async def flush(table_name: str):
+                await conn.executemany(TABLES_BY_NAME[table_name].upsert_sql, pending[table_name])
+                await conn.commit()
+                counts[table_name] += len(pending[table_name])
+                pending[table_name].clear()
+
+            for line_number, line in enumerate(f, 2):
+                try:
+                    table_name, *row = json.loads(line)
+                except (json.JSONDecodeError, TypeError, ValueError) as e:
+                    raise CatalogFormatError(f"Line {line_number} is not a catalog row") from e
+                table = TABLES_BY_NAME.get(table_name)
+                if table is None or len(row) != len(table.columns):
+                    raise CatalogFormatError(f"Line {line_number} doesn't match any catalog table")
+
+                pending[table_name].append(row)
+                if len(pending[table_name]) >= chunk_size:
+                    await flush(table_name)
+
+            for table_name, rows in pending.items():
+                if rows:
+                    await flush(table_name)
+        finally:
+            # Индексы строятся заново и тогда, когда загрузка упала, иначе бот останется без них
+            await db.create_schema(conn)
+            await conn.execute("ANALYZE")
+            await conn.commit()
+            await conn.close()
+
+    imported_counter = int(header.get("counter") or 0)
+    local_counter = read_counter(counter_path)
+    if local_counter is None or imported_counter > local_counter:
+        write_counter(counter_path, imported_counter)
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Export or import the bot's game catalog")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="catalog file, gzip-compressed if it ends with .gz")
+    parser.add_argument("--db", default=db.DB_PATH, help="bot database")
+    parser.add_argument("--counter", default="counter.txt", help="discovery counter file")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per read and per import transaction")
+    parser.add_argument("--profile", default=db.DEFAULT_PROFILE, choices=sorted(db.PERFORMANCE_PROFILES),
+                        help="SQLite performance profile for import")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.command == "export":
+            counts = asyncio.run(export_catalog(args.db, args.path, args.counter, args.chunk_size))
+        else:
+            counts = asyncio.run(import_catalog(args.path, args.db, args.counter, args.chunk_size, args.profile))
+    except CatalogFormatError as e:
+        print(f"Cannot import {args.path}: {e}", file=sys.stderr)
+        return 1
+
+    rows = ", ".join(f"{name}={count}" for name, count in counts.items())
+    print(f"{args.command.capitalize()}ed {rows} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
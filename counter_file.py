@@ -0,0 +1,21 @@
+import os
+
+
+def read_counter(counter_path: str) -> int | None:
+    """
+    Читает счетчик поиска игр. Нет файла или он поврежден - None, тогда вызывающий
+    берет значение из другого источника (job_checkpoints или каталога)
+    """
+    try:
+        with open(counter_path, "r") as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_counter(counter_path: str, value: int):
+    # Файл заменяется целиком, чтобы убитый посреди записи процесс не оставил пустой счетчик
+    tmp_path = f"{counter_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(value))
+    os.replace(tmp_path, counter_path)
@@ -1,32 +1,438 @@
 import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable
+
 import aiosqlite
 
+import diagnostics
+
 DB_PATH = "posts.db"
 
-db: aiosqlite.Connection | None = None
-db_lock = asyncio.Lock()
+# Сколько read-only соединений держать для SELECT'ов из юзкейсов
+READ_POOL_SIZE = 3
+# Сколько команд записи писатель забирает из очереди в одну транзакцию
+WRITE_BATCH_SIZE = 100
+
+storage: "Storage | None" = None
+
+# Профили настроек SQLite. Применяются к каждому соединению при подключении,
+# читателям достаются только настройки уровня соединения из READER_PRAGMAS
+PERFORMANCE_PROFILES: dict[str, dict[str, object]] = {
+    # В WAL режиме synchronous=NORMAL не портит базу при падении, теряются только последние коммиты
+    "default": {
+        "synchronous": "NORMAL",
+        "cache_size": -32768,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+    "durable": {
+        "synchronous": "FULL",
+        "cache_size": -32768,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+    "low_memory": {
+        "synchronous": "NORMAL",
+        "cache_size": -4096,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "wal_autocheckpoint": 500,
+        "journal_size_limit": 16 * 1024 * 1024,
+    },
+}
+DEFAULT_PROFILE = "default"
+READER_PRAGMAS = ("cache_size", "mmap_size", "temp_store")
+
+LOAD_CHECKPOINT_SQL = "SELECT value FROM job_checkpoints WHERE name = ?"
 
-async def init_db():
-    global db
-    db = await aiosqlite.connect(DB_PATH)
+SAVE_CHECKPOINT_SQL = """
+INSERT INTO job_checkpoints (name, value) VALUES (?, ?)
+ON CONFLICT(name) DO UPDATE SET value = excluded.value
+"""
 
-    await db.execute("PRAGMA journal_mode=WAL;")
 
-    await db.execute("""
+async def _add_column(conn: aiosqlite.Connection, table: str, column: str, definition: str) -> bool:
+    """
+    Добавляет столбец в таблицу, созданную прошлой версией схемы. Возвращает True, если столбца не было
+    """
+    async with conn.execute(f"PRAGMA table_info({table})") as c:
+        if column in {row[1] for row in await c.fetchall()}:
+            return False
+    await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+
+async def create_schema(conn: aiosqlite.Connection):
+    await conn.execute("""
     CREATE TABLE IF NOT EXISTS steam_apps_info (
         app_id INTEGER PRIMARY KEY,
         discount_percent INTEGER NOT NULL,
         init_price REAL NOT NULL,
         status INTEGER NOT NULL,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP NOT NULL
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        checked_at TIMESTAMP NOT NULL DEFAULT ''
+    )
+    """)
+    # updated_at - последнее изменение цены или статуса, checked_at - последняя проверка в Steam,
+    # даже если ничего не изменилось. По checked_at считаются сроки повторной проверки правил.
+    # Пустая строка раньше любой даты: запись, которую еще не проверяли, проверяется первой
+    if await _add_column(conn, "steam_apps_info", "checked_at", "TIMESTAMP NOT NULL DEFAULT ''"):
+        await conn.execute("UPDATE steam_apps_info SET checked_at = updated_at")
+
+    await conn.execute("CREATE INDEX IF NOT EXISTS steam_apps_info_status_and_updated_at ON steam_apps_info(status, updated_at)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS steam_apps_info_status_and_checked_at ON steam_apps_info(status, checked_at)")
+    # Для выбора самых больших скидок в дайджест без сортировки всей очереди публикации
+    await conn.execute("CREATE INDEX IF NOT EXISTS steam_apps_info_status_and_discount ON steam_apps_info(status, discount_percent, init_price)")
+
+    # Давно опубликованные записи, перенесенные из steam_apps_info при обслуживании базы. Обновление цен
+    # проверяет их по checked_at, как и опубликованные, и возвращает в steam_apps_info при смене цены
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS steam_apps_archive (
+        app_id INTEGER PRIMARY KEY,
+        discount_percent INTEGER NOT NULL,
+        init_price REAL NOT NULL,
+        status INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        checked_at TIMESTAMP NOT NULL DEFAULT ''
     )
     """)
+    if await _add_column(conn, "steam_apps_archive", "checked_at", "TIMESTAMP NOT NULL DEFAULT ''"):
+        await conn.execute("UPDATE steam_apps_archive SET checked_at = updated_at")
+    await conn.execute("CREATE INDEX IF NOT EXISTS steam_apps_archive_checked_at ON steam_apps_archive(checked_at)")
+
+    # Статистика попаданий find_steam_ids по диапазонам app_id (см. id_density)
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS id_space_stats (
+        kind TEXT NOT NULL,
+        key INTEGER NOT NULL,
+        probes INTEGER NOT NULL,
+        hits INTEGER NOT NULL,
+        PRIMARY KEY (kind, key)
+    )
+    """)
+
+    # app_id, которые find_steam_ids пропустил: first_id, first_id + 10, ..., last_id (см. id_density)
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS id_skipped_ranges (
+        first_id INTEGER PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    )
+    """)
+
+    # Кэш переводов описаний игр. Ключ - app_id и хэш исходного текста (см. translation).
+    # created_at - когда перевод последний раз сохранен или подтвержден для текущего описания
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS translations (
+        app_id INTEGER NOT NULL,
+        source_hash TEXT NOT NULL,
+        translated_text TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (app_id, source_hash)
+    )
+    """)
+
+    # Прогресс юзкейсов, чтобы прерванный запуск продолжился с того же места
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS job_checkpoints (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """)
+
+    await conn.commit()
+
+
+async def apply_profile(conn: aiosqlite.Connection, profile: str, reader: bool = False):
+    for pragma, value in PERFORMANCE_PROFILES[profile].items():
+        if reader and pragma not in READER_PRAGMAS:
+            continue
+        await conn.execute(f"PRAGMA {pragma}={value}")
+
+
+class _WriteCommand:
+    __slots__ = ("statements", "future", "transactional")
+
+    def __init__(self, statements: list[tuple[str, object, bool]], future: asyncio.Future,
+                 transactional: bool = True):
+        self.statements = statements
+        self.future = future
+        self.transactional = transactional
+
+
+# Команда остановки писателя
+_STOP = object()
+
+
+class DbWriter:
+    """
+    Единственный писатель в базу. Команды записи приходят через очередь, писатель забирает
+    все накопившиеся команды (не больше batch_size) и применяет их одной транзакцией.
+    Каждая команда выполняется в своем SAVEPOINT, поэтому упавшая команда откатывается
+    целиком и не мешает закоммитить остальные команды пачки
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, batch_size: int = WRITE_BATCH_SIZE):
+        self._conn = conn
+        self._batch_size = batch_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._commit_listeners: list[Callable[[], None]] = []
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def add_commit_listener(self, listener: Callable[[], None]):
+        """
+        listener вызывается после каждого коммита пачки, в которой хоть одна команда записалась.
+        Вызывается в задаче писателя, поэтому должен быть быстрым и не ждать записи
+        """
+        self._commit_listeners.append(listener)
+
+    async def execute(self, sql: str, params=()):
+        await self._submit([(sql, params, False)])
+
+    async def executemany(self, sql: str, seq_of_params):
+        await self._submit([(sql, list(seq_of_params), True)])
+
+    async def execute_batch(self, statements: list[tuple[str, object]]):
+        """
+        Выполняет несколько выражений атомарно: либо применяются все, либо ни одно
+        """
+        await self._submit([(sql, params, False) for sql, params in statements])
+
+    async def run_outside_transaction(self, sql: str) -> list:
+        """
+        Выполняет выражение вне транзакции, между пачками записей. Нужно для VACUUM,
+        wal_checkpoint и других PRAGMA обслуживания. Возвращает строки результата
+        """
+        return await self._submit([(sql, (), False)], transactional=False)
+
+    async def _submit(self, statements: list[tuple[str, object, bool]], transactional: bool = True):
+        if self._task is None or self._task.done():
+            raise RuntimeError("DbWriter is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_WriteCommand(statements, future, transactional))
+        # Возвращаемся только после коммита, чтобы вызывающий код мог полагаться на запись
+        return await future
+
+    async def _run(self):
+        command = None
+        while True:
+            if command is None:
+                command = await self._queue.get()
+            if command is _STOP:
+                break
+
+            if not command.transactional:
+                await self._apply_outside_transaction(command)
+                command = None
+                continue
+
+            batch = [command]
+            command = None
+            while len(batch) < self._batch_size:
+                try:
+                    next_command = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                # Остановка и команды вне транзакции выполняются после текущей пачки
+                if next_command is _STOP or not next_command.transactional:
+                    command = next_command
+                    break
+                batch.append(next_command)
+
+            await self._apply(batch)
+
+    async def _apply_outside_transaction(self, command: _WriteCommand):
+        (sql, params, _), = command.statements
+        try:
+            async with self._conn.execute(sql, params) as c:
+                rows = await c.fetchall()
+        except Exception as e:
+            if not command.future.done():
+                command.future.set_exception(e)
+            return
+        if not command.future.done():
+            command.future.set_result(rows)
+
+    async def _apply(self, batch: list[_WriteCommand]):
+        errors: list[BaseException | None] = []
+        try:
+            await self._conn.execute("BEGIN")
+            for command in batch:
+                await self._conn.execute("SAVEPOINT write_command")
+                try:
+                    for sql, params, many in command.statements:
+                        if many:
+                            await self._conn.executemany(sql, params)
+                        else:
+                            await self._conn.execute(sql, params)
+                except Exception as e:
+                    await self._conn.execute("ROLLBACK TO write_command")
+                    errors.append(e)
+                else:
+                    errors.append(None)
+                await self._conn.execute("RELEASE write_command")
+            await self._conn.commit()
+        except Exception as e:
+            # Не удалось открыть или закоммитить транзакцию - вся пачка не записана
+            try:
+                await self._conn.rollback()
+            except Exception:
+                pass
+            errors = [e] * len(batch)
+
+        if any(error is None for error in errors):
+            for listener in self._commit_listeners:
+                listener()
+
+        for command, error in zip(batch, errors):
+            if command.future.done():
+                continue
+            if error is None:
+                command.future.set_result(None)
+            else:
+                command.future.set_exception(error)
+
+    async def close(self):
+        """
+        Дописывает все команды, которые уже стоят в очереди, и останавливает писателя
+        """
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+
+class ReadPool:
+    """
+    Пул read-only соединений. В WAL режиме читатели не ждут писателя
+    """
+
+    def __init__(self, conns: list[aiosqlite.Connection]):
+        self._conns = conns
+        self._free: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        for conn in conns:
+            self._free.put_nowait(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        conn = await self._free.get()
+        try:
+            yield conn
+        finally:
+            self._free.put_nowait(conn)
+
+    @property
+    def connections(self) -> list[aiosqlite.Connection]:
+        return self._conns
+
+
+class Storage:
+    """
+    Слой хранения для юзкейсов: все записи идут через единственного писателя,
+    все чтения - через пул read-only соединений
+    """
+
+    def __init__(self, writer_conn: aiosqlite.Connection, reader_conns: list[aiosqlite.Connection],
+                 batch_size: int = WRITE_BATCH_SIZE):
+        self._writer_conn = writer_conn
+        self.writer = DbWriter(writer_conn, batch_size)
+        self.readers = ReadPool(reader_conns)
+
+    @classmethod
+    async def open(cls, path: str = DB_PATH, read_pool_size: int = READ_POOL_SIZE,
+                   profile: str = DEFAULT_PROFILE) -> "Storage":
+        writer_conn = await aiosqlite.connect(path)
+        # Действует только для новой базы, существующую переводит maintain_db
+        await writer_conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        await writer_conn.execute("PRAGMA journal_mode=WAL;")
+        await apply_profile(writer_conn, profile)
+        await create_schema(writer_conn)
+
+        if path == ":memory:":
+            # У in-memory базы каждое соединение видит свою базу, поэтому читаем через писателя
+            reader_conns = [writer_conn]
+        else:
+            reader_conns = []
+            for _ in range(read_pool_size):
+                reader_conn = await aiosqlite.connect(f"file:{path}?mode=ro", uri=True)
+                await apply_profile(reader_conn, profile, reader=True)
+                reader_conns.append(reader_conn)
+
+        instance = cls(writer_conn, reader_conns)
+        instance.writer.start()
+        return instance
+
+    @classmethod
+    async def from_connection(cls, conn: aiosqlite.Connection) -> "Storage":
+        """
+        Одно соединение и для чтения, и для записи. Нужно для тестов на in-memory базе
+        """
+        instance = cls(conn, [conn])
+        instance.writer.start()
+        return instance
+
+    @asynccontextmanager
+    async def read(self):
+        async with self.readers.acquire() as conn:
+            yield conn
+
+    async def fetchall(self, sql: str, params=()) -> list:
+        with diagnostics.phase(diagnostics.SQL):
+            async with self.read() as conn:
+                async with conn.execute(sql, params) as c:
+                    return await c.fetchall()
+
+    async def fetchone(self, sql: str, params=()):
+        with diagnostics.phase(diagnostics.SQL):
+            async with self.read() as conn:
+                async with conn.execute(sql, params) as c:
+                    return await c.fetchone()
+
+    async def execute(self, sql: str, params=()):
+        with diagnostics.phase(diagnostics.SQL):
+            await self.writer.execute(sql, params)
+
+    async def executemany(self, sql: str, seq_of_params):
+        with diagnostics.phase(diagnostics.SQL):
+            await self.writer.executemany(sql, seq_of_params)
+
+    async def execute_batch(self, statements: list[tuple[str, object]]):
+        with diagnostics.phase(diagnostics.SQL):
+            await self.writer.execute_batch(statements)
+
+    async def run_outside_transaction(self, sql: str) -> list:
+        with diagnostics.phase(diagnostics.SQL):
+            return await self.writer.run_outside_transaction(sql)
+
+    async def get_checkpoint(self, name: str, default: str | None = None) -> str | None:
+        row = await self.fetchone(LOAD_CHECKPOINT_SQL, (name, ))
+        return row[0] if row else default
+
+    async def save_checkpoint(self, name: str, value):
+        await self.execute(SAVE_CHECKPOINT_SQL, (name, str(value)))
+
+    async def close(self):
+        await self.writer.close()
+        for conn in self.readers.connections:
+            if conn is not self._writer_conn:
+                await conn.close()
+        await self._writer_conn.close()
 
-    await db.execute("CREATE INDEX IF NOT EXISTS steam_apps_info_status_and_updated_at ON steam_apps_info(status, updated_at)")
 
-    await db.commit()
+async def init_db(profile: str = DEFAULT_PROFILE):
+    global storage
+    storage = await Storage.open(DB_PATH, READ_POOL_SIZE, profile)
 
     print("database initialized")
 
 async def close_db():
-    await db.close()
\ No newline at end of file
+    await storage.close()
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from aiohttp import web
+
+from db import Storage
+from usecases import PostStatus
+
+# Через сколько секунд после коммита обновляется снимок. Коммиты за это время попадают в одно обновление
+REBUILD_DELAY = 1.0
+# Как часто снимок строится заново целиком. Инкрементальное обновление не видит удаленные при архивации записи
+FULL_REBUILD_INTERVAL = 3600
+FETCH_CHUNK_SIZE = 10_000
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Сколько готовых ответов хранится для текущего снимка
+RESPONSE_CACHE_SIZE = 256
+
+# Идет по индексу (status, discount_percent, init_price) и не трогает записи без скидки.
+# Скидка на игру, которую правила не пропускают в публикацию (BLOCKED), тоже текущая
+SELECT_DEALS_SQL = """
+SELECT app_id, discount_percent, init_price, updated_at FROM steam_apps_info
+WHERE status IN (?, ?, ?) AND discount_percent > 0
+"""
+
+# Все ветки IN идут диапазоном индекса (status, updated_at). Скидка и статус проверяются в Python:
+# запись, у которой скидка закончилась или игра стала недоступна, удаляется из снимка
+SELECT_CHANGED_DEALS_SQL = """
+SELECT app_id, discount_percent, init_price, updated_at, status FROM steam_apps_info
+WHERE status IN (?, ?, ?, ?) AND updated_at >= ?
+"""
+
+
+class Deal(NamedTuple):
+    app_id: int
+    discount_percent: int
+    init_price: float
+    updated_at: str
+
+    @property
+    def final_price(self) -> float:
+        return round(self.init_price - self.init_price * self.discount_percent / 100, 2)
+
+    def to_json(self) -> dict:
+        return {
+            "app_id": self.app_id,
+            "discount_percent": self.discount_percent,
+            "init_price": self.init_price,
+            "final_price": self.final_price,
+            "updated_at": self.updated_at,
+            "url": f"https://store.steampowered.com/app/{self.app_id}",
+        }
+
+
+# Сортировки выдачи: ключ и по убыванию ли
+SORTS = {
+    "discount": (lambda deal: (deal.discount_percent, -deal.final_price), True),
+    "price": (lambda deal: (deal.final_price, -deal.discount_percent), False),
+    "updated": (lambda deal: (deal.updated_at, deal.app_id), True),
+}
+
+
+class DealsSnapshot:
+    """
+    Снимок текущих скидок в памяти. После каждого коммита писателя снимок дочитывает записи,
+    обновленные с прошлого раза, через read-only соединения. HTTP запросы читают только снимок
+    и не трогают базу
+    """
+
+    def __init__(self, storage: Storage, logger: logging.Logger, rebuild_delay: float = REBUILD_DELAY,
+                 full_rebuild_interval: float = FULL_REBUILD_INTERVAL):
+        self._storage = storage
+        self._logger = logger
+        self._rebuild_delay = rebuild_delay
+        self._full_rebuild_interval = full_rebuild_interval
+        self._deals: dict[int, Deal] = {}
+        self._sorted: dict[str, list[Deal]] = {}
+        self._watermark = ""
+        self._last_full_rebuild: float | None = None
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.version = 0
+        # Версия начинается с нуля при каждом запуске, поэтому ETag включает время запуска
+        self._epoch = int(time.time())
+
+    @property
+    def etag(self) -> str:
+        return f'"{self._epoch}-{self.version}"'
+
+    def __len__(self) -> int:
+        return len(self._deals)
+
+    def get(self, app_id: int) -> Deal | None:
+        return self._deals.get(app_id)
+
+    def sorted_deals(self, sort: str) -> list[Deal]:
+        deals = self._sorted.get(sort)
+        if deals is None:
+            key, reverse = SORTS[sort]
+            deals = self._sorted[sort] = sorted(self._deals.values(), key=key, reverse=reverse)
+        return deals
+
+    async def start(self):
+        await self.rebuild(full=True)
+        self._storage.writer.add_commit_listener(self._changed.set)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            await asyncio.sleep(self._rebuild_delay)
+            self._changed.clear()
+            try:
+                await self.rebuild()
+            except Exception:
+                self._logger.exception("Failed to update deals snapshot")
+
+    async def _read(self, sql: str, params=()):
+        async with self._storage.read() as conn:
+            async with conn.execute(sql, params) as c:
+                while rows := await c.fetchmany(FETCH_CHUNK_SIZE):
+                    yield rows
+
+    async def rebuild(self, full: bool = False):
+        """
+        Дочитывает изменившиеся записи, а раз в full_rebuild_interval строит снимок заново
+        """
+        now = asyncio.get_running_loop().time()
+        if self._last_full_rebuild is None or now - self._last_full_rebuild >= self._full_rebuild_interval:
+            full = True
+
+        statuses = (PostStatus.PUBLISHED.value, PostStatus.PENDING_PUBLISH.value, PostStatus.BLOCKED.value)
+        changed = False
+        watermark = self._watermark
+        if full:
+            deals = {}
+            async for rows in self._read(SELECT_DEALS_SQL, statuses):
+                for row in rows:
+                    deals[row[0]] = Deal(*row)
+                    watermark = max(watermark, row[3])
+            changed = deals != self._deals
+            self._deals = deals
+            self._last_full_rebuild = now
+        else:
+            params = (*statuses, PostStatus.UNAVAILABLE.value, self._watermark)
+            async for rows in self._read(SELECT_CHANGED_DEALS_SQL, params):
+                for *columns, status in rows:
+                    deal = Deal(*columns)
+                    watermark = max(watermark, deal.updated_at)
+                    if deal.discount_percent > 0 and status != PostStatus.UNAVAILABLE.value:
+                        changed = changed or self._deals.get(deal.app_id) != deal
+                        self._deals[deal.app_id] = deal
+                    elif self._deals.pop(deal.app_id, None) is not None:
+                        changed = True
+
+        # Записи с тем же updated_at перечитываются в следующий раз: CURRENT_TIMESTAMP с точностью до секунды
+        self._watermark = watermark
+        if changed:
+            self._sorted.clear()
+            self.version += 1
+
+
+class QueryError(Exception):
+    pass
+
+
+def _int_param(query, name: str, default: int | None, minimum: int, maximum: int | None = None) -> int | None:
+    value = query.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an integer")
+    if number < minimum or (maximum is not None and number > maximum):
+        raise QueryError(f"{name} must be between {minimum} and {maximum}" if maximum is not None
+                         else f"{name} must be at least {minimum}")
+    return number
+
+
+def _price_param(query, name: str) -> float | None:
+    value = query.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise QueryError(f"{name} must be a number")
+
+
+class DealsApi:
+    """
+    Read-only HTTP API текущих скидок на том же event loop, что и бот:
+
+        GET /deals?min_discount=50&max_price=500&sort=discount&limit=50&offset=0
+        GET /deals/{app_id}
+
+    Отвечает из DealsSnapshot с ETag по версии снимка. Пока снимок не изменился,
+    запрос с If-None-Match получает 304, а повторный запрос - готовый ответ из кэша
+    """
+
+    def __init__(self, snapshot: DealsSnapshot, logger: logging.Logger):
+        self._snapshot = snapshot
+        self._logger = logger
+        self._responses: OrderedDict[tuple[int, str], bytes] = OrderedDict()
+        self._runner: web.AppRunner | None = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/deals", self.handle_deals)
+        app.router.add_get("/deals/{app_id:\\d+}", self.handle_deal)
+        return app
+
+    async def start(self, host: str, port: int):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._logger.info("Deals API is listening on %s:%s", host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _not_modified(self, request: web.Request) -> bool:
+        if_none_match = request.headers.get("If-None-Match", "")
+        return self._snapshot.etag in (tag.strip() for tag in if_none_match.split(","))
+
+    def _json_response(self, body: bytes) -> web.Response:
+        return web.Response(body=body, content_type="application/json", headers={"ETag": self._snapshot.etag})
+
+    async def handle_deals(self, request: web.Request) -> web.Response:
+        if self._not_modified(request):
+            return web.Response(status=304, headers={"ETag": self._snapshot.etag})
+
+        cache_key = (self._snapshot.version, request.query_string)
+        body = self._responses.get(cache_key)
+        if body is None:
+            try:
+                body = self._render_deals(request.query)
+            except QueryError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            self._responses[cache_key] = body
+            while len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        else:
+            self._responses.move_to_end(cache_key)
+
+        return self._json_response(body)
+
+    async def handle_deal(self, request: web.Request) -> web.Response:
+        if self._not_modified(request):
+            return web.Response(status=304, headers={"ETag": self._snapshot.etag})
+
+        deal = self._snapshot.get(int(request.match_info["app_id"]))
+        if deal is None:
+            return web.json_response({"error": "no current deal for this app"}, status=404)
+        return self._json_response(json.dumps(deal.to_json()).encode())
+
+    def _render_deals(self, query) -> bytes:
+        sort = query.get("sort", "discount")
+        if sort not in SORTS:
+            raise QueryError(f"sort must be one of {', '.join(SORTS)}")
+        min_discount = _int_param(query, "min_discount", 0, 0, 100)
+        min_price = _price_param(query, "min_price")
+        max_price = _price_param(query, "max_price")
+        limit = _int_param(query, "limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+        offset = _int_param(query, "offset", 0, 0)
+
+        # Перебор останавливается, как только набрана страница
+        page = []
+        matched = 0
+        for deal in self._snapshot.sorted_deals(sort):
+            if deal.discount_percent < min_discount:
+                # В сортировке по скидке дальше скидки только меньше
+                if sort == "discount":
+                    break
+                continue
+            if min_price is not None and deal.final_price < min_price:
+                continue
+            if max_price is not None and deal.final_price > max_price:
+                continue
+
+            matched += 1
+            if matched <= offset:
+                continue
+            if len(page) == limit:
+                break
+            page.append(deal.to_json())
+
+        has_more = matched > offset + len(page)
+        return json.dumps({
+            "version": self._snapshot.version,
+            "deals": page,
+            "next_offset": offset + len(page) if has_more else None,
+        }).encode()
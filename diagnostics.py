@@ -0,0 +1,172 @@
+import asyncio
+import cProfile
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+# Фазы, на которые раскладывается время запуска юзкейса
+STEAM_WAIT = "steam_wait"
+RATE_LIMIT_SLEEP = "rate_limit_sleep"
+JSON_PARSE = "json_parse"
+SQL = "sql"
+TELEGRAM_SEND = "telegram_send"
+
+PROFILES_DIR = "profiles"
+
+
+class LoopLagMonitor:
+    """
+    Следит за задержкой планирования event loop. Корутина каждые interval секунд
+    замеряет, насколько позже запланированного она проснулась. Отдельный поток следит
+    за тем, чтобы корутина вообще просыпалась, и если loop заблокирован дольше threshold,
+    логирует стек потока loop'а - то есть код, который его заблокировал
+    """
+
+    def __init__(self, logger: logging.Logger, threshold: float = 1.0, interval: float = 0.25):
+        self._logger = logger
+        self._threshold = threshold
+        self._interval = interval
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._watcher: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self.max_lag = 0.0
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._sample())
+        self._watcher = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watcher.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watcher is not None:
+            self._watcher.join()
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = loop.time() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self._threshold:
+                self._logger.warning("Event loop lag: the loop was blocked for %.3f seconds", lag)
+            self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        reported = False
+        while not self._stopped.wait(self._interval):
+            stalled = time.monotonic() - self._heartbeat
+            if stalled <= self._threshold + self._interval:
+                reported = False
+                continue
+            if reported:
+                continue
+
+            # Стек снимается, пока loop еще заблокирован
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._logger.warning("Event loop has been blocked for %.3f seconds. Stack of the loop thread:\n%s",
+                                 stalled, "".join(traceback.format_stack(frame)))
+            reported = True
+
+
+class JobProfile:
+    """
+    Время одного запуска юзкейса, разложенное по фазам. Одновременные блоки одной фазы
+    (например, запросы к Steam в asyncio.gather) засчитываются один раз: фаза идет,
+    пока открыт хоть один ее блок
+    """
+
+    def __init__(self, job_name: str):
+        self.job_name = job_name
+        self.phases: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.total = 0.0
+        self._active: dict[str, int] = {}
+        self._started: dict[str, float] = {}
+
+    def enter(self, phase_name: str):
+        active = self._active.get(phase_name, 0)
+        if active == 0:
+            self._started[phase_name] = time.perf_counter()
+        self._active[phase_name] = active + 1
+        self.counts[phase_name] = self.counts.get(phase_name, 0) + 1
+
+    def exit(self, phase_name: str):
+        self._active[phase_name] -= 1
+        if self._active[phase_name] == 0:
+            seconds = time.perf_counter() - self._started.pop(phase_name)
+            self.phases[phase_name] = self.phases.get(phase_name, 0.0) + seconds
+
+    def report(self) -> str:
+        lines = [f"Profile of {self.job_name}: total {self.total:.3f}s"]
+        for phase_name, seconds in sorted(self.phases.items(), key=lambda item: item[1], reverse=True):
+            share = seconds / self.total * 100 if self.total else 0.0
+            lines.append(f"  {phase_name:<18} {seconds:10.3f}s {share:6.1f}%  calls={self.counts[phase_name]}")
+        other = max(self.total - sum(self.phases.values()), 0.0)
+        lines.append(f"  {'other':<18} {other:10.3f}s")
+        return "\n".join(lines)
+
+
+_current_profile: ContextVar[JobProfile | None] = ContextVar("current_profile", default=None)
+
+
+@contextmanager
+def phase(phase_name: str):
+    """
+    Засчитывает время блока в фазу профиля текущего запуска. Без профиля ничего не делает
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    profile.enter(phase_name)
+    try:
+        yield
+    finally:
+        profile.exit(phase_name)
+
+
+@asynccontextmanager
+async def profile_job(job_name: str, logger: logging.Logger, output_dir: str = PROFILES_DIR):
+    """
+    Профилирует один запуск юзкейса: пишет cProfile в {output_dir}/{job_name}-{время}.prof,
+    рядом - разбивку по фазам в .txt, и логирует разбивку
+    """
+    profile = JobProfile(job_name)
+    token = _current_profile.set(profile)
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield profile
+    finally:
+        profiler.disable()
+        profile.total = time.perf_counter() - start
+        _current_profile.reset(token)
+
+        os.makedirs(output_dir, exist_ok=True)
+        file_stem = os.path.join(output_dir, f"{job_name}-{datetime.datetime.now():%Y%m%d-%H%M%S}")
+        profiler.dump_stats(f"{file_stem}.prof")
+        report = profile.report()
+        with open(f"{file_stem}.txt", "w") as f:
+            f.write(report + "\n")
+        logger.info("%s\nProfile is saved to %s.prof", report, file_stem)
@@ -0,0 +1,231 @@
+from random import Random
+
+from db import Storage
+
+# Размер бакета app_id, по которому копится статистика попаданий
+BUCKET_SIZE = 10_000
+# Живые app_id в основном кратны 10, статистика копится по остатку от деления на STRIDE
+STRIDE = 10
+# Пока проверено меньше app_id, модель не пропускает ни одного кандидата
+MIN_TRAINING_PROBES = 1_000
+# Сила априорного распределения бакета в числе проверок
+BUCKET_PRIOR_PROBES = 20
+# app_id с оценкой ниже SKIP_RATIO * средней вероятности попадания пропускаются
+SKIP_RATIO = 0.25
+# Доля пропускаемых app_id, которые все равно проверяются, чтобы модель не ослепла
+EXPLORE_RATE = 0.05
+# За один запуск discovery уходит не дальше, чем на MAX_SPAN_FACTOR * лимит запросов
+MAX_SPAN_FACTOR = 5
+# Пока в бакете проверено меньше app_id, его оценка опирается на соседей, и в нем ничего не пропускается
+MIN_BUCKET_PROBES = 200
+# Доля лимита запросов, которую запуск тратит на пропущенные раньше app_id
+BACKFILL_SHARE = 0.1
+
+BUCKET = "bucket"
+STRIDE_REMAINDER = "stride"
+
+SAVE_ID_SPACE_STATS_SQL = """
+INSERT INTO id_space_stats (kind, key, probes, hits) VALUES (?, ?, ?, ?)
+ON CONFLICT(kind, key) DO UPDATE SET
+    probes = probes + excluded.probes,
+    hits = hits + excluded.hits
+"""
+
+SAVE_SKIPPED_RANGE_SQL = """
+INSERT INTO id_skipped_ranges (first_id, last_id) VALUES (?, ?)
+ON CONFLICT(first_id) DO UPDATE SET last_id = excluded.last_id
+"""
+
+DELETE_SKIPPED_RANGE_SQL = "DELETE FROM id_skipped_ranges WHERE first_id = ?"
+
+
+class IdDensityModel:
+    """
+    Оценивает вероятность того, что app_id существует, по результатам прошлых запусков
+    find_steam_ids: по доле попаданий в бакете app_id и по остатку app_id от деления на STRIDE.
+    По оценке планирует, какие app_id следующего диапазона проверять, а какие пропустить.
+    Пропущенные app_id не теряются: они хранятся диапазонами app_id с шагом STRIDE внутри
+    одного бакета, и каждый запуск перепроверяет часть из них, начиная с диапазонов,
+    которые по текущей статистике вероятнее всего содержат игры
+    """
+
+    def __init__(self, stats: dict[tuple[str, int], list[int]] | None = None,
+                 skipped: dict[int, int] | None = None):
+        # (kind, key) -> [probes, hits]
+        self._stats = stats or {}
+        self._unsaved: dict[tuple[str, int], list[int]] = {}
+        # Пропущенные диапазоны: first_id -> last_id, и обратный индекс для склейки соседних диапазонов
+        self._skipped = skipped or {}
+        self._skipped_ends = {last_id: first_id for first_id, last_id in self._skipped.items()}
+        self._changed_ranges: set[int] = set()
+        # app_id, пропущенные последним plan(), которые еще не перенесены в диапазоны
+        self._planned_skips: list[int] = []
+
+    @classmethod
+    async def load(cls, storage: Storage) -> "IdDensityModel":
+        rows = await storage.fetchall("SELECT kind, key, probes, hits FROM id_space_stats")
+        ranges = await storage.fetchall("SELECT first_id, last_id FROM id_skipped_ranges")
+        return cls({(kind, key): [probes, hits] for kind, key, probes, hits in rows}, dict(ranges))
+
+    @property
+    def total_probes(self) -> int:
+        return sum(probes for (kind, _), (probes, _) in self._stats.items() if kind == STRIDE_REMAINDER)
+
+    def _rate(self, kind: str, key: int) -> tuple[int, int]:
+        probes, hits = self._stats.get((kind, key), (0, 0))
+        return probes, hits
+
+    def _global_rate(self) -> float:
+        probes = hits = 0
+        for (kind, _), (kind_probes, kind_hits) in self._stats.items():
+            if kind == STRIDE_REMAINDER:
+                probes += kind_probes
+                hits += kind_hits
+        return (hits + 1) / (probes + 2)
+
+    def _bucket_rate(self, bucket: int, global_rate: float) -> float:
+        probes, hits = self._rate(BUCKET, bucket)
+        if probes == 0:
+            # Discovery идет вперед, поэтому для нового бакета лучшая оценка - ближайший предыдущий
+            known = [key for kind, key in self._stats if kind == BUCKET and key < bucket]
+            if not known:
+                return global_rate
+            probes, hits = self._rate(BUCKET, max(known))
+        return (hits + global_rate * BUCKET_PRIOR_PROBES) / (probes + BUCKET_PRIOR_PROBES)
+
+    def hit_probability(self, app_id: int) -> float:
+        global_rate = self._global_rate()
+        probes, hits = self._rate(STRIDE_REMAINDER, app_id % STRIDE)
+        stride_lift = ((hits + 1) / (probes + 2)) / global_rate
+        return min(1.0, self._bucket_rate(app_id // BUCKET_SIZE, global_rate) * stride_lift)
+
+    def plan(self, start_value: int, request_limit: int, rnd: Random | None = None) -> tuple[list[int], int]:
+        """
+        Выбирает до request_limit app_id после start_value. Возвращает выбранные app_id
+        по возрастанию и последний рассмотренный app_id, до которого можно сдвинуть счетчик.
+        Пропущенные app_id попадают в диапазоны для перепроверки после skip_through()
+        """
+        if self.total_probes < MIN_TRAINING_PROBES:
+            return list(range(start_value + 1, start_value + request_limit + 1)), start_value + request_limit
+
+        rnd = rnd or Random()
+        threshold = SKIP_RATIO * self._global_rate()
+        # Оценка зависит только от бакета и остатка, поэтому считается один раз на пару
+        probabilities: dict[tuple[int, int], float] = {}
+
+        candidates = []
+        self._planned_skips = []
+        last_id = start_value
+        for app_id in range(start_value + 1, start_value + request_limit * MAX_SPAN_FACTOR + 1):
+            if len(candidates) == request_limit:
+                break
+            last_id = app_id
+
+            key = (app_id // BUCKET_SIZE, app_id % STRIDE)
+            probability = probabilities.get(key)
+            if probability is None:
+                if self._rate(BUCKET, key[0])[0] < MIN_BUCKET_PROBES:
+                    probability = 1.0
+                else:
+                    probability = self.hit_probability(app_id)
+                probabilities[key] = probability
+
+            if probability >= threshold:
+                candidates.append(app_id)
+                continue
+
+            # Случайно проверенный app_id все равно остается в диапазоне: так диапазоны
+            # не дробятся, а повторная проверка стоит EXPLORE_RATE лишних запросов
+            self._planned_skips.append(app_id)
+            if rnd.random() < EXPLORE_RATE:
+                candidates.append(app_id)
+
+        return candidates, last_id
+
+    def skip_through(self, last_checked_id: int):
+        """
+        Переносит в диапазоны для перепроверки пропущенные app_id до last_checked_id включительно.
+        Пропуски дальше него следующий запуск спланирует заново
+        """
+        count = 0
+        for app_id in self._planned_skips:
+            if app_id > last_checked_id:
+                break
+            count += 1
+
+            previous = app_id - STRIDE
+            first_id = self._skipped_ends.pop(previous, None)
+            if first_id is None or first_id // BUCKET_SIZE != app_id // BUCKET_SIZE:
+                if first_id is not None:
+                    self._skipped_ends[previous] = first_id
+                first_id = app_id
+            self._skipped[first_id] = app_id
+            self._skipped_ends[app_id] = first_id
+            self._changed_ranges.add(first_id)
+        del self._planned_skips[:count]
+
+    def plan_backfill(self, limit: int) -> list[int]:
+        """
+        Выбирает до limit пропущенных раньше app_id из диапазонов с самой высокой текущей оценкой
+        """
+        probabilities: dict[tuple[int, int], float] = {}
+
+        def probability(app_id: int) -> float:
+            key = (app_id // BUCKET_SIZE, app_id % STRIDE)
+            if key not in probabilities:
+                probabilities[key] = self.hit_probability(app_id)
+            return probabilities[key]
+
+        ranked = sorted(self._skipped.items(), key=lambda item: probability(item[0]), reverse=True)
+        candidates = []
+        for first_id, last_id in ranked:
+            if len(candidates) >= limit:
+                break
+            candidates.extend(range(first_id, last_id + 1, STRIDE)[:limit - len(candidates)])
+        return candidates
+
+    def backfilled(self, app_id: int):
+        """
+        Убирает перепроверенный app_id из начала его диапазона
+        """
+        last_id = self._skipped.pop(app_id, None)
+        if last_id is None:
+            return
+        self._changed_ranges.add(app_id)
+        if app_id + STRIDE <= last_id:
+            self._skipped[app_id + STRIDE] = last_id
+            self._skipped_ends[last_id] = app_id + STRIDE
+            self._changed_ranges.add(app_id + STRIDE)
+        else:
+            del self._skipped_ends[last_id]
+
+    @property
+    def skipped_count(self) -> int:
+        return sum((last_id - first_id) // STRIDE + 1 for first_id, last_id in self._skipped.items())
+
+    def record(self, app_id: int, hit: bool):
+        for key in ((BUCKET, app_id // BUCKET_SIZE), (STRIDE_REMAINDER, app_id % STRIDE)):
+            for stats in (self._stats, self._unsaved):
+                counters = stats.setdefault(key, [0, 0])
+                counters[0] += 1
+                counters[1] += int(hit)
+
+    def take_unsaved(self) -> list[tuple[str, int, int, int]]:
+        """
+        Отдает накопленные с прошлого сохранения проверки для SAVE_ID_SPACE_STATS_SQL
+        """
+        rows = [(kind, key, probes, hits) for (kind, key), (probes, hits) in self._unsaved.items()]
+        self._unsaved.clear()
+        return rows
+
+    def take_range_changes(self) -> list[tuple[str, tuple]]:
+        """
+        Отдает выражения, которые сохраняют изменившиеся с прошлого раза диапазоны пропущенных app_id
+        """
+        statements = [
+            (SAVE_SKIPPED_RANGE_SQL, (first_id, self._skipped[first_id])) if first_id in self._skipped
+            else (DELETE_SKIPPED_RANGE_SQL, (first_id, ))
+            for first_id in sorted(self._changed_ranges)
+        ]
+        self._changed_ranges.clear()
+        return statements
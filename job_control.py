@@ -0,0 +1,53 @@
+import asyncio
+
+
+class JobControl:
+    """
+    Дедлайн и отмена для одного запуска юзкейса. Юзкейс проверяет should_stop() в цикле
+    запросов и спит через sleep(), поэтому не выходит за пределы своего временного окна
+    """
+
+    def __init__(self, deadline: float | None = None):
+        # Дедлайн в единицах loop.time(), None - без ограничения по времени
+        self.deadline = deadline
+        self._cancelled = asyncio.Event()
+
+    @classmethod
+    def until(cls, seconds: float) -> "JobControl":
+        return cls(asyncio.get_running_loop().time() + seconds)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def time_left(self) -> float | None:
+        if self.deadline is None:
+            return None
+        return self.deadline - asyncio.get_running_loop().time()
+
+    def should_stop(self) -> bool:
+        if self.cancelled:
+            return True
+        time_left = self.time_left()
+        return time_left is not None and time_left <= 0
+
+    async def sleep(self, seconds: float) -> bool:
+        """
+        Спит seconds секунд. Возвращает False без ожидания, если пауза не успевает
+        закончиться до дедлайна, и False сразу после отмены во время паузы
+        """
+        if self.should_stop():
+            return False
+
+        time_left = self.time_left()
+        if time_left is not None and time_left < seconds:
+            return False
+
+        try:
+            await asyncio.wait_for(self._cancelled.wait(), seconds)
+        except asyncio.TimeoutError:
+            return True
+        return False
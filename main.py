@@ -1,16 +1,21 @@
 import asyncio
-import datetime
 import logging
 import os
-from zoneinfo import ZoneInfo
+import signal
 
 from aiogram import Bot
 from dotenv import load_dotenv
 from steam_web_api import Steam
 
 import db
+import diagnostics
 import usecases
-from db import init_db
+from deals_api import DealsApi, DealsSnapshot
+from db import close_db, init_db
+from rules import PublishRules
+from scheduler import Scheduler
+from steam_client import coalescer_for
+from translation import load_translator
 
 load_dotenv()
 
@@ -24,48 +29,106 @@ CHAT_ID = int(os.getenv("CHAT_ID"))
 STEAM_API_KEY = os.getenv("STEAM_API_KEY")
 STEAM_API = Steam(STEAM_API_KEY)
 
-logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-logger = logging.getLogger(__name__)
-
-
-MSK = ZoneInfo("Europe/Moscow")
-def now_msk_time():
-    return datetime.datetime.now(tz=MSK).time()
-
-
+# single - один пост на игру, digest - один альбом со списком игр с самыми большими скидками
+PUBLISH_MODE = os.getenv("PUBLISH_MODE", "single")
+DIGEST_SIZE = int(os.getenv("DIGEST_SIZE", "10"))
 
-async def dispatch_tasks():
-    while True:
-        now = now_msk_time()
+# Задержка event loop в секундах, после которой логируется стек заблокировавшего его кода. 0 - не следить
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "1.0"))
+# PROFILE_NEXT_JOB=1 профилирует первый запуск юзкейса. Во время работы то же самое включает сигнал SIGUSR1
+PROFILE_NEXT_JOB = os.getenv("PROFILE_NEXT_JOB") == "1"
 
-        if datetime.time(18, 0) <= now or now < datetime.time(2, 0):
+# Сколько app_id проверяет один запуск поиска игр и сколько записей - один запуск обновления цен
+STEAM_REQUEST_LIMIT = int(os.getenv("STEAM_REQUEST_LIMIT", "200"))
+UPDATE_LIMIT = int(os.getenv("UPDATE_LIMIT", "100"))
 
-            # С 18:00 до 2:00 по мск ищет id игр из Steam
-            STEAM_REQUEST_LIMIT = 200
-            await usecases.find_steam_ids(db.db, STEAM_API, STEAM_REQUEST_LIMIT, logger)
+# Локальный переводчик описаний игр: argos или "модуль:фабрика". Пусто - описания публикуются на английском
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "")
+# Сколько описаний ближайших постов переводится за один запуск
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "20"))
 
-        elif datetime.time(2, 0) <= now < datetime.time(8, 0):
+# JSON файл с правилами публикации и обновления цен (см. rules.PublishRules). Пусто - публикуются все записи
+RULES_FILE = os.getenv("RULES_FILE", "")
 
-            # С 2:00 до 8:00 по мск обновляет данные о скидках и ценах игр стим
-            UPDATE_LIMIT = 100
-            await usecases.update_steam_game_price_and_discount(db.db, STEAM_API, UPDATE_LIMIT, logger)
+# Профиль настроек SQLite из db.PERFORMANCE_PROFILES
+DB_PROFILE = os.getenv("DB_PROFILE", db.DEFAULT_PROFILE)
+# Обслуживание базы запускается в простое между юзкейсами не чаще, чем раз в MAINTENANCE_INTERVAL секунд
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", str(6 * 3600)))
+# Через сколько дней опубликованная запись без изменений переносится в архив. 0 - не архивировать
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
 
-        elif datetime.time(8, 0) <= now < datetime.time(18, 0):
+# Порт read-only HTTP API текущих скидок (см. deals_api). Пусто - API выключен
+DEALS_API_PORT = os.getenv("DEALS_API_PORT", "")
+DEALS_API_HOST = os.getenv("DEALS_API_HOST", "127.0.0.1")
 
-            # С 8:00 до 18:00 отправляет посты о распродажал и скидках на игры из steam
-            await usecases.publish_steam_post(db.db, STEAM_API, BOT, CHAT_ID, logger)
-
-        await asyncio.sleep(30)
+logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+logger = logging.getLogger(__name__)
 
 
 async def main():
-    await init_db()
-
-    await dispatch_tasks()
+    await init_db(DB_PROFILE)
+    rules = PublishRules.load(RULES_FILE) if RULES_FILE else None
+    # Правила могли измениться с прошлого запуска
+    await usecases.apply_publish_rules(db.storage, logger, rules)
+
+    lag_monitor = None
+    if LOOP_LAG_THRESHOLD > 0:
+        lag_monitor = diagnostics.LoopLagMonitor(logger, LOOP_LAG_THRESHOLD)
+        lag_monitor.start()
+
+    scheduler = Scheduler(
+        db.storage, STEAM_API, BOT, CHAT_ID, logger,
+        publish_mode=PUBLISH_MODE, digest_size=DIGEST_SIZE,
+        steam_request_limit=STEAM_REQUEST_LIMIT, update_limit=UPDATE_LIMIT,
+        maintenance_interval=MAINTENANCE_INTERVAL, archive_after_days=ARCHIVE_AFTER_DAYS,
+        translator=load_translator(TRANSLATION_BACKEND), translation_batch_size=TRANSLATION_BATCH_SIZE,
+        rules=rules
+    )
+    scheduler.profile_next_job = PROFILE_NEXT_JOB
+
+    loop = asyncio.get_running_loop()
+    if hasattr(signal, "SIGUSR1"):
+        loop.add_signal_handler(signal.SIGUSR1, scheduler.request_job_profile)
+
+    main_task = asyncio.current_task()
+
+    def request_shutdown(signal_name: str):
+        if scheduler.stopping:
+            # Повторный сигнал - выход без ожидания текущего юзкейса. Очередь записи все равно дописывается
+            logger.warning("%s received again. Exiting without waiting for the current job", signal_name)
+            main_task.cancel()
+            return
+        logger.info("%s received. Finishing the current job before shutdown", signal_name)
+        scheduler.stop()
+
+    for shutdown_signal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(shutdown_signal, request_shutdown, shutdown_signal.name)
+
+    deals_snapshot = deals_api = None
+    if DEALS_API_PORT:
+        deals_snapshot = DealsSnapshot(db.storage, logger)
+        await deals_snapshot.start()
+        deals_api = DealsApi(deals_snapshot, logger)
+        await deals_api.start(DEALS_API_HOST, int(DEALS_API_PORT))
+
+    try:
+        await scheduler.run()
+        # Юзкейс сохранил прогресс и вышел. Запросы к Steam, которые еще в пути, дожидаются здесь
+        await coalescer_for(STEAM_API).drain()
+    finally:
+        if deals_api is not None:
+            await deals_api.stop()
+            await deals_snapshot.stop()
+        if lag_monitor is not None:
+            await lag_monitor.stop()
+        # Дописывает очередь записи и закрывает соединения. Последнее закрытое соединение сбрасывает WAL в базу
+        await close_db()
+        await BOT.session.close()
+        logger.info("Shutdown complete")
 
 if __name__ == '__main__':
     asyncio.run(main())
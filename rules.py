@@ -0,0 +1,86 @@
+import json
+
+from pydantic import BaseModel, Field
+
+# Через сколько дней опубликованная игра проверяется снова, если правило не задает свой срок
+DEFAULT_REFRESH_AFTER_DAYS = 30
+
+
+class PriceBandRule(BaseModel):
+    """
+    Правило для игр с ценой без скидки в [min_price, max_price) рублей: минимальная скидка
+    для публикации и через сколько дней после последней проверки игра проверяется снова
+    """
+    min_price: float = Field(0, ge=0)
+    max_price: float | None = Field(None, gt=0)
+    min_discount: int = Field(0, ge=0, le=100)
+    cooldown_days: int | None = Field(None, ge=0)
+
+    def price_predicate(self) -> str:
+        predicate = f"init_price >= {float(self.min_price)!r}"
+        if self.max_price is not None:
+            predicate += f" AND init_price < {float(self.max_price)!r}"
+        return predicate
+
+
+class PublishRules(BaseModel):
+    """
+    Какие записи steam_apps_info публикуются и проверяются при обновлении цен. Правила
+    компилируются в SQL условия, поэтому запросы к Steam и Telegram делаются только для записей,
+    из которых может получиться пост. Если price_bands заданы, игры с ценой вне всех диапазонов
+    не публикуются и не обновляются. Значения в условия подставляются после валидации как числа
+    """
+    min_discount: int = Field(0, ge=0, le=100)
+    price_bands: list[PriceBandRule] = []
+    excluded_apps: list[int] = []
+    refresh_after_days: int = Field(DEFAULT_REFRESH_AFTER_DAYS, ge=0)
+
+    @classmethod
+    def load(cls, path: str) -> "PublishRules":
+        with open(path, "r") as f:
+            return cls.model_validate(json.load(f))
+
+    def _excluded_predicate(self) -> str | None:
+        if not self.excluded_apps:
+            return None
+        return f"app_id NOT IN ({', '.join(str(int(app_id)) for app_id in sorted(set(self.excluded_apps)))})"
+
+    def _cooldown(self, band: PriceBandRule) -> int:
+        return self.refresh_after_days if band.cooldown_days is None else band.cooldown_days
+
+    def publish_predicate(self) -> str:
+        """
+        Условие на запись, которую можно публиковать
+        """
+        predicates = []
+        if self.min_discount > 0:
+            predicates.append(f"discount_percent >= {int(self.min_discount)}")
+        excluded = self._excluded_predicate()
+        if excluded:
+            predicates.append(excluded)
+        if self.price_bands:
+            predicates.append("(" + " OR ".join(
+                f"({band.price_predicate()} AND discount_percent >= {int(band.min_discount)})"
+                for band in self.price_bands
+            ) + ")")
+        return " AND ".join(predicates) or "1"
+
+    def refresh_predicate(self) -> str:
+        """
+        Условие на запись, которую пора проверить: срок с последней проверки (checked_at) прошел
+        по правилу ее диапазона цен, даже если при прошлой проверке ничего не изменилось.
+        Первое условие - граница по самому короткому сроку, по ней выборка идет диапазоном
+        индекса (status, checked_at)
+        """
+        cooldowns = [self._cooldown(band) for band in self.price_bands] or [self.refresh_after_days]
+        predicates = [f"checked_at <= datetime('now', '-{min(cooldowns)} days')"]
+        excluded = self._excluded_predicate()
+        if excluded:
+            predicates.append(excluded)
+        if self.price_bands:
+            # Для цены вне всех диапазонов CASE дает NULL, и запись не выбирается
+            predicates.append("checked_at <= CASE " + " ".join(
+                f"WHEN {band.price_predicate()} THEN datetime('now', '-{self._cooldown(band)} days')"
+                for band in self.price_bands
+            ) + " END")
+        return " AND ".join(predicates)
@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+import logging
+from typing import Callable
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from steam_web_api import Steam
+
+import diagnostics
+import usecases
+from db import Storage
+from job_control import JobControl
+from rules import PublishRules
+from translation import Translator
+
+MSK = ZoneInfo("Europe/Moscow")
+
+# Окна расписания по мск
+DISCOVERY = "discovery"
+REFRESH = "refresh"
+PUBLISH = "publish"
+
+# С 18:00 до 2:00 ищет id игр, с 2:00 до 8:00 обновляет цены и скидки, с 8:00 до 18:00 публикует посты
+WINDOW_ENDS = {
+    DISCOVERY: datetime.time(2, 0),
+    REFRESH: datetime.time(8, 0),
+    PUBLISH: datetime.time(18, 0),
+}
+
+# Как часто в секундах расписание проверяет, не пора ли запустить юзкейс
+POLL_INTERVAL = 30
+
+
+def now_msk() -> datetime.datetime:
+    return datetime.datetime.now(tz=MSK)
+
+
+def window_at(now: datetime.time) -> str:
+    if datetime.time(18, 0) <= now or now < datetime.time(2, 0):
+        return DISCOVERY
+    if datetime.time(2, 0) <= now < datetime.time(8, 0):
+        return REFRESH
+    return PUBLISH
+
+
+def seconds_until_msk(end: datetime.time, now: datetime.datetime) -> float:
+    """
+    Сколько секунд осталось от now до ближайшего наступления времени end по мск
+    """
+    now = now.astimezone(MSK)
+    end_datetime = datetime.datetime.combine(now.date(), end, tzinfo=MSK)
+    if end_datetime <= now:
+        end_datetime += datetime.timedelta(days=1)
+    return (end_datetime - now).total_seconds()
+
+
+class Scheduler:
+    """
+    Расписание бота: по времени мск запускает юзкейс текущего окна с дедлайном в конце окна,
+    а в простое между юзкейсами обслуживает базу. Время берется из clock, поэтому то же
+    расписание можно прогнать на виртуальных часах (см. simulation.py)
+    """
+
+    def __init__(
+            self, storage: Storage, steam: Steam, bot: Bot, chat_id: int, logger: logging.Logger,
+            publish_mode: str = "single", digest_size: int = 10,
+            steam_request_limit: int = 200, update_limit: int = 100,
+            maintenance_interval: int = 6 * 3600, archive_after_days: int = 365,
+            counter_path: str = "counter.txt", translator: Translator | None = None,
+            translation_batch_size: int = 20, rules: PublishRules | None = None, clock: Callable[[], datetime.datetime] = now_msk
+            ):
+        self.storage = storage
+        self.steam = steam
+        self.bot = bot
+        self.chat_id = chat_id
+        self.logger = logger
+        # single - один пост на игру, digest - один альбом со списком игр с самыми большими скидками
+        self.publish_mode = publish_mode
+        self.digest_size = digest_size
+        self.steam_request_limit = steam_request_limit
+        self.update_limit = update_limit
+        self.maintenance_interval = maintenance_interval
+        self.archive_after_days = archive_after_days
+        self.counter_path = counter_path
+        # Без переводчика посты публикуются с описанием на английском
+        self.translator = translator
+        self.translation_batch_size = translation_batch_size
+        # Какие записи публикуются и как часто обновляются. None - все записи, обновление раз в 30 дней
+        self.rules = rules
+        self.clock = clock
+        self.profile_next_job = False
+        self._last_maintenance_at: float | None = None
+        self._control: JobControl | None = None
+        self._stopping = asyncio.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def stop(self):
+        """
+        Просит расписание остановиться: текущий юзкейс получает отмену, дожидается уже отправленных
+        запросов к Steam, сохраняет прогресс и завершается, после чего run() возвращается.
+        Синхронный, поэтому подходит как обработчик сигнала
+        """
+        self._stopping.set()
+        if self._control is not None:
+            self._control.cancel()
+
+    def seconds_until(self, end: datetime.time) -> float:
+        return seconds_until_msk(end, self.clock())
+
+    def request_job_profile(self):
+        self.profile_next_job = True
+        self.logger.info("Next job run will be profiled")
+
+    async def run_job(self, job_name: str, job):
+        """
+        Запускает юзкейс, а если запрошено профилирование - под профилировщиком
+        """
+        if not self.profile_next_job:
+            await job
+            return
+
+        self.profile_next_job = False
+        async with diagnostics.profile_job(job_name, self.logger):
+            await job
+
+    async def maintain_db_if_due(self):
+        """
+        Обслуживает базу, если с прошлого обслуживания прошло больше maintenance_interval
+        """
+        if self.stopping:
+            return
+
+        now = asyncio.get_running_loop().time()
+        if self._last_maintenance_at is not None and now - self._last_maintenance_at < self.maintenance_interval:
+            return
+
+        self._last_maintenance_at = now
+        # Не через run_job: запрошенный профиль относится к следующему запуску юзкейса, а не к обслуживанию
+        await usecases.maintain_db(self.storage, self.logger, self.archive_after_days)
+
+    async def run_once(self):
+        """
+        Запускает юзкейс текущего окна, затем обслуживание базы, если оно назрело
+        """
+        window = window_at(self.clock().astimezone(MSK).time())
+        control = self._control = JobControl.until(self.seconds_until(WINDOW_ENDS[window]))
+        if self.stopping:
+            return
+
+        try:
+            await self._run_window(window, control)
+        finally:
+            self._control = None
+
+        await self.maintain_db_if_due()
+
+    async def _run_window(self, window: str, control: JobControl):
+        if window == DISCOVERY:
+            await self.run_job("find_steam_ids", usecases.find_steam_ids(
+                self.storage, self.steam, self.steam_request_limit, self.logger,
+                control=control, counter_path=self.counter_path, rules=self.rules
+            ))
+        elif window == REFRESH:
+            await self.run_job("update_steam_game_price_and_discount", usecases.update_steam_game_price_and_discount(
+                self.storage, self.steam, self.update_limit, self.logger, control=control, rules=self.rules
+            ))
+            # Описания переводятся до окна публикации. В дайджесте описаний нет
+            if self.translator is not None and self.publish_mode != "digest":
+                await self.run_job("translate_upcoming_descriptions", usecases.translate_upcoming_descriptions(
+                    self.storage, self.steam, self.translator, self.logger,
+                    self.translation_batch_size, control=control, rules=self.rules
+                ))
+        elif self.publish_mode == "digest":
+            await self.run_job("publish_steam_digest", usecases.publish_steam_digest(
+                self.storage, self.steam, self.bot, self.chat_id, self.logger, self.digest_size,
+                control=control, rules=self.rules, clock=self.clock
+            ))
+        else:
+            await self.run_job("publish_steam_post", usecases.publish_steam_post(
+                self.storage, self.steam, self.bot, self.chat_id, self.logger, control=control, rules=self.rules,
+                clock=self.clock
+            ))
+
+    async def run(self):
+        """
+        Запускает юзкейсы по расписанию, пока не вызван stop()
+        """
+        while not self.stopping:
+            await self.run_once()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,444 @@
+"""
+Симуляция расписания бота на виртуальных часах:
+
+    python simulation.py --days 7 --steam-request-limit 200 --update-limit 100
+
+Прогоняет Scheduler и все юзкейсы против фейковых Steam и Telegram на временной базе.
+Event loop живет на виртуальном времени: когда ему нечего делать до ближайшего таймера,
+часы сразу перескакивают к таймеру, поэтому паузы из-за лимита, паузы между постами
+и опрос расписания не занимают реального времени, и сутки проходят за секунды.
+Печатает расход запросов Steam по окнам расписания, рост очереди на публикацию по дням
+и задержку публикации - от попадания игры в очередь до поста
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import re
+import selectors
+import statistics
+import sys
+import tempfile
+import time
+from random import Random
+from typing import NamedTuple
+
+import aiosqlite
+
+import bench_queries
+import usecases
+from db import Storage, create_schema
+from rules import PublishRules
+from scheduler import DISCOVERY, MSK, POLL_INTERVAL, PUBLISH, REFRESH, WINDOW_ENDS, Scheduler, window_at
+from steam_client import SteamCoalescer, register_coalescer
+
+# Лимит appdetails в Steam: около 200 запросов за 5 минут
+STEAM_RATE_LIMIT = 200
+STEAM_RATE_PERIOD = 300
+
+# Доля игр со скидкой на неделе и сколько скриншотов у фейковой игры
+SALE_SHARE = 0.25
+SCREENSHOTS_COUNT = 4
+
+DAY = 24 * 3600
+WINDOWS = (DISCOVERY, REFRESH, PUBLISH)
+
+APP_URL_PATTERN = re.compile(r"store\.steampowered\.com/app/(\d+)")
+
+
+class _VirtualTimeSelector(selectors.BaseSelector):
+    """
+    Настоящий селектор, который вместо ожидания таймера сдвигает виртуальные часы loop'а.
+    Ответы потоков aiosqlite приходят через self-pipe и забираются без сдвига часов
+    """
+
+    def __init__(self, loop: "VirtualClockLoop"):
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+    def select(self, timeout=None):
+        # Таймеров нет - loop ждет потоки по-настоящему
+        if timeout is None:
+            return self._selector.select(None)
+
+        events = self._selector.select(0)
+        if not events and timeout > 0:
+            self._loop.advance(timeout)
+        return events
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop, у которого loop.time() - виртуальные секунды от начала симуляции
+    """
+
+    def __init__(self):
+        self._virtual_time = 0.0
+        super().__init__(_VirtualTimeSelector(self))
+
+    def time(self) -> float:
+        return self._virtual_time
+
+    def advance(self, seconds: float):
+        self._virtual_time += seconds
+
+
+class SimulationSettings(NamedTuple):
+    days: float = 7
+    # Начало симуляции по мск. По умолчанию - ближайшие 18:00, начало окна поиска игр
+    start: datetime.datetime | None = None
+    # Сколько игр уже есть в базе и сколько еще не найденных игр есть в Steam после них
+    catalog: int = 20_000
+    new_games: int = 20_000
+    seed: int = 0
+    steam_request_limit: int = 200
+    update_limit: int = 100
+    publish_mode: str = "single"
+    digest_size: int = 10
+    rate_limit: int = STEAM_RATE_LIMIT
+    rate_period: int = STEAM_RATE_PERIOD
+    rules: PublishRules | None = None
+
+
+class SimulationStats:
+    """
+    Метрики симуляции. Запросы Steam относятся к окну расписания, в котором они ушли.
+    Очередь на публикацию - записи PENDING_PUBLISH, она замеряется после каждого запуска юзкейса
+    """
+
+    def __init__(self, settings: SimulationSettings, start: datetime.datetime):
+        self.settings = settings
+        self.start = start
+        self.days = max(1, int(-(-settings.days // 1)))
+        self.requests = dict.fromkeys(WINDOWS, 0)
+        self.rate_limited = dict.fromkeys(WINDOWS, 0)
+        self.runs = dict.fromkeys(WINDOWS, 0)
+        self.job_seconds = dict.fromkeys(WINDOWS, 0.0)
+        self.initial_backlog = 0
+        self.backlog = [0] * self.days
+        self.entered_backlog = [0] * self.days
+        self.published = [0] * self.days
+        self.latencies: list[float] = []
+        # Виртуальное время каждой отправки в Telegram
+        self.send_times: list[float] = []
+        self.real_seconds = 0.0
+        # app_id -> виртуальное время попадания в очередь. None - игра была в очереди до начала симуляции
+        self._pending_since: dict[int, float | None] = {}
+
+    @staticmethod
+    def now() -> float:
+        return asyncio.get_running_loop().time()
+
+    def clock(self) -> datetime.datetime:
+        return self.start + datetime.timedelta(seconds=self.now())
+
+    def window(self) -> str:
+        return window_at(self.clock().time())
+
+    def day(self) -> int:
+        return min(int(self.now() // DAY), self.days - 1)
+
+    def record_request(self, limited: bool):
+        window = self.window()
+        self.requests[window] += 1
+        if limited:
+            self.rate_limited[window] += 1
+
+    def record_run(self, window: str, seconds: float):
+        self.runs[window] += 1
+        self.job_seconds[window] += seconds
+
+    def record_send(self):
+        self.send_times.append(self.now())
+
+    def record_publish(self, app_id: int):
+        self.published[self.day()] += 1
+        pending_since = self._pending_since.pop(app_id, None)
+        if pending_since is not None:
+            self.latencies.append(self.now() - pending_since)
+
+    async def sample_backlog(self, storage: Storage, initial: bool = False):
+        rows = await storage.fetchall(
+            "SELECT app_id FROM steam_apps_info WHERE status = ?", (usecases.PostStatus.PENDING_PUBLISH.value, )
+        )
+        pending = {app_id for app_id, in rows}
+        now = self.now()
+        for app_id in pending - self._pending_since.keys():
+            self._pending_since[app_id] = None if initial else now
+            if not initial:
+                self.entered_backlog[self.day()] += 1
+        for app_id in self._pending_since.keys() - pending:
+            del self._pending_since[app_id]
+
+        if initial:
+            self.initial_backlog = len(pending)
+        else:
+            self.backlog[self.day()] = len(pending)
+
+    def report(self) -> str:
+        settings = self.settings
+        lines = [
+            f"Simulated {settings.days:g} days from {self.start:%Y-%m-%d %H:%M} MSK in {self.real_seconds:.1f}s "
+            f"(steam_request_limit={settings.steam_request_limit}, update_limit={settings.update_limit}, "
+            f"publish_mode={settings.publish_mode}, rate limit {settings.rate_limit}/{settings.rate_period}s)",
+            "",
+            f"{'window':<10} {'runs':>6} {'job hours':>10} {'requests':>10} {'limited':>9} {'budget use':>11}",
+        ]
+        for window in WINDOWS:
+            capacity = self._window_capacity(window)
+            sent = self.requests[window] - self.rate_limited[window]
+            lines.append(
+                f"{window:<10} {self.runs[window]:>6} {self.job_seconds[window] / 3600:>10.1f} "
+                f"{self.requests[window]:>10} {self.rate_limited[window]:>9} "
+                f"{(sent / capacity * 100 if capacity else 0.0):>10.1f}%"
+            )
+
+        lines += ["", f"{'day':<4} {'date':<11} {'entered':>8} {'published':>10} {'backlog':>8}",
+                  f"{'-':<4} {'start':<11} {'':>8} {'':>10} {self.initial_backlog:>8}"]
+        for day in range(self.days):
+            date = self.start + datetime.timedelta(days=day)
+            lines.append(f"{day + 1:<4} {date:%Y-%m-%d}  {self.entered_backlog[day]:>8} "
+                         f"{self.published[day]:>10} {self.backlog[day]:>8}")
+
+        lines.append("")
+        if len(self.send_times) > 1:
+            gaps = [later - earlier for earlier, later in zip(self.send_times, self.send_times[1:])]
+            lines.append(f"{len(self.send_times)} Telegram sends, shortest gap between sends {min(gaps) / 60:.0f} min")
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            lines.append(f"Publish latency of {len(latencies)} games: median {statistics.median(latencies) / 3600:.1f}h, "
+                         f"p95 {p95 / 3600:.1f}h, max {latencies[-1] / 3600:.1f}h")
+        else:
+            lines.append("No game entered the backlog and got published during the simulation")
+        return "\n".join(lines)
+
+    def _window_capacity(self, window: str) -> float:
+        """
+        Сколько запросов Steam пропустил бы в окне за всю симуляцию
+        """
+        step = 60
+        seconds = sum(
+            step for offset in range(0, int(self.settings.days * DAY), step)
+            if window_at((self.start + datetime.timedelta(seconds=offset)).time()) == window
+        )
+        return seconds / self.settings.rate_period * self.settings.rate_limit
+
+
+class FakeSteam:
+    """
+    Steam с детерминированным каталогом: app_id -> цена в рублях. Скидки меняются раз в неделю.
+    Сверх rate_limit запросов за rate_period секунд отвечает None, как steam_web_api при превышении лимита
+    """
+
+    def __init__(self, catalog: dict[int, float], stats: SimulationStats, seed: int,
+                 rate_limit: int = STEAM_RATE_LIMIT, rate_period: int = STEAM_RATE_PERIOD):
+        self.apps = self
+        self._catalog = catalog
+        self._stats = stats
+        self._seed = seed
+        self._rate_limit = rate_limit
+        self._rate_period = rate_period
+        self._period = -1
+        self._period_requests = 0
+
+    def _discount(self, app_id: int) -> int:
+        week = int(self._stats.now() // (7 * DAY))
+        rnd = Random(f"{self._seed}:{app_id}:{week}")
+        return rnd.choice(bench_queries.DISCOUNTS) if rnd.random() < SALE_SHARE else 0
+
+    def get_app_details(self, app_id: int, country: str = "US", filters: str = "basic") -> dict | None:
+        period = int(self._stats.now() // self._rate_period)
+        if period != self._period:
+            self._period = period
+            self._period_requests = 0
+        self._period_requests += 1
+        limited = self._period_requests > self._rate_limit
+        self._stats.record_request(limited)
+        if limited:
+            return None
+
+        price = self._catalog.get(app_id)
+        if price is None:
+            return {str(app_id): {"success": False}}
+
+        data = {}
+        names = set(filters.split(","))
+        if "price_overview" in names:
+            initial = int(price * 100)
+            discount = self._discount(app_id)
+            data["price_overview"] = {
+                "currency": "RUB", "initial": initial,
+                "final": initial * (100 - discount) // 100, "discount_percent": discount,
+            }
+        if "basic" in names:
+            data["name"] = f"Game {app_id}"
+            data["short_description"] = f"Description of game {app_id}"
+            data["header_image"] = f"https://example.com/{app_id}/header.jpg"
+        if "screenshots" in names:
+            data["screenshots"] = [
+                {"id": number, "path_full": f"https://example.com/{app_id}/{number}.jpg"}
+                for number in range(SCREENSHOTS_COUNT)
+            ]
+        if "developers" in names:
+            data["developers"] = [f"Studio {app_id % 97}"]
+        return {str(app_id): {"success": True, "data": data}}
+
+
+class FakeBot:
+    """
+    Telegram бот, который вместо отправки записывает опубликованные app_id по ссылкам в подписи
+    """
+
+    def __init__(self, stats: SimulationStats):
+        self._stats = stats
+        self.messages = 0
+
+    def _record(self, caption: str | None):
+        self.messages += 1
+        self._stats.record_send()
+        for app_id in APP_URL_PATTERN.findall(caption or ""):
+            self._stats.record_publish(int(app_id))
+
+    async def send_media_group(self, chat_id: int, media: list):
+        self._record(media[0].caption)
+
+    async def send_photo(self, chat_id: int, photo: str, caption: str | None = None, parse_mode: str | None = None):
+        self._record(caption)
+
+
+class SimulatedScheduler(Scheduler):
+    """
+    Scheduler, который записывает запуски юзкейсов в статистику и не дает им выйти за конец симуляции
+    """
+
+    def __init__(self, *args, stats: SimulationStats, end: float, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats = stats
+        self._end = end
+
+    def seconds_until(self, end: datetime.time) -> float:
+        return min(super().seconds_until(end), self._end - asyncio.get_running_loop().time())
+
+    async def run_job(self, job_name: str, job):
+        window = self._stats.window()
+        start = self._stats.now()
+        await super().run_job(job_name, job)
+        self._stats.record_run(window, self._stats.now() - start)
+
+
+def default_start() -> datetime.datetime:
+    now = datetime.datetime.now(tz=MSK)
+    start = datetime.datetime.combine(now.date(), WINDOW_ENDS[PUBLISH], tzinfo=MSK)
+    return start if start > now else start + datetime.timedelta(days=1)
+
+
+async def simulate(settings: SimulationSettings, work_dir: str, logger: logging.Logger) -> SimulationStats:
+    stats = SimulationStats(settings, settings.start or default_start())
+
+    # Каталог Steam - продолжение синтетического каталога, которым заполняется база
+    catalog = {
+        app_id: price
+        for app_id, _, price, *_ in bench_queries.synthetic_rows(settings.catalog + settings.new_games, settings.seed)
+    }
+    db_path = os.path.join(work_dir, "simulation.db")
+    conn = await aiosqlite.connect(db_path)
+    await conn.execute("PRAGMA journal_mode=WAL;")
+    await create_schema(conn)
+    max_app_id = await bench_queries.fill_catalog(conn, settings.catalog, settings.seed)
+    await conn.close()
+
+    counter_path = os.path.join(work_dir, "counter.txt")
+    with open(counter_path, "w") as f:
+        f.write(str(max_app_id))
+
+    steam = FakeSteam(catalog, stats, settings.seed, settings.rate_limit, settings.rate_period)
+    # Фейковый Steam отвечает сразу, поток для запроса не нужен
+    register_coalescer(steam, SteamCoalescer(steam, offload=False))
+
+    storage = await Storage.open(db_path)
+    await usecases.apply_publish_rules(storage, logger, settings.rules)
+    end = settings.days * DAY
+    scheduler = SimulatedScheduler(
+        storage, steam, FakeBot(stats), 0, logger,
+        publish_mode=settings.publish_mode, digest_size=settings.digest_size,
+        steam_request_limit=settings.steam_request_limit, update_limit=settings.update_limit,
+        counter_path=counter_path, rules=settings.rules, clock=stats.clock, stats=stats, end=end
+    )
+
+    try:
+        await stats.sample_backlog(storage, initial=True)
+        while stats.now() < end:
+            await scheduler.run_once()
+            await stats.sample_backlog(storage)
+            await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        await storage.close()
+    return stats
+
+
+def run(settings: SimulationSettings, logger: logging.Logger) -> SimulationStats:
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as work_dir:
+        with asyncio.Runner(loop_factory=VirtualClockLoop) as runner:
+            stats = runner.run(simulate(settings, work_dir, logger))
+    stats.real_seconds = time.perf_counter() - start
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the bot's daily schedule on a virtual clock against fake Steam and Telegram")
+    parser.add_argument("--days", type=float, default=7, help="simulated days")
+    parser.add_argument("--start", type=datetime.datetime.fromisoformat,
+                        help="simulation start in MSK, e.g. 2026-10-19T18:00. By default the next 18:00")
+    parser.add_argument("--catalog", type=int, default=20_000, help="games already in the database")
+    parser.add_argument("--new-games", type=int, default=20_000, help="games in Steam that discovery hasn't found yet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steam-request-limit", type=int, default=200, help="app ids checked by one discovery run")
+    parser.add_argument("--update-limit", type=int, default=100, help="rows checked by one refresh run")
+    parser.add_argument("--publish-mode", default="single", choices=("single", "digest"))
+    parser.add_argument("--digest-size", type=int, default=10)
+    parser.add_argument("--rate-limit", type=int, default=STEAM_RATE_LIMIT, help="Steam requests per rate period")
+    parser.add_argument("--rate-period", type=int, default=STEAM_RATE_PERIOD, help="Steam rate limit period in seconds")
+    parser.add_argument("--rules", type=PublishRules.load, help="JSON file with publish and refresh rules")
+    parser.add_argument("--verbose", action="store_true", help="log every usecase step")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    start = args.start
+    if start is not None and start.tzinfo is None:
+        start = start.replace(tzinfo=MSK)
+
+    settings = SimulationSettings(
+        days=args.days, start=start, catalog=args.catalog, new_games=args.new_games, seed=args.seed,
+        steam_request_limit=args.steam_request_limit, update_limit=args.update_limit,
+        publish_mode=args.publish_mode, digest_size=args.digest_size,
+        rate_limit=args.rate_limit, rate_period=args.rate_period, rules=args.rules,
+    )
+    print(run(settings, logging.getLogger("simulation")).report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
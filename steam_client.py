@@ -0,0 +1,124 @@
+import asyncio
+import weakref
+
+from steam_web_api import Steam
+
+# Фильтр appdetails по умолчанию
+BASIC_FILTER = "basic"
+
+# Сколько секунд запрос ждет попутчиков к той же игре, прежде чем уйти в Steam
+MERGE_WINDOW = 0.05
+
+
+def _parse_filters(filters: str | None) -> frozenset[str]:
+    if filters is None:
+        return frozenset((BASIC_FILTER, ))
+    return frozenset(name.strip() for name in filters.split(",") if name.strip())
+
+
+class _Call:
+    __slots__ = ("filters", "future", "dispatched")
+
+    def __init__(self, filters: frozenset[str], future: asyncio.Future):
+        self.filters = filters
+        self.future = future
+        self.dispatched = False
+
+
+class SteamCoalescer:
+    """
+    Объединяет одновременные запросы appdetails к одной игре. Запрос, фильтры которого
+    покрываются уже отправленным или ожидающим запросом, получает его ответ. Запросы с
+    другими фильтрами, пришедшие за merge_window до отправки, сливаются в один запрос
+    с объединением фильтров. Каждое объединение экономит запрос из лимита Steam API
+    """
+
+    def __init__(self, steam: Steam, merge_window: float = MERGE_WINDOW, offload: bool = True):
+        self._steam = steam
+        self._merge_window = merge_window
+        # Синхронный HTTP запрос steam_web_api уходит в поток, чтобы не блокировать event loop
+        self._offload = offload
+        self._calls: dict[tuple[int, str], list[_Call]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.requests_sent = 0
+        self.requests_saved = 0
+
+    async def get_app_details(self, app_id: int, country: str, filters: str | None = None) -> dict | None:
+        key = (app_id, country)
+        wanted = _parse_filters(filters)
+        calls = self._calls.setdefault(key, [])
+
+        call = next((call for call in calls if wanted <= call.filters), None)
+        if call is None:
+            call = next((call for call in calls if not call.dispatched), None)
+            if call is not None:
+                call.filters = call.filters | wanted
+
+        if call is not None:
+            self.requests_saved += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            # Если все ожидающие отменены, ошибку запроса некому забрать - забираем ее сами
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            call = _Call(wanted, future)
+            calls.append(call)
+            task = asyncio.create_task(self._dispatch(key, call))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        # shield: отмена одного из ожидающих не должна отменять общий запрос
+        return await asyncio.shield(call.future)
+
+    async def drain(self) -> int:
+        """
+        Дожидается всех отправленных и ожидающих запросов. Возвращает, сколько их было
+        """
+        futures = [call.future for calls in self._calls.values() for call in calls]
+        if futures:
+            await asyncio.gather(*futures, return_exceptions=True)
+        return len(futures)
+
+    async def _dispatch(self, key: tuple[int, str], call: _Call):
+        await asyncio.sleep(self._merge_window)
+        call.dispatched = True
+        app_id, country = key
+        self.requests_sent += 1
+        try:
+            if call.filters == {BASIC_FILTER}:
+                request = lambda: self._steam.apps.get_app_details(app_id, country=country)
+            else:
+                filters = ",".join(sorted(call.filters))
+                request = lambda: self._steam.apps.get_app_details(app_id, country=country, filters=filters)
+
+            if self._offload:
+                response = await asyncio.to_thread(request)
+            else:
+                response = request()
+        except Exception as e:
+            call.future.set_exception(e)
+        else:
+            call.future.set_result(response)
+        finally:
+            calls = self._calls.get(key)
+            if calls is not None:
+                calls.remove(call)
+                if not calls:
+                    del self._calls[key]
+
+
+_coalescers: "weakref.WeakKeyDictionary[Steam, SteamCoalescer]" = weakref.WeakKeyDictionary()
+
+
+def coalescer_for(steam: Steam) -> SteamCoalescer:
+    """
+    Общий SteamCoalescer для клиента steam, чтобы запросы разных юзкейсов объединялись между собой
+    """
+    coalescer = _coalescers.get(steam)
+    if coalescer is None:
+        coalescer = SteamCoalescer(steam)
+        _coalescers[steam] = coalescer
+    return coalescer
+
+
+def register_coalescer(steam: Steam, coalescer: SteamCoalescer):
+    _coalescers[steam] = coalescer
@@ -0,0 +1,93 @@
+import logging
+from typing import TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+import diagnostics
+
+
+class AppDetailsFormatError(Exception):
+    """
+    Общий формат ответа appdetails изменился: в ответе нет запрошенного app_id
+    """
+
+
+class PriceOverview(BaseModel):
+    # Steam возвращает цены в копейках
+    initial: int
+    final: int | None = None
+    discount_percent: int
+
+    @property
+    def init_price(self) -> float:
+        return float(self.initial) / 100
+
+
+class Screenshot(BaseModel):
+    path_full: str
+
+
+# Модели ниже описывают только поля, которые нужны конкретному фильтру запроса.
+# Все остальное из ответа не валидируется и не копируется
+
+class PriceData(BaseModel):
+    """
+    filters="price_overview". У бесплатных игр price_overview нет
+    """
+    price_overview: PriceOverview | None = None
+
+
+class BasicData(BaseModel):
+    """
+    filters="basic" (фильтр по умолчанию)
+    """
+    name: str
+    short_description: str = ""
+    header_image: str
+
+
+class MediaData(BaseModel):
+    """
+    filters="screenshots,developers"
+    """
+    screenshots: list[Screenshot] = []
+    developers: list[str] = []
+
+
+DataT = TypeVar("DataT", bound=BaseModel)
+
+
+def parse_app_details(
+        response: dict, app_id: int, model: type[DataT], logger: logging.Logger
+        ) -> DataT | None:
+    """
+    Достает из ответа appdetails данные игры и валидирует только поля модели model.
+    Возвращает None, если игра недоступна или ее данные не подходят под модель.
+    Если в ответе вообще нет app_id - бросает AppDetailsFormatError
+    """
+    key = str(app_id)
+
+    app = response.get(key) if isinstance(response, dict) else None
+    if not isinstance(app, dict):
+        logger.error("The response with app_id=%s has no app_id attribute. "
+                     "General response format might have changed", app_id)
+        raise AppDetailsFormatError(f"app_id={app_id} is missing in the response")
+
+    if app.get("success") is not True:
+        return None
+
+    if "data" not in app:
+        logger.warning("The response with app_id=%s has no data attribute. "
+                       "app_id=%s may have wrong response format or is unavailable in Russia",
+                       app_id, app_id)
+        return None
+
+    # Для бесплатных игр Steam присылает data=[] вместо объекта
+    data = app["data"] or {}
+    try:
+        with diagnostics.phase(diagnostics.JSON_PARSE):
+            return model.model_validate(data)
+    except ValidationError as e:
+        logger.warning("The response with app_id=%s doesn't match %s: %s",
+                       app_id, model.__name__, e.errors(include_url=False, include_input=False))
+        return None
@@ -0,0 +1,101 @@
+import json
+
+import aiosqlite
+import pytest
+
+from catalog_transfer import CatalogFormatError, export_catalog, import_catalog
+from counter_file import read_counter, write_counter
+from db import create_schema
+
+
+async def create_db(path: str, apps: list[tuple]):
+    conn = await aiosqlite.connect(path)
+    await create_schema(conn)
+    await conn.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+        apps
+    )
+    await conn.commit()
+    return conn
+
+
+@pytest.mark.asyncio
+async def test_if_catalog_is_exported_and_merged_on_import(tmp_path):
+    """
+    Загрузка добавляет новые игры, обновляет устаревшие записи более свежими, не трогает
+    более свежие свои, восстанавливает индексы и сдвигает счетчик поиска до большего
+    """
+    source = await create_db(str(tmp_path / "source.db"), [
+        (10, 20, 199.0, 0, "2026-01-01 00:00:00"),
+        (20, 50, 599.0, 1, "2026-01-01 00:00:00"),
+        (30, 0, 999.0, 0, "2025-01-01 00:00:00"),
+    ])
+    await source.execute(
+        "INSERT INTO translations (app_id, source_hash, translated_text) VALUES (10, 'hash', 'Описание')"
+    )
+    await source.commit()
+    await source.close()
+    write_counter(str(tmp_path / "source_counter.txt"), 500)
+
+    target = await create_db(str(tmp_path / "target.db"), [
+        (20, 10, 599.0, 0, "2025-06-01 00:00:00"),
+        (30, 75, 999.0, 1, "2026-02-01 00:00:00"),
+    ])
+    await target.close()
+    write_counter(str(tmp_path / "target_counter.txt"), 300)
+
+    catalog_path = str(tmp_path / "catalog.jsonl.gz")
+    exported = await export_catalog(str(tmp_path / "source.db"), catalog_path, str(tmp_path / "source_counter.txt"),
+                                    chunk_size=2)
+    imported = await import_catalog(catalog_path, str(tmp_path / "target.db"), str(tmp_path / "target_counter.txt"),
+                                    chunk_size=2)
+
+    assert exported["steam_apps_info"] == imported["steam_apps_info"] == 3
+    assert imported["translations"] == 1
+    target = await aiosqlite.connect(str(tmp_path / "target.db"))
+    async with target.execute("SELECT app_id, discount_percent, status FROM steam_apps_info ORDER BY app_id") as c:
+        assert await c.fetchall() == [(10, 20, 0), (20, 50, 1), (30, 75, 1)]
+    async with target.execute("SELECT translated_text FROM translations") as c:
+        assert await c.fetchall() == [('Описание', )]
+    async with target.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL") as c:
+        assert {name for name, in await c.fetchall()} == {
+            "steam_apps_info_status_and_updated_at", "steam_apps_info_status_and_discount",
+            "steam_apps_info_status_and_checked_at", "steam_apps_archive_checked_at",
+        }
+    await target.close()
+    assert read_counter(str(tmp_path / "target_counter.txt")) == 500
+
+
+@pytest.mark.asyncio
+async def test_if_foreign_file_is_rejected(tmp_path):
+    """
+    Файл, который не является выгрузкой каталога, не загружается
+    """
+    path = tmp_path / "posts.jsonl"
+    path.write_text('{"some": "json"}\n')
+
+    with pytest.raises(CatalogFormatError):
+        await import_catalog(str(path), str(tmp_path / "target.db"), str(tmp_path / "counter.txt"))
+
+
+@pytest.mark.asyncio
+async def test_if_export_takes_counter_from_checkpoint(tmp_path):
+    """
+    Счетчик в job_checkpoints бывает впереди файла: выгрузка берет больший из них,
+    а поврежденный файл счетчика не мешает выгрузке
+    """
+    source = await create_db(str(tmp_path / "source.db"), [(10, 20, 199.0, 0, "2026-01-01 00:00:00")])
+    await source.execute("INSERT INTO job_checkpoints (name, value) VALUES ('discovery_counter', '800')")
+    await source.commit()
+    await source.close()
+    counter_path = tmp_path / "source_counter.txt"
+    write_counter(str(counter_path), 500)
+
+    catalog_path = tmp_path / "catalog.jsonl"
+    await export_catalog(str(tmp_path / "source.db"), str(catalog_path), str(counter_path))
+    assert json.loads(catalog_path.read_text().splitlines()[0])["counter"] == 800
+
+    counter_path.write_text("")
+    assert read_counter(str(counter_path)) is None
+    await export_catalog(str(tmp_path / "source.db"), str(catalog_path), str(counter_path))
+    assert json.loads(catalog_path.read_text().splitlines()[0])["counter"] == 800
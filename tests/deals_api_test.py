@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from db import Storage
+from deals_api import DealsApi, DealsSnapshot
+
+INSERT_SQL = """
+INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at) VALUES (?, ?, ?, ?, ?)
+"""
+
+UPDATE_SQL = """
+UPDATE steam_apps_info SET discount_percent = ?, updated_at = ? WHERE app_id = ?
+"""
+
+logger = logging.getLogger(__name__)
+
+
+async def open_storage(tmp_path) -> Storage:
+    storage = await Storage.open(str(tmp_path / "posts.db"), 2)
+    await storage.executemany(INSERT_SQL, [
+        (10, 50, 1000.0, 0, "2025-01-01 00:00:00"),
+        (20, 75, 400.0, 0, "2025-01-02 00:00:00"),
+        (30, 0, 300.0, 0, "2025-01-03 00:00:00"),
+        (40, 20, 100.0, 1, "2025-01-04 00:00:00"),
+    ])
+    return storage
+
+
+@pytest.mark.asyncio
+async def test_if_snapshot_follows_commits(tmp_path):
+    """
+    Снимок должен после коммита дочитать измененные записи: новую скидку добавить,
+    закончившуюся удалить и поднять версию
+    """
+    storage = await open_storage(tmp_path)
+    snapshot = DealsSnapshot(storage, logger, rebuild_delay=0)
+    await snapshot.start()
+
+    assert sorted(deal.app_id for deal in snapshot.sorted_deals("discount")) == [10, 20, 40]
+    version = snapshot.version
+
+    await storage.execute_batch([
+        (UPDATE_SQL, (30, "2025-02-01 00:00:00", 30)),
+        (UPDATE_SQL, (0, "2025-02-01 00:00:00", 20)),
+    ])
+    for _ in range(100):
+        if snapshot.version != version:
+            break
+        await asyncio.sleep(0.01)
+
+    assert [deal.app_id for deal in snapshot.sorted_deals("discount")] == [10, 30, 40]
+    assert snapshot.get(30).final_price == 210.0
+    assert snapshot.version == version + 1
+
+    # Без изменений версия остается прежней
+    await snapshot.rebuild()
+    assert snapshot.version == version + 1
+
+    await snapshot.stop()
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_api_filters_and_paginates(tmp_path):
+    """
+    /deals должен фильтровать по скидке и цене со скидкой и отдавать страницы по offset
+    """
+    storage = await open_storage(tmp_path)
+    snapshot = DealsSnapshot(storage, logger)
+    await snapshot.start()
+
+    async with TestClient(TestServer(DealsApi(snapshot, logger).app())) as client:
+        response = await client.get("/deals", params={"limit": 2})
+        body = await response.json()
+        assert [deal["app_id"] for deal in body["deals"]] == [20, 10]
+        assert body["next_offset"] == 2
+
+        response = await client.get("/deals", params={"limit": 2, "offset": 2})
+        body = await response.json()
+        assert [deal["app_id"] for deal in body["deals"]] == [40]
+        assert body["next_offset"] is None
+
+        response = await client.get("/deals", params={"sort": "price", "max_price": 400})
+        body = await response.json()
+        assert [deal["app_id"] for deal in body["deals"]] == [40, 20]
+
+        response = await client.get("/deals", params={"min_discount": 60})
+        assert [deal["app_id"] for deal in (await response.json())["deals"]] == [20]
+
+        response = await client.get("/deals/40")
+        assert (await response.json())["final_price"] == 80.0
+        assert (await client.get("/deals/30")).status == 404
+
+        assert (await client.get("/deals", params={"limit": 0})).status == 400
+        assert (await client.get("/deals", params={"sort": "name"})).status == 400
+
+    await snapshot.stop()
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_api_answers_not_modified(tmp_path):
+    """
+    Пока снимок не изменился, запрос с ETag получает 304, после изменения - новые данные
+    """
+    storage = await open_storage(tmp_path)
+    snapshot = DealsSnapshot(storage, logger)
+    await snapshot.start()
+
+    async with TestClient(TestServer(DealsApi(snapshot, logger).app())) as client:
+        response = await client.get("/deals")
+        etag = response.headers["ETag"]
+
+        response = await client.get("/deals", headers={"If-None-Match": etag})
+        assert response.status == 304
+
+        await storage.execute(UPDATE_SQL, (90, "2025-02-01 00:00:00", 30))
+        await snapshot.rebuild()
+
+        response = await client.get("/deals", headers={"If-None-Match": etag})
+        assert response.status == 200
+        assert response.headers["ETag"] != etag
+        assert (await response.json())["deals"][0]["app_id"] == 30
+
+    await snapshot.stop()
+    await storage.close()
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import diagnostics
+
+
+@pytest.mark.asyncio
+async def test_if_loop_is_blocked():
+    """
+    Блокирующий вызов внутри корутины должен попасть в лог вместе со стеком
+    """
+    logger_mock = Mock(spec=logging.Logger)
+    monitor = diagnostics.LoopLagMonitor(logger_mock, threshold=0.1, interval=0.02)
+    monitor.start()
+    await asyncio.sleep(0.05)
+
+    time.sleep(0.4)
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    assert monitor.max_lag > 0.1
+    stacks = [call.args[-1] for call in logger_mock.warning.call_args_list if "Stack" in call.args[0]]
+    assert any("test_if_loop_is_blocked" in stack for stack in stacks)
+
+
+@pytest.mark.asyncio
+async def test_if_job_is_profiled(tmp_path):
+    """
+    Время фаз должно попасть в профиль, а профиль - в файлы
+    """
+    logger_mock = Mock(spec=logging.Logger)
+
+    async with diagnostics.profile_job("job", logger_mock, str(tmp_path)) as profile:
+        with diagnostics.phase(diagnostics.STEAM_WAIT):
+            await asyncio.sleep(0.05)
+        with diagnostics.phase(diagnostics.SQL):
+            pass
+
+    assert profile.phases[diagnostics.STEAM_WAIT] >= 0.05
+    assert profile.counts[diagnostics.SQL] == 1
+    assert len(list(tmp_path.glob("job-*.prof"))) == 1
+    assert len(list(tmp_path.glob("job-*.txt"))) == 1
+
+    # Вне профиля фазы ничего не записывают
+    with diagnostics.phase(diagnostics.SQL):
+        pass
+    assert profile.counts[diagnostics.SQL] == 1
+
+
+@pytest.mark.asyncio
+async def test_if_concurrent_phases_are_counted_once(tmp_path):
+    """
+    Два одновременных ожидания одной фазы засчитываются как одно ожидание
+    """
+    logger_mock = Mock(spec=logging.Logger)
+
+    async def wait():
+        with diagnostics.phase(diagnostics.STEAM_WAIT):
+            await asyncio.sleep(0.1)
+
+    async with diagnostics.profile_job("job", logger_mock, str(tmp_path)) as profile:
+        await asyncio.gather(wait(), wait())
+
+    assert profile.counts[diagnostics.STEAM_WAIT] == 2
+    assert 0.1 <= profile.phases[diagnostics.STEAM_WAIT] < 0.15
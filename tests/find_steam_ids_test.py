@@ -6,23 +6,15 @@ import pytest
 from steam_web_api import Steam
 
 import usecases
+from db import Storage, create_schema
+from job_control import JobControl
 
 
 async def setup_in_memory_db():
     db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
 
-    await db.execute("""
-    CREATE TABLE IF NOT EXISTS steam_apps_info (
-        app_id INTEGER PRIMARY KEY,
-        discount_percent INTEGER NOT NULL,
-        init_price REAL NOT NULL,
-        status INTEGER NOT NULL,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP NOT NULL
-    )
-    """)
-    await db.commit()
-
-    return db
+    return db, await Storage.from_connection(db)
 
 
 @pytest.mark.asyncio
@@ -32,7 +24,7 @@ async def test_if_success():
     со статусом PENDING_PUBLISH
     """
     # Arrange
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
 
 
     with open("counter.txt", "r") as f:
@@ -60,7 +52,7 @@ async def test_if_success():
     steam_mock.apps.get_app_details.side_effect = side_effect
 
     # Act
-    await usecases.find_steam_ids(db, steam_mock, 1, logger_mock)
+    await usecases.find_steam_ids(storage, steam_mock, 1, logger_mock)
 
     # Assert
     async with db.execute("SELECT * FROM steam_apps_info") as c:
@@ -73,7 +65,7 @@ async def test_if_success():
         assert float(expected_init_price) == row_info[2]
         assert expected_status == usecases.PostStatus(row_info[3])
     
-    await db.close()
+    await storage.close()
 
 
 @pytest.mark.asyncio
@@ -82,7 +74,7 @@ async def test_if_not_success():
     В базу ничего не должно сохраняться
     """
     # Arrange
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
 
     with open("counter.txt", "r") as f:
         expected_id = int(f.read()) + 1
@@ -105,14 +97,14 @@ async def test_if_not_success():
     steam_mock.apps.get_app_details.side_effect = side_effect
 
     # Act
-    await usecases.find_steam_ids(db, steam_mock, 1, logger_mock)
+    await usecases.find_steam_ids(storage, steam_mock, 1, logger_mock)
 
     # Assert
     async with db.execute("SELECT * FROM steam_apps_info") as c:
         info_rows = await c.fetchall()
         assert len(info_rows) == 0
     
-    await db.close()
+    await storage.close()
 
 
 
@@ -123,7 +115,7 @@ async def test_if_api_response_format_is_wrong():
     должен пропустить обработку
     """
 
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
 
     json_without_data_key = {'1': {'success': True}}
     json_without_id_key = {"Some": "key"}
@@ -132,12 +124,12 @@ async def test_if_api_response_format_is_wrong():
     steam_api_mock = Mock(spec=Steam)
 
     steam_api_mock.apps.get_app_details.return_value = json_without_id_key
-    await usecases.find_steam_ids(db, steam_api_mock, 2, logger_mock)
+    await usecases.find_steam_ids(storage, steam_api_mock, 2, logger_mock)
 
     steam_api_mock.apps.get_app_details.return_value = json_without_data_key
-    await usecases.find_steam_ids(db, steam_api_mock, 2, logger_mock)
+    await usecases.find_steam_ids(storage, steam_api_mock, 2, logger_mock)
 
-    await db.close()
+    await storage.close()
 
 
 @pytest.mark.asyncio
@@ -146,7 +138,7 @@ async def test_if_api_request_limit_is_exceeded():
     Если превышен лимит запросов к API, то оно
     возвращает None. Код должен ожидать 6 минут
     """
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
 
     none_response = None
 
@@ -154,6 +146,61 @@ async def test_if_api_request_limit_is_exceeded():
     steam_api_mock = Mock(spec=Steam)
 
     steam_api_mock.apps.get_app_details.return_value = none_response
-    await usecases.find_steam_ids(db, steam_api_mock, 2, logger_mock, 2, 2)
+    await usecases.find_steam_ids(storage, steam_api_mock, 2, logger_mock, 2, 2)
+
+    await storage.close()
+
+@pytest.mark.asyncio
+async def test_if_job_is_cancelled(tmp_path):
+    """
+    Если запуск отменили, найденные игры должны сохраниться,
+    а счетчик - указывать на последний проверенный app_id
+    """
+    db, storage = await setup_in_memory_db()
+
+    counter_path = tmp_path / "counter.txt"
+    counter_path.write_text("100")
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    control = JobControl()
+    def side_effect(app_id, country, filters):
+        if app_id == 102:
+            control.cancel()
+        return {str(app_id): {'success': True, 'data': {'price_overview': {'initial': 10000, 'discount_percent': 10}}}}
+
+    steam_mock.apps.get_app_details.side_effect = side_effect
+
+    await usecases.find_steam_ids(storage, steam_mock, 10, logger_mock, control=control, counter_path=str(counter_path))
+
+    async with db.execute("SELECT app_id FROM steam_apps_info ORDER BY app_id") as c:
+        assert await c.fetchall() == [(101, ), (102, )]
+    assert counter_path.read_text() == "102"
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_search_resumes_from_checkpoint(tmp_path):
+    """
+    Если процесс убили после коммита найденных игр, но до записи counter.txt,
+    поиск продолжается с app_id из job_checkpoints, а не с отставшего файла
+    """
+    db, storage = await setup_in_memory_db()
+    await storage.save_checkpoint(usecases.DISCOVERY_COUNTER_CHECKPOINT, 130)
+
+    counter_path = tmp_path / "counter.txt"
+    counter_path.write_text("100")
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    steam_mock.apps.get_app_details.side_effect = lambda app_id, country, filters: {str(app_id): {'success': False}}
+
+    await usecases.find_steam_ids(storage, steam_mock, 1, logger_mock, counter_path=str(counter_path))
+
+    steam_mock.apps.get_app_details.assert_called_once()
+    assert steam_mock.apps.get_app_details.call_args.args[0] == 131
+    assert counter_path.read_text() == "131"
+    assert await storage.get_checkpoint(usecases.DISCOVERY_COUNTER_CHECKPOINT) == "131"
 
-    await db.close()
\ No newline at end of file
+    await storage.close()
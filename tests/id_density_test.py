@@ -0,0 +1,135 @@
+from random import Random
+
+import aiosqlite
+import pytest
+
+from db import Storage, create_schema
+from id_density import BUCKET_SIZE, MIN_TRAINING_PROBES, SAVE_ID_SPACE_STATS_SQL, STRIDE, IdDensityModel
+
+
+def trained_model(first_id: int, last_id: int, is_hit) -> IdDensityModel:
+    model = IdDensityModel()
+    for app_id in range(first_id, last_id + 1):
+        model.record(app_id, is_hit(app_id))
+    return model
+
+
+def test_if_cold_model_plans_contiguous_range():
+    """
+    Пока статистики мало, discovery проверяет app_id подряд, как раньше
+    """
+    model = IdDensityModel()
+
+    candidates, last_id = model.plan(100, 50)
+
+    assert candidates == list(range(101, 151))
+    assert last_id == 150
+
+
+def test_if_model_prefers_ids_on_stride():
+    """
+    Если живые app_id кратны 10, модель проверяет в основном их, но изредка заглядывает и в остальные
+    """
+    model = trained_model(1, MIN_TRAINING_PROBES * 2, lambda app_id: app_id % 10 == 0)
+
+    candidates, last_id = model.plan(MIN_TRAINING_PROBES * 2, 100, Random(0))
+
+    on_stride = [app_id for app_id in candidates if app_id % 10 == 0]
+    off_stride = len(candidates) - len(on_stride)
+    # Все кратные 10 app_id диапазона проверяются
+    assert on_stride == list(range(MIN_TRAINING_PROBES * 2 + 10, last_id + 1, 10))
+    assert 0 < off_stride < len(on_stride)
+
+
+def test_if_barren_bucket_is_skipped():
+    """
+    В бакете, где давно ничего не находится, проверяется только случайная выборка app_id
+    """
+    model = trained_model(1, BUCKET_SIZE, lambda app_id: app_id % 10 == 0 and app_id < BUCKET_SIZE // 2)
+    for app_id in range(BUCKET_SIZE, BUCKET_SIZE + 3000):
+        model.record(app_id, False)
+
+    candidates, last_id = model.plan(BUCKET_SIZE + 3000, 100, Random(0))
+
+    # За один запуск discovery не уходит дальше MAX_SPAN_FACTOR * лимит
+    assert last_id == BUCKET_SIZE + 3000 + 500
+    assert len(candidates) < 100
+
+
+@pytest.mark.asyncio
+async def test_if_statistics_survive_restart():
+    """
+    Несохраненные проверки сохраняются в id_space_stats и загружаются следующим запуском
+    """
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+    storage = await Storage.from_connection(db)
+
+    model = IdDensityModel()
+    model.record(10, True)
+    model.record(11, False)
+    await storage.executemany(SAVE_ID_SPACE_STATS_SQL, model.take_unsaved())
+    model.record(20, True)
+    await storage.executemany(SAVE_ID_SPACE_STATS_SQL, model.take_unsaved())
+
+    assert model.take_unsaved() == []
+    loaded = await IdDensityModel.load(storage)
+    assert loaded.total_probes == 3
+    assert loaded.hit_probability(30) > loaded.hit_probability(31)
+
+    await storage.close()
+
+
+def test_if_unknown_bucket_is_not_skipped():
+    """
+    Бакет, в котором почти ничего не проверено, не пропускается по оценке соседнего бакета
+    """
+    model = trained_model(1, BUCKET_SIZE, lambda app_id: app_id % 10 == 0 and app_id < BUCKET_SIZE // 2)
+
+    candidates, last_id = model.plan(BUCKET_SIZE - 1, 100, Random(0))
+
+    assert candidates == list(range(BUCKET_SIZE, BUCKET_SIZE + 100))
+    assert last_id == BUCKET_SIZE + 99
+
+
+@pytest.mark.asyncio
+async def test_if_skipped_ids_are_revisited():
+    """
+    Пропущенные app_id сохраняются диапазонами и перепроверяются следующими запусками,
+    начиная с диапазонов с самой высокой оценкой
+    """
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+    storage = await Storage.from_connection(db)
+
+    model = trained_model(1, BUCKET_SIZE, lambda app_id: app_id % 10 == 0 and app_id < BUCKET_SIZE // 2)
+    for app_id in range(BUCKET_SIZE, BUCKET_SIZE + 3000):
+        model.record(app_id, False)
+    _, last_id = model.plan(BUCKET_SIZE + 3000, 100, Random(0))
+    # Запуск прервался на середине: пропуски дальше проверенного не сохраняются
+    middle = (BUCKET_SIZE + 3000 + last_id) // 2
+    model.skip_through(middle)
+    await storage.executemany(SAVE_ID_SPACE_STATS_SQL, model.take_unsaved())
+    await storage.execute_batch(model.take_range_changes())
+
+    loaded = await IdDensityModel.load(storage)
+    skipped = loaded.plan_backfill(10_000)
+    assert len(skipped) == loaded.skipped_count
+    # В пустом бакете пропущено все до прерывания, включая случайно проверенные app_id
+    assert sorted(skipped) == list(range(BUCKET_SIZE + 3001, middle + 1))
+    # Первым перепроверяется диапазон с лучшим остатком от деления на STRIDE
+    assert skipped[0] % STRIDE == 0
+    assert skipped[:2] == [skipped[0], skipped[0] + STRIDE]
+
+    # Перепроверенные app_id уходят из диапазонов
+    revisited = loaded.plan_backfill(5)
+    for app_id in revisited:
+        loaded.record(app_id, False)
+        loaded.backfilled(app_id)
+    await storage.execute_batch(loaded.take_range_changes())
+
+    reloaded = await IdDensityModel.load(storage)
+    assert reloaded.skipped_count == len(skipped) - 5
+    assert set(reloaded.plan_backfill(10_000)) == set(skipped) - set(revisited)
+
+    await storage.close()
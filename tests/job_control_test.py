@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from job_control import JobControl
+
+
+@pytest.mark.asyncio
+async def test_if_sleep_does_not_fit_deadline():
+    """
+    Пауза, которая не успевает закончиться до дедлайна, не выполняется
+    """
+    control = JobControl.until(1)
+
+    assert await control.sleep(5) is False
+    assert control.should_stop() is False
+
+
+@pytest.mark.asyncio
+async def test_if_job_is_cancelled_while_sleeping():
+    """
+    Отмена будит юзкейс во время паузы
+    """
+    control = JobControl()
+
+    sleep_task = asyncio.create_task(control.sleep(60))
+    await asyncio.sleep(0)
+    control.cancel()
+
+    assert await asyncio.wait_for(sleep_task, 1) is False
+    assert control.should_stop() is True
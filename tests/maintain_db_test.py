@@ -0,0 +1,67 @@
+import datetime
+import logging
+import os
+from unittest.mock import Mock
+
+import pytest
+
+import usecases
+from db import Storage
+
+
+@pytest.mark.asyncio
+async def test_if_old_published_rows_are_archived(tmp_path):
+    """
+    Давно опубликованные записи, которые проверка цены подтвердила после срока, переносятся в архив,
+    остальные остаются, а -wal файл обрезается
+    """
+    db_path = str(tmp_path / "posts.db")
+    storage = await Storage.open(db_path, 1)
+
+    old_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=400)).strftime("%Y-%m-%d %H:%M:%S")
+    await storage.executemany(
+        """
+        INSERT INTO steam_apps_info (
+            app_id,
+            discount_percent,
+            init_price,
+            status,
+            updated_at,
+            checked_at
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (1, 0, 100.0, usecases.PostStatus.PUBLISHED.value, old_date, "2999-01-01 00:00:00"),
+            (2, 0, 100.0, usecases.PostStatus.PENDING_PUBLISH.value, old_date, "2999-01-01 00:00:00"),
+            (3, 0, 100.0, usecases.PostStatus.PUBLISHED.value, "2999-01-01 00:00:00", "2999-01-01 00:00:00"),
+            # Цену давно не проверяли, она могла измениться
+            (4, 0, 100.0, usecases.PostStatus.PUBLISHED.value, old_date, old_date),
+        ]
+    )
+
+    await usecases.maintain_db(storage, Mock(spec=logging.Logger), archive_after_days=365)
+
+    assert await storage.fetchall("SELECT app_id FROM steam_apps_info ORDER BY app_id") == [(2, ), (3, ), (4, )]
+    assert await storage.fetchall("SELECT app_id, updated_at FROM steam_apps_archive") == [(1, old_date)]
+    assert (await storage.run_outside_transaction("PRAGMA auto_vacuum")) == [(2, )]
+    assert os.path.getsize(db_path + "-wal") == 0
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_archiving_is_disabled():
+    """
+    archive_after_days=0 ничего не переносит в архив
+    """
+    storage = await Storage.open(":memory:")
+    await storage.execute(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (1, 0, 100.0, usecases.PostStatus.PUBLISHED.value, "2000-01-01 00:00:00")
+    )
+
+    await usecases.maintain_db(storage, Mock(spec=logging.Logger), archive_after_days=0)
+
+    assert await storage.fetchall("SELECT app_id FROM steam_apps_info") == [(1, )]
+
+    await storage.close()
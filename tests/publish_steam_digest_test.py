@@ -0,0 +1,195 @@
+import logging
+from unittest.mock import AsyncMock, Mock
+
+import aiosqlite
+import pytest
+from aiogram import Bot
+from steam_web_api import Steam
+
+import usecases
+from db import Storage, create_schema
+from job_control import JobControl
+
+
+async def setup_in_memory_db():
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+
+    return db, await Storage.from_connection(db)
+
+
+
+@pytest.mark.asyncio
+async def test_if_success():
+    """
+    В дайджест попадают игры со скидкой, начиная с самой большой,
+    и все они помечаются PUBLISHED
+    """
+    db, storage = await setup_in_memory_db()
+    await db.executemany(
+        """
+        INSERT INTO steam_apps_info (
+            app_id,
+            discount_percent,
+            init_price,
+            status
+        ) VALUES (?, ?, ?, ?)
+        """,
+        [
+            (10, 20, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (20, 50, 2000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (30, 0, 3000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+        ]
+    )
+    await db.commit()
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country):
+        return {str(app_id): {'success': True, 'data': {
+            'name': f'Game {app_id}', 'short_description': '', 'header_image': f'https://cover/{app_id}'
+        }}}
+
+    steam_mock.apps.get_app_details.side_effect = side_effect
+    bot_mock = AsyncMock(spec=Bot)
+
+    # Дедлайн не дает юзкейсу ждать следующий дайджест
+    await usecases.publish_steam_digest(storage, steam_mock, bot_mock, -1, logger_mock, control=JobControl.until(60))
+
+    bot_mock.send_media_group.assert_awaited_once()
+    media = bot_mock.send_media_group.await_args.kwargs["media"]
+    assert [photo.media for photo in media] == ['https://cover/20', 'https://cover/10']
+    assert media[0].caption.index('Game 20') < media[0].caption.index('Game 10')
+
+    async with db.execute("SELECT app_id, status FROM steam_apps_info ORDER BY app_id") as c:
+        assert await c.fetchall() == [
+            (10, usecases.PostStatus.PUBLISHED.value),
+            (20, usecases.PostStatus.PUBLISHED.value),
+            (30, usecases.PostStatus.PENDING_PUBLISH.value),
+        ]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_api_response_format_is_wrong():
+    """
+    Если API возвращает неправильный формат, юзкейс
+    должен пропустить обработку
+    """
+    db, storage = await setup_in_memory_db()
+    await db.execute(
+        """
+        INSERT INTO steam_apps_info (
+            app_id,
+            discount_percent,
+            init_price,
+            status
+        ) VALUES (?, ?, ?, ?)
+        """,
+        (1, 20, 2000, usecases.PostStatus.PENDING_PUBLISH.value)
+    )
+    await db.commit()
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_api_mock = Mock(spec=Steam)
+    bot_mock = AsyncMock(spec=Bot)
+
+    steam_api_mock.apps.get_app_details.return_value = {"Some": "key"}
+    await usecases.publish_steam_digest(storage, steam_api_mock, bot_mock, -1, logger_mock)
+
+    steam_api_mock.apps.get_app_details.return_value = {'1': {'success': True}}
+    await usecases.publish_steam_digest(storage, steam_api_mock, bot_mock, -1, logger_mock)
+
+    bot_mock.send_media_group.assert_not_awaited()
+    bot_mock.send_photo.assert_not_awaited()
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_interrupted_publish_is_not_repeated():
+    """
+    Игры, пост с которыми отправлялся, когда процесс убили, помечаются PUBLISHED
+    и не публикуются повторно. Если Telegram отклонил пост, отметка об отправке снимается
+    """
+    db, storage = await setup_in_memory_db()
+    await db.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status) VALUES (?, ?, ?, ?)",
+        [
+            (10, 20, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (20, 50, 2000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+        ]
+    )
+    await db.commit()
+    await storage.save_checkpoint(usecases.PUBLISH_IN_FLIGHT_CHECKPOINT, "[20]")
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    steam_mock.apps.get_app_details.side_effect = lambda app_id, country: {str(app_id): {'success': True, 'data': {
+        'name': f'Game {app_id}', 'short_description': '', 'header_image': f'https://cover/{app_id}'
+    }}}
+    bot_mock = AsyncMock(spec=Bot)
+    bot_mock.send_photo.side_effect = RuntimeError("Telegram is down")
+
+    with pytest.raises(RuntimeError):
+        await usecases.publish_steam_digest(storage, steam_mock, bot_mock, -1, logger_mock, control=JobControl.until(60))
+
+    assert bot_mock.send_photo.await_args.kwargs["photo"] == 'https://cover/10'
+    async with db.execute("SELECT app_id, status FROM steam_apps_info ORDER BY app_id") as c:
+        assert await c.fetchall() == [
+            (10, usecases.PostStatus.PENDING_PUBLISH.value),
+            (20, usecases.PostStatus.PUBLISHED.value),
+        ]
+    assert await storage.get_checkpoint(usecases.PUBLISH_IN_FLIGHT_CHECKPOINT) == "[]"
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_unavailable_games_leave_ranking():
+    """
+    Недоступные в Steam игры с самыми большими скидками помечаются UNAVAILABLE,
+    и следующий дайджест их уже не запрашивает
+    """
+    db, storage = await setup_in_memory_db()
+    await db.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status) VALUES (?, ?, ?, ?)",
+        [
+            (10, 90, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (20, 80, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (30, 50, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+        ]
+    )
+    await db.commit()
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country):
+        if app_id in (10, 20):
+            return {str(app_id): {'success': False}}
+        return {str(app_id): {'success': True, 'data': {
+            'name': f'Game {app_id}', 'short_description': '', 'header_image': f'https://cover/{app_id}'
+        }}}
+    steam_mock.apps.get_app_details.side_effect = side_effect
+    bot_mock = AsyncMock(spec=Bot)
+
+    await usecases.publish_steam_digest(storage, steam_mock, bot_mock, -1, logger_mock, digest_size=2,
+                                        control=JobControl.until(60))
+
+    bot_mock.send_photo.assert_not_awaited()
+    async with db.execute("SELECT app_id, status FROM steam_apps_info ORDER BY app_id") as c:
+        assert await c.fetchall() == [
+            (10, usecases.PostStatus.UNAVAILABLE.value),
+            (20, usecases.PostStatus.UNAVAILABLE.value),
+            (30, usecases.PostStatus.PENDING_PUBLISH.value),
+        ]
+
+    steam_mock.apps.get_app_details.reset_mock()
+    await usecases.publish_steam_digest(storage, steam_mock, bot_mock, -1, logger_mock, digest_size=2,
+                                        control=JobControl.until(60))
+
+    assert [call.args[0] for call in steam_mock.apps.get_app_details.call_args_list] == [30]
+    assert bot_mock.send_photo.await_args.kwargs["photo"] == 'https://cover/30'
+
+    await storage.close()
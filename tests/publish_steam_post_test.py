@@ -4,27 +4,19 @@ import aiosqlite
 import pytest
 
 from aiogram import Bot
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 from steam_web_api import Steam
 
 import usecases
+from db import Storage, create_schema
+from job_control import JobControl
 
 
 async def setup_in_memory_db():
     db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
 
-    await db.execute("""
-    CREATE TABLE IF NOT EXISTS steam_apps_info (
-        app_id INTEGER PRIMARY KEY,
-        discount_percent INTEGER NOT NULL,
-        init_price REAL NOT NULL,
-        status INTEGER NOT NULL,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP NOT NULL
-    )
-    """)
-    await db.commit()
-
-    return db
+    return db, await Storage.from_connection(db)
 
 
 
@@ -36,7 +28,7 @@ async def test_if_api_response_format_is_wrong():
     должен пропустить обработку
     """
 
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
     await db.execute(
         """
         INSERT INTO steam_apps_info (
@@ -62,12 +54,12 @@ async def test_if_api_response_format_is_wrong():
 
 
     steam_api_mock.apps.get_app_details.return_value = json_without_id_key
-    await usecases.publish_steam_post(db, steam_api_mock, bot_mock, -1, logger_mock)
+    await usecases.publish_steam_post(storage, steam_api_mock, bot_mock, -1, logger_mock)
 
     steam_api_mock.apps.get_app_details.return_value = json_without_data_key
-    await usecases.publish_steam_post(db, steam_api_mock, bot_mock, -1, logger_mock)
+    await usecases.publish_steam_post(storage, steam_api_mock, bot_mock, -1, logger_mock)
 
-    await db.close()
+    await storage.close()
 
 
 
@@ -77,7 +69,7 @@ async def test_if_api_request_limit_is_exceeded():
     Если превышен лимит запросов к API, то оно
     возвращает None. Код должен ожидать 6 минут
     """
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
     await db.execute(
         """
         INSERT INTO steam_apps_info (
@@ -101,6 +93,48 @@ async def test_if_api_request_limit_is_exceeded():
     bot_mock = Mock(spec=Bot)
 
     steam_api_mock.apps.get_app_details.return_value = none_response
-    await usecases.publish_steam_post(db, steam_api_mock, bot_mock, -1, logger_mock, 2, 1)
+    await usecases.publish_steam_post(storage, steam_api_mock, bot_mock, -1, logger_mock, 2, 1)
+
+    await storage.close()
+
+@pytest.mark.asyncio
+async def test_if_unavailable_game_is_skipped():
+    """
+    Недоступная в Steam игра помечается UNAVAILABLE и не останавливает очередь:
+    публикуется следующая запись, а недоступная больше не запрашивается
+    """
+    db, storage = await setup_in_memory_db()
+    await db.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [
+            (10, 20, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value, "2025-01-01 00:00:00"),
+            (20, 30, 2000.0, usecases.PostStatus.PENDING_PUBLISH.value, "2025-01-02 00:00:00"),
+        ]
+    )
+    await db.commit()
 
-    await db.close()
\ No newline at end of file
+    logger_mock = Mock(spec=logging.Logger)
+    steam_api_mock = Mock(spec=Steam)
+    def side_effect(app_id, country, filters=None):
+        if app_id == 10:
+            return {'10': {'success': False}}
+        return {str(app_id): {'success': True, 'data': {
+            'name': 'Game', 'short_description': '', 'header_image': 'https://cover',
+            'screenshots': [], 'developers': ['Dev'],
+        }}}
+    steam_api_mock.apps.get_app_details.side_effect = side_effect
+    bot_mock = AsyncMock(spec=Bot)
+
+    for _ in range(3):
+        await usecases.publish_steam_post(storage, steam_api_mock, bot_mock, -1, logger_mock, control=JobControl.until(60))
+
+    bot_mock.send_media_group.assert_awaited_once()
+    requested_ids = [call.args[0] for call in steam_api_mock.apps.get_app_details.call_args_list]
+    assert requested_ids.count(10) == 1
+    async with db.execute("SELECT app_id, status FROM steam_apps_info ORDER BY app_id") as c:
+        assert await c.fetchall() == [
+            (10, usecases.PostStatus.UNAVAILABLE.value),
+            (20, usecases.PostStatus.PUBLISHED.value),
+        ]
+
+    await storage.close()
@@ -0,0 +1,60 @@
+import aiosqlite
+import pytest
+
+import bench_queries
+from db import create_schema
+
+
+@pytest.mark.asyncio
+async def test_if_production_queries_use_indexes():
+    """
+    Ни один запрос юзкейсов не должен сканировать steam_apps_info или сортировать выборку
+    """
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+    max_app_id = await bench_queries.fill_catalog(db, 20_000)
+
+    violations = await bench_queries.check_plans(db, bench_queries.production_queries(max_app_id))
+
+    assert violations == []
+
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_if_full_scan_is_detected():
+    """
+    Запрос без подходящего индекса должен считаться плохим
+    """
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+
+    query = bench_queries.BenchQuery("scan", "SELECT app_id FROM steam_apps_info WHERE init_price > ?", (100, ))
+    violations = await bench_queries.check_plans(db, [query])
+
+    assert [name for name, _ in violations] == ["scan"]
+
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_if_blocked_backlog_is_not_walked():
+    """
+    Выборка следующего поста и ближайших переводов не должна перебирать записи, которые правила
+    не пропускают, даже если их тысячи в самом начале очереди. План с SEARCH этого не показывает,
+    поэтому считаются инструкции SQLite: до раскладки очереди по статусам проверка их ловит
+    """
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+    max_app_id = await bench_queries.fill_catalog(db, 20_000)
+    await bench_queries.fill_blocked_backlog(db, max_app_id, 20_000)
+    queries = bench_queries.production_queries(max_app_id)
+
+    unsorted = await bench_queries.check_steps(db, queries)
+    await bench_queries.sort_queue(db, bench_queries.BENCH_RULES)
+    sorted_violations = await bench_queries.check_steps(db, queries)
+
+    assert "publish: select next post (rules)" in [name for name, _ in unsorted]
+    assert sorted_violations == []
+
+    await db.close()
@@ -0,0 +1,176 @@
+import logging
+from unittest.mock import AsyncMock, Mock
+
+import aiosqlite
+import pytest
+from aiogram import Bot
+from pydantic import ValidationError
+from steam_web_api import Steam
+
+import usecases
+from db import Storage, create_schema
+from job_control import JobControl
+from rules import PriceBandRule, PublishRules
+
+RULES = PublishRules(
+    min_discount=10,
+    price_bands=[
+        PriceBandRule(max_price=300, min_discount=50, cooldown_days=60),
+        PriceBandRule(min_price=300, min_discount=20, cooldown_days=7),
+    ],
+    excluded_apps=[40],
+)
+
+
+async def setup_in_memory_db():
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+
+    return db, await Storage.from_connection(db)
+
+
+async def insert_rows(db: aiosqlite.Connection, rows: list[tuple]):
+    await db.executemany(
+        """
+        INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at, checked_at)
+        VALUES (?1, ?2, ?3, ?4, datetime('now', ?5), datetime('now', ?5))
+        """,
+        rows
+    )
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_if_publish_predicate_selects_only_publishable_rows():
+    """
+    Скидка должна быть не меньше общей и не меньше скидки правила диапазона цены игры,
+    исключенные игры не публикуются
+    """
+    db, storage = await setup_in_memory_db()
+    pending = usecases.PostStatus.PENDING_PUBLISH.value
+    await insert_rows(db, [
+        (10, 60, 199.0, pending, "-1 day"),
+        (20, 30, 199.0, pending, "-1 day"),
+        (30, 20, 999.0, pending, "-1 day"),
+        (40, 90, 999.0, pending, "-1 day"),
+        (50, 0, 999.0, pending, "-1 day"),
+    ])
+
+    rows = await storage.fetchall(f"SELECT app_id FROM steam_apps_info WHERE {RULES.publish_predicate()} ORDER BY app_id")
+
+    assert rows == [(10, ), (30, )]
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_refresh_uses_cooldown_of_price_band():
+    """
+    Опубликованная игра проверяется снова, когда с последней проверки прошел срок правила
+    ее диапазона цены, даже если цена давно не менялась
+    """
+    db, storage = await setup_in_memory_db()
+    published = usecases.PostStatus.PUBLISHED.value
+    await insert_rows(db, [
+        (10, 60, 199.0, published, "-30 days"),
+        (20, 60, 199.0, published, "-61 days"),
+        (30, 20, 999.0, published, "-8 days"),
+        (40, 20, 999.0, published, "-8 days"),
+    ])
+    await db.execute("INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at, "
+                     "checked_at) VALUES (50, 20, 999.0, ?, datetime('now', '-90 days'), datetime('now', '-1 day'))",
+                     (published, ))
+    await db.commit()
+
+    rows = await storage.fetchall(
+        usecases.SELECT_ROWS_TO_REFRESH_TEMPLATE.format(refreshable=RULES.refresh_predicate()),
+        (published, "", 0, 100)
+    )
+
+    assert [row[0] for row in rows] == [20, 30]
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_post_skips_rows_rejected_by_rules():
+    """
+    Steam и Telegram не запрашиваются для записей, из которых по правилам не получится пост
+    """
+    db, storage = await setup_in_memory_db()
+    await insert_rows(db, [(10, 0, 999.0, usecases.PostStatus.PENDING_PUBLISH.value, "-1 day")])
+    steam_mock = Mock(spec=Steam)
+    bot_mock = AsyncMock(spec=Bot)
+
+    await usecases.publish_steam_post(
+        storage, steam_mock, bot_mock, -1, Mock(spec=logging.Logger), control=JobControl.until(60), rules=RULES
+    )
+
+    steam_mock.apps.get_app_details.assert_not_called()
+    bot_mock.send_media_group.assert_not_awaited()
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_rejected_pending_rows_are_refreshed():
+    """
+    Игра, которая при поиске была без скидки, обновляется и попадает в публикацию, когда скидка появилась.
+    Опубликованная игра, новую цену которой правила не пропускают, уходит в BLOCKED
+    """
+    db, storage = await setup_in_memory_db()
+    pending = usecases.PostStatus.PENDING_PUBLISH.value
+    blocked = usecases.PostStatus.BLOCKED.value
+    await insert_rows(db, [
+        (10, 0, 999.0, pending, "-8 days"),
+        (20, 25, 999.0, pending, "-8 days"),
+        (30, 50, 999.0, usecases.PostStatus.PUBLISHED.value, "-8 days"),
+    ])
+    await usecases.apply_publish_rules(storage, Mock(spec=logging.Logger), RULES)
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country, filters):
+        discount_percent = 50 if app_id == 10 else 5
+        return {str(app_id): {'success': True, 'data': {
+            'price_overview': {'initial': 99900, 'discount_percent': discount_percent}
+        }}}
+    steam_mock.apps.get_app_details.side_effect = side_effect
+
+    await usecases.update_steam_game_price_and_discount(
+        storage, steam_mock, 100, Mock(spec=logging.Logger), rules=RULES
+    )
+
+    assert sorted(call.args[0] for call in steam_mock.apps.get_app_details.call_args_list) == [10, 30]
+    assert await storage.fetchall("SELECT app_id, discount_percent, status FROM steam_apps_info ORDER BY app_id") == [
+        (10, 50, pending), (20, 25, pending), (30, 5, blocked)
+    ]
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_queue_follows_changed_rules():
+    """
+    При запуске записи, которые правила не пропускают, уходят из очереди в BLOCKED,
+    а если правила смягчили - возвращаются в очередь
+    """
+    db, storage = await setup_in_memory_db()
+    pending = usecases.PostStatus.PENDING_PUBLISH.value
+    blocked = usecases.PostStatus.BLOCKED.value
+    await insert_rows(db, [(10, 0, 999.0, pending, "-1 day"), (20, 25, 999.0, pending, "-1 day")])
+
+    await usecases.apply_publish_rules(storage, Mock(spec=logging.Logger), RULES)
+    assert await storage.fetchall("SELECT app_id, status FROM steam_apps_info ORDER BY app_id") == [
+        (10, blocked), (20, pending)
+    ]
+
+    await usecases.apply_publish_rules(storage, Mock(spec=logging.Logger))
+    assert await storage.fetchall("SELECT app_id, status FROM steam_apps_info ORDER BY app_id") == [
+        (10, pending), (20, pending)
+    ]
+    await storage.close()
+
+
+def test_if_invalid_rules_are_rejected():
+    """
+    В SQL попадают только провалидированные числа
+    """
+    with pytest.raises(ValidationError):
+        PublishRules.model_validate({"min_discount": "10; DROP TABLE steam_apps_info"})
+    with pytest.raises(ValidationError):
+        PublishRules.model_validate({"excluded_apps": ["1) OR (1"]})
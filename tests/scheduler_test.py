@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+import logging
+from unittest.mock import Mock
+
+import pytest
+
+from db import Storage
+from scheduler import DISCOVERY, MSK, PUBLISH, REFRESH, Scheduler, seconds_until_msk, window_at
+
+
+def test_if_windows_follow_msk_schedule():
+    """
+    С 18:00 до 2:00 - поиск игр, с 2:00 до 8:00 - обновление цен, с 8:00 до 18:00 - публикация
+    """
+    assert window_at(datetime.time(23, 59)) == DISCOVERY
+    assert window_at(datetime.time(1, 59)) == DISCOVERY
+    assert window_at(datetime.time(2, 0)) == REFRESH
+    assert window_at(datetime.time(8, 0)) == PUBLISH
+    assert window_at(datetime.time(18, 0)) == DISCOVERY
+
+
+def test_if_window_end_is_counted_across_midnight():
+    """
+    Конец окна поиска игр наступает уже на следующий день
+    """
+    now = datetime.datetime(2026, 10, 19, 23, 0, tzinfo=MSK)
+
+    assert seconds_until_msk(datetime.time(2, 0), now) == 3 * 3600
+    # Время в другом часовом поясе переводится в мск
+    assert seconds_until_msk(datetime.time(2, 0), now.astimezone(datetime.timezone.utc)) == 3 * 3600
+
+
+class _WaitingScheduler(Scheduler):
+    """
+    Юзкейс окна ждет отмены, как юзкейс, который спит из-за лимита Steam API
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = asyncio.Event()
+        self.job_cancelled = False
+
+    async def _run_window(self, window, control):
+        self.started.set()
+        await control.sleep(3600)
+        self.job_cancelled = control.cancelled
+
+
+@pytest.mark.asyncio
+async def test_if_stop_cancels_current_job():
+    """
+    stop() отменяет текущий юзкейс, и run() возвращается без ожидания следующего запуска
+    и без обслуживания базы
+    """
+    scheduler = _WaitingScheduler(None, None, None, -1, Mock(spec=logging.Logger))
+    run = asyncio.create_task(scheduler.run())
+    await scheduler.started.wait()
+
+    scheduler.stop()
+    await asyncio.wait_for(run, 1)
+
+    assert scheduler.job_cancelled
+    assert scheduler._last_maintenance_at is None
+
+
+@pytest.mark.asyncio
+async def test_if_maintenance_keeps_profile_request():
+    """
+    Запрошенный профиль достается следующему запуску юзкейса, а не обслуживанию базы
+    """
+    storage = await Storage.open(":memory:")
+    scheduler = Scheduler(storage, None, None, -1, Mock(spec=logging.Logger))
+    scheduler.request_job_profile()
+
+    await scheduler.maintain_db_if_due()
+
+    assert scheduler._last_maintenance_at is not None
+    assert scheduler.profile_next_job
+
+    await storage.close()
@@ -0,0 +1,60 @@
+import asyncio
+import datetime
+import logging
+import time
+
+import usecases
+from scheduler import MSK, PUBLISH, REFRESH
+from simulation import SimulationSettings, VirtualClockLoop, run
+
+
+def test_if_virtual_clock_skips_idle_time():
+    """
+    Час сна на виртуальных часах проходит без реального ожидания
+    """
+    async def sleep_hour():
+        await asyncio.sleep(3600)
+        return asyncio.get_running_loop().time()
+
+    start = time.perf_counter()
+    with asyncio.Runner(loop_factory=VirtualClockLoop) as runner:
+        virtual_seconds = runner.run(sleep_hour())
+
+    assert virtual_seconds >= 3600
+    assert time.perf_counter() - start < 5
+
+
+def test_if_schedule_is_simulated():
+    """
+    Симуляция с 7:30 до 9:30 по мск проходит конец окна обновления цен и начало публикации
+    """
+    settings = SimulationSettings(
+        days=2 / 24, start=datetime.datetime(2026, 10, 19, 7, 30, tzinfo=MSK),
+        catalog=300, new_games=100, update_limit=20
+    )
+
+    stats = run(settings, logging.getLogger("simulation_test"))
+
+    assert stats.runs[REFRESH] > 0
+    assert stats.requests[REFRESH] > 0
+    assert stats.runs[PUBLISH] > 0
+    assert sum(stats.published) >= 1
+    assert "publish" in stats.report()
+
+
+def test_if_posts_keep_gap_until_window_end():
+    """
+    Пауза между постами соблюдается и между запусками юзкейса: в конце окна публикации,
+    когда следующая пауза не помещается в окно, бот не отправляет посты каждые 30 секунд
+    """
+    for publish_mode in ("single", "digest"):
+        settings = SimulationSettings(
+            days=4 / 24, start=datetime.datetime(2026, 10, 19, 14, 30, tzinfo=MSK),
+            catalog=2000, new_games=100, publish_mode=publish_mode
+        )
+
+        stats = run(settings, logging.getLogger("simulation_test"))
+
+        assert len(stats.send_times) >= 2
+        gaps = [later - earlier for earlier, later in zip(stats.send_times, stats.send_times[1:])]
+        assert min(gaps) >= usecases.POST_PERIOD_RANGE[0]
@@ -0,0 +1,78 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+from steam_web_api import Steam
+
+from steam_client import SteamCoalescer
+
+
+@pytest.mark.asyncio
+async def test_if_same_requests_are_coalesced():
+    """
+    Одновременные одинаковые запросы к одной игре должны уйти в Steam одним запросом
+    """
+    steam_mock = Mock(spec=Steam)
+    steam_mock.apps.get_app_details.return_value = {'1': {'success': True}}
+    coalescer = SteamCoalescer(steam_mock, merge_window=0.01)
+
+    responses = await asyncio.gather(*(coalescer.get_app_details(1, "RU", "price_overview") for _ in range(3)))
+
+    assert responses == [{'1': {'success': True}}] * 3
+    steam_mock.apps.get_app_details.assert_called_once_with(1, country="RU", filters="price_overview")
+    assert coalescer.requests_saved == 2
+
+
+@pytest.mark.asyncio
+async def test_if_different_filters_are_merged():
+    """
+    Запросы с разными фильтрами к одной игре объединяются в один запрос с общим фильтром
+    """
+    steam_mock = Mock(spec=Steam)
+    steam_mock.apps.get_app_details.return_value = {'1': {'success': True}}
+    coalescer = SteamCoalescer(steam_mock, merge_window=0.01, offload=False)
+
+    await asyncio.gather(
+        coalescer.get_app_details(1, "RU"),
+        coalescer.get_app_details(1, "RU", "screenshots,developers"),
+        coalescer.get_app_details(2, "RU"),
+    )
+
+    assert steam_mock.apps.get_app_details.call_count == 2
+    steam_mock.apps.get_app_details.assert_any_call(1, country="RU", filters="basic,developers,screenshots")
+    steam_mock.apps.get_app_details.assert_any_call(2, country="RU")
+
+
+@pytest.mark.asyncio
+async def test_if_incompatible_request_waits_for_its_own_call():
+    """
+    Запрос, чьи фильтры не покрываются уже отправленным запросом, уходит отдельно
+    """
+    steam_mock = Mock(spec=Steam)
+    steam_mock.apps.get_app_details.return_value = {'1': {'success': True}}
+    coalescer = SteamCoalescer(steam_mock, merge_window=0.01)
+
+    first = asyncio.create_task(coalescer.get_app_details(1, "RU", "price_overview"))
+    await asyncio.sleep(0.02)
+    await asyncio.gather(first, coalescer.get_app_details(1, "RU", "screenshots"))
+
+    assert steam_mock.apps.get_app_details.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_if_request_fails():
+    """
+    Ошибка запроса достается всем, кто его ждал
+    """
+    steam_mock = Mock(spec=Steam)
+    steam_mock.apps.get_app_details.side_effect = ConnectionError("Steam is down")
+    coalescer = SteamCoalescer(steam_mock, merge_window=0.01)
+
+    results = await asyncio.gather(
+        coalescer.get_app_details(1, "RU"),
+        coalescer.get_app_details(1, "RU"),
+        return_exceptions=True
+    )
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    steam_mock.apps.get_app_details.assert_called_once()
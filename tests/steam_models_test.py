@@ -0,0 +1,71 @@
+import logging
+from unittest.mock import Mock
+
+import pytest
+
+from steam_models import AppDetailsFormatError, BasicData, MediaData, PriceData, parse_app_details
+
+
+def test_if_price_overview_is_parsed():
+    """
+    Цена из копеек должна переводиться в рубли, остальные поля ответа игнорируются
+    """
+    response = {'10': {'success': True, 'data':
+                    {'price_overview':
+                        {'currency': 'RUB', 'initial': 150000, 'final': 105000, 'discount_percent': 30, 'initial_formatted': '1500 руб.', 'final_formatted': '1050 руб.'}
+                    }
+                }
+            }
+
+    price_data = parse_app_details(response, 10, PriceData, Mock(spec=logging.Logger))
+
+    assert price_data.price_overview.discount_percent == 30
+    assert price_data.price_overview.init_price == 1500.0
+
+
+def test_if_game_is_free():
+    """
+    Для бесплатных игр Steam присылает data=[]
+    """
+    response = {'10': {'success': True, 'data': []}}
+
+    price_data = parse_app_details(response, 10, PriceData, Mock(spec=logging.Logger))
+
+    assert price_data is not None
+    assert price_data.price_overview is None
+
+
+def test_if_app_id_is_missing():
+    """
+    Если в ответе нет app_id, значит изменился общий формат ответа
+    """
+    with pytest.raises(AppDetailsFormatError):
+        parse_app_details({"Some": "key"}, 10, PriceData, Mock(spec=logging.Logger))
+
+
+def test_if_response_is_malformed():
+    """
+    Игра с неожиданным форматом данных пропускается, а не роняет юзкейс
+    """
+    logger_mock = Mock(spec=logging.Logger)
+    response = {'10': {'success': True, 'data': {'name': 'Game'}}}
+
+    assert parse_app_details(response, 10, BasicData, logger_mock) is None
+    assert parse_app_details({'10': {'success': True}}, 10, BasicData, logger_mock) is None
+    assert parse_app_details({'10': {'success': False}}, 10, BasicData, logger_mock) is None
+    assert logger_mock.warning.call_count == 2
+
+
+def test_if_game_has_few_screenshots():
+    """
+    У игры может быть меньше трех скриншотов
+    """
+    response = {'10': {'success': True, 'data': {
+        'screenshots': [{'id': 0, 'path_thumbnail': 'thumb', 'path_full': 'full'}],
+        'developers': ['Dev'],
+    }}}
+
+    media_data = parse_app_details(response, 10, MediaData, Mock(spec=logging.Logger))
+
+    assert [screenshot.path_full for screenshot in media_data.screenshots] == ['full']
+    assert media_data.developers == ['Dev']
@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+
+import aiosqlite
+import pytest
+
+from db import Storage, create_schema
+
+
+INSERT_SQL = """
+INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status) VALUES (?, ?, ?, ?)
+"""
+
+
+@pytest.mark.asyncio
+async def test_if_concurrent_writes_are_committed(tmp_path):
+    """
+    Одновременные команды записи должны закоммититься, а читатели из пула
+    должны видеть закоммиченные данные
+    """
+    storage = await Storage.open(str(tmp_path / "posts.db"), 2)
+
+    await asyncio.gather(*(
+        storage.execute(INSERT_SQL, (app_id, 10, 100.0, 1))
+        for app_id in range(1, 51)
+    ))
+
+    row = await storage.fetchone("SELECT COUNT(*) FROM steam_apps_info")
+    assert row[0] == 50
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_one_command_fails():
+    """
+    Упавшая команда откатывается целиком и не мешает остальным командам пачки
+    """
+    storage = await Storage.open(":memory:")
+
+    ok_insert = storage.execute(INSERT_SQL, (1, 10, 100.0, 1))
+    failing_batch = storage.execute_batch([
+        (INSERT_SQL, (2, 10, 100.0, 1)),
+        (INSERT_SQL, (1, 10, 100.0, 1)),
+    ])
+
+    results = await asyncio.gather(ok_insert, failing_batch, return_exceptions=True)
+
+    assert results[0] is None
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    rows = await storage.fetchall("SELECT app_id FROM steam_apps_info")
+    assert rows == [(1, )]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_readers_are_read_only(tmp_path):
+    """
+    Соединения из пула читателей не должны уметь писать в базу
+    """
+    storage = await Storage.open(str(tmp_path / "posts.db"), 1)
+
+    async with storage.read() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            await conn.execute(INSERT_SQL, (1, 10, 100.0, 1))
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_old_schema_gets_checked_at(tmp_path):
+    """
+    База прошлой версии получает checked_at, и записи считаются проверенными в момент последнего изменения
+    """
+    db = await aiosqlite.connect(str(tmp_path / "posts.db"))
+    await db.execute("""
+    CREATE TABLE steam_apps_info (
+        app_id INTEGER PRIMARY KEY,
+        discount_percent INTEGER NOT NULL,
+        init_price REAL NOT NULL,
+        status INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP NOT NULL
+    )
+    """)
+    await db.execute("""
+    CREATE TABLE steam_apps_archive (
+        app_id INTEGER PRIMARY KEY,
+        discount_percent INTEGER NOT NULL,
+        init_price REAL NOT NULL,
+        status INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    await db.execute("INSERT INTO steam_apps_info VALUES (1, 10, 100.0, 0, '2025-01-01 00:00:00')")
+    await db.execute("INSERT INTO steam_apps_archive VALUES (2, 0, 100.0, 0, '2024-01-01 00:00:00', '2025-02-01 00:00:00')")
+    await db.commit()
+
+    await create_schema(db)
+    await create_schema(db)
+
+    async with db.execute("SELECT updated_at, checked_at FROM steam_apps_info") as c:
+        assert await c.fetchall() == [("2025-01-01 00:00:00", "2025-01-01 00:00:00")]
+    async with db.execute("SELECT updated_at, checked_at FROM steam_apps_archive") as c:
+        assert await c.fetchall() == [("2024-01-01 00:00:00", "2024-01-01 00:00:00")]
+    await db.close()
@@ -0,0 +1,188 @@
+import datetime
+import logging
+from unittest.mock import AsyncMock, Mock
+
+import aiosqlite
+import pytest
+from aiogram import Bot
+from steam_web_api import Steam
+
+import usecases
+from db import Storage, create_schema
+from job_control import JobControl
+from translation import source_hash
+
+
+async def setup_in_memory_db():
+    db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
+
+    return db, await Storage.from_connection(db)
+
+
+def steam_with_descriptions():
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country, filters=None):
+        return {str(app_id): {'success': True, 'data': {
+            'name': f'Game {app_id}', 'short_description': f'Description {app_id}',
+            'header_image': f'https://cover/{app_id}', 'screenshots': [], 'developers': ['Studio'],
+        }}}
+
+    steam_mock.apps.get_app_details.side_effect = side_effect
+    return steam_mock
+
+
+class UpperTranslator:
+    def __init__(self):
+        self.batches = []
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        self.batches.append(texts)
+        return [text.upper() for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_if_descriptions_are_translated_in_one_batch():
+    """
+    Описания ближайших постов переводятся одним вызовом переводчика и сохраняются
+    в кэш по app_id и хэшу исходного текста. Следующий запуск их не переводит
+    """
+    db, storage = await setup_in_memory_db()
+    await db.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status) VALUES (?, ?, ?, ?)",
+        [
+            (10, 20, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (20, 50, 2000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (30, 10, 3000.0, usecases.PostStatus.PUBLISHED.value),
+        ]
+    )
+    await db.commit()
+    translator = UpperTranslator()
+    logger_mock = Mock(spec=logging.Logger)
+
+    await usecases.translate_upcoming_descriptions(storage, steam_with_descriptions(), translator, logger_mock)
+    await usecases.translate_upcoming_descriptions(storage, steam_with_descriptions(), translator, logger_mock)
+
+    assert translator.batches == [['Description 10', 'Description 20']]
+    async with db.execute("SELECT app_id, source_hash, translated_text FROM translations ORDER BY app_id") as c:
+        assert await c.fetchall() == [
+            (10, source_hash('Description 10'), 'DESCRIPTION 10'),
+            (20, source_hash('Description 20'), 'DESCRIPTION 20'),
+        ]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_post_uses_cached_translation():
+    """
+    Пост публикуется с переводом из кэша. Игра, которая снова попала в очередь
+    после смены цены, публикуется с тем же переводом без вызова переводчика
+    """
+    db, storage = await setup_in_memory_db()
+    await db.execute(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status) VALUES (?, ?, ?, ?)",
+        (10, 20, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value)
+    )
+    await db.commit()
+    translator = UpperTranslator()
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = steam_with_descriptions()
+    bot_mock = AsyncMock(spec=Bot)
+
+    await usecases.translate_upcoming_descriptions(storage, steam_mock, translator, logger_mock)
+    await usecases.publish_steam_post(storage, steam_mock, bot_mock, -1, logger_mock, control=JobControl.until(60))
+
+    await storage.execute(usecases.UPDATE_APP_PRICE_SQL, (900.0, 30, usecases.PostStatus.PENDING_PUBLISH.value, 10))
+    await usecases.translate_upcoming_descriptions(storage, steam_mock, translator, logger_mock)
+    # Следующий пост разрешен не раньше чем через 45 минут
+    later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=3)
+    await usecases.publish_steam_post(storage, steam_mock, bot_mock, -1, logger_mock, control=JobControl.until(60),
+                                      clock=lambda: later)
+
+    assert len(translator.batches) == 1
+    captions = [call.kwargs["media"][0].caption for call in bot_mock.send_media_group.await_args_list]
+    assert len(captions) == 2
+    assert all('DESCRIPTION 10' in caption for caption in captions)
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_translation_looks_ahead_only_batch_size():
+    """
+    Переводятся только игры среди batch_size ближайших постов. Если у них переводы уже есть,
+    запуск не идет глубже в очередь и ничего не запрашивает у Steam
+    """
+    db, storage = await setup_in_memory_db()
+    await db.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [
+            (app_id, 20, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value, f"2025-01-0{app_id // 10} 00:00:00")
+            for app_id in (10, 20, 30, 40)
+        ]
+    )
+    await db.commit()
+    translator = UpperTranslator()
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = steam_with_descriptions()
+
+    for _ in range(3):
+        await usecases.translate_upcoming_descriptions(storage, steam_mock, translator, logger_mock, batch_size=2)
+
+    assert translator.batches == [['Description 10', 'Description 20']]
+    assert steam_mock.apps.get_app_details.call_count == 2
+
+    # Первая игра опубликована: окно сдвигается на одну игру
+    await storage.execute(usecases.UPDATE_STATUS_SQL, (usecases.PostStatus.PUBLISHED.value, 10))
+    await usecases.translate_upcoming_descriptions(storage, steam_mock, translator, logger_mock, batch_size=2)
+
+    assert translator.batches == [['Description 10', 'Description 20'], ['Description 30']]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_changed_description_is_translated_again():
+    """
+    Запись, изменившаяся после перевода, проверяется заново: новое описание переводится,
+    а прежнее описание после смены цены берется из кэша без вызова переводчика
+    """
+    db, storage = await setup_in_memory_db()
+    await db.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status) VALUES (?, ?, ?, ?)",
+        [
+            (10, 20, 1000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+            (20, 50, 2000.0, usecases.PostStatus.PENDING_PUBLISH.value),
+        ]
+    )
+    await db.commit()
+    translator = UpperTranslator()
+    logger_mock = Mock(spec=logging.Logger)
+    descriptions = {10: 'Description 10', 20: 'Description 20'}
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country, filters=None):
+        return {str(app_id): {'success': True, 'data': {
+            'name': f'Game {app_id}', 'short_description': descriptions[app_id],
+            'header_image': f'https://cover/{app_id}', 'screenshots': [], 'developers': ['Studio'],
+        }}}
+    steam_mock.apps.get_app_details.side_effect = side_effect
+
+    await usecases.translate_upcoming_descriptions(storage, steam_mock, translator, logger_mock)
+
+    # Обе игры изменились после перевода, но описание поменялось только у первой
+    descriptions[10] = 'New description 10'
+    await storage.execute("UPDATE translations SET created_at = datetime('now', '-1 minute')")
+    await storage.execute("UPDATE steam_apps_info SET updated_at = datetime('now')")
+    await usecases.translate_upcoming_descriptions(storage, steam_mock, translator, logger_mock)
+    await usecases.translate_upcoming_descriptions(storage, steam_mock, translator, logger_mock)
+
+    assert translator.batches == [['Description 10', 'Description 20'], ['New description 10']]
+    assert steam_mock.apps.get_app_details.call_count == 4
+    async with db.execute(
+            "SELECT app_id, translated_text FROM translations WHERE source_hash IN (?, ?) ORDER BY app_id",
+            (source_hash('New description 10'), source_hash('Description 20'))
+    ) as c:
+        assert await c.fetchall() == [(10, 'NEW DESCRIPTION 10'), (20, 'DESCRIPTION 20')]
+
+    await storage.close()
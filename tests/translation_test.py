@@ -0,0 +1,19 @@
+import pytest
+
+from translation import load_translator
+
+
+class EchoTranslator:
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        return texts
+
+
+def test_if_custom_backend_is_loaded_by_path():
+    """
+    Свой бэкенд подключается путем "модуль:фабрика", пустое имя отключает перевод
+    """
+    assert isinstance(load_translator(f"{__name__}:EchoTranslator"), EchoTranslator)
+    assert load_translator("") is None
+
+    with pytest.raises(ValueError):
+        load_translator("unknown")
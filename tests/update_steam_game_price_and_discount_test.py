@@ -11,23 +11,14 @@ import aiosqlite
 import pytest
 
 import usecases
+from db import Storage, create_schema
 
 
 async def setup_in_memory_db():
     db = await aiosqlite.connect(":memory:")
+    await create_schema(db)
 
-    await db.execute("""
-    CREATE TABLE IF NOT EXISTS steam_apps_info (
-        app_id INTEGER PRIMARY KEY,
-        discount_percent INTEGER NOT NULL,
-        init_price REAL NOT NULL,
-        status INTEGER NOT NULL,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP NOT NULL
-    )
-    """)
-    await db.commit()
-
-    return db
+    return db, await Storage.from_connection(db)
 
 
 
@@ -38,7 +29,7 @@ async def test_if_init_price_has_changed():
     """
 
     # Arrange
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
 
     expected_id = 1
     old_init_price = 2500.0
@@ -83,7 +74,7 @@ async def test_if_init_price_has_changed():
 
 
     # Act
-    await usecases.update_steam_game_price_and_discount(db, steam_mock, 1, logger_mock)
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 1, logger_mock)
 
     # Assert
     async with db.execute("SELECT * FROM steam_apps_info") as c:
@@ -99,7 +90,7 @@ async def test_if_init_price_has_changed():
         assert usecases.PostStatus.PENDING_PUBLISH.value == usecases.PostStatus(row_info[3]).value
         assert row_info[4] != old_date
 
-    await db.close()
+    await storage.close()
 
 
 
@@ -110,7 +101,7 @@ async def test_if_discount_has_changed():
     """
 
     # Arrange
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
 
     expected_id = 1
     old_init_price = 2500.0
@@ -154,7 +145,7 @@ async def test_if_discount_has_changed():
 
 
     # Act
-    await usecases.update_steam_game_price_and_discount(db, steam_mock, 1, logger_mock)
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 1, logger_mock)
 
     # Assert
     async with db.execute("SELECT * FROM steam_apps_info") as c:
@@ -170,7 +161,7 @@ async def test_if_discount_has_changed():
         assert usecases.PostStatus.PENDING_PUBLISH.value == usecases.PostStatus(info_row[3]).value
         assert info_row[4] != old_date
 
-    await db.close()
+    await storage.close()
 
 
 @pytest.mark.asyncio
@@ -180,7 +171,7 @@ async def test_if_game_has_become_unavailable_in_Russia():
     """
 
     # Arrange
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
 
     id = 1
     init_price = 2500.0
@@ -223,7 +214,7 @@ async def test_if_game_has_become_unavailable_in_Russia():
     steam_mock.apps.get_app_details.side_effect = side_effect
 
     # Act
-    await usecases.update_steam_game_price_and_discount(db, steam_mock, 1, logger_mock)
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 1, logger_mock)
 
     # Assert
     async with db.execute("SELECT * FROM steam_apps_info") as c:
@@ -238,7 +229,7 @@ async def test_if_game_has_become_unavailable_in_Russia():
         assert info_row[3] == old_status
         assert info_row[4] == old_date
 
-    await db.close()
+    await storage.close()
 
 
 
@@ -249,7 +240,7 @@ async def test_if_api_response_format_is_wrong():
     должен пропустить обработку
     """
 
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
     id = 1
     init_price = 2500.0
     discount_percent = 0
@@ -281,12 +272,12 @@ async def test_if_api_response_format_is_wrong():
     steam_api_mock = Mock(spec=Steam)
 
     steam_api_mock.apps.get_app_details.return_value = json_without_id_key
-    await usecases.update_steam_game_price_and_discount(db, steam_api_mock, 2, logger_mock)
+    await usecases.update_steam_game_price_and_discount(storage, steam_api_mock, 2, logger_mock)
 
     steam_api_mock.apps.get_app_details.return_value = json_without_data_key
-    await usecases.update_steam_game_price_and_discount(db, steam_api_mock, 2, logger_mock)
+    await usecases.update_steam_game_price_and_discount(storage, steam_api_mock, 2, logger_mock)
 
-    await db.close()
+    await storage.close()
 
 
 @pytest.mark.asyncio
@@ -296,7 +287,7 @@ async def test_if_api_request_limit_is_exceeded():
     возвращает None. Код должен ожидать 6 минут
     """
 
-    db = await setup_in_memory_db()
+    db, storage = await setup_in_memory_db()
     id = 1
     init_price = 2500.0
     discount_percent = 0
@@ -326,6 +317,155 @@ async def test_if_api_request_limit_is_exceeded():
     steam_api_mock = Mock(spec=Steam)
 
     steam_api_mock.apps.get_app_details.return_value = none_response
-    await usecases.update_steam_game_price_and_discount(db, steam_api_mock, 2, logger_mock,2, 2)
+    await usecases.update_steam_game_price_and_discount(storage, steam_api_mock, 2, logger_mock,2, 2)
+
+    await storage.close()
+
+@pytest.mark.asyncio
+async def test_if_next_run_continues_from_checkpoint():
+    """
+    Следующий запуск должен проверять записи после последней проверенной,
+    даже если у проверенных записей ничего не поменялось
+    """
+    db, storage = await setup_in_memory_db()
+    old_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=31)).strftime("%Y-%m-%d %H:%M:%S")
+    for app_id in (1, 2):
+        await db.execute(
+        """
+        INSERT INTO steam_apps_info (
+            app_id,
+            discount_percent,
+            init_price,
+            status,
+            updated_at
+        ) VALUES (?, ?, ?, ?, ?)
+        """,
+        (app_id, 0, 25.0, usecases.PostStatus.PUBLISHED.value, old_date)
+        )
+    await db.commit()
+
+    requested_ids = []
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country, filters):
+        requested_ids.append(app_id)
+        return {str(app_id): {'success': True, 'data': {'price_overview': {'initial': 2500, 'discount_percent': 0}}}}
+
+    steam_mock.apps.get_app_details.side_effect = side_effect
+
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 1, logger_mock)
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 1, logger_mock)
+
+    assert requested_ids == [1, 2]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_available_again_game_returns_to_queue():
+    """
+    Недоступная игра, которую Steam снова отдает, возвращается в очередь публикации,
+    даже если ее цена не изменилась. Все еще недоступная игра остается UNAVAILABLE
+    """
+    db, storage = await setup_in_memory_db()
+    old_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=31)).strftime("%Y-%m-%d %H:%M:%S")
+    await db.executemany(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [
+            (1, 10, 100.0, usecases.PostStatus.UNAVAILABLE.value, old_date),
+            (2, 10, 100.0, usecases.PostStatus.UNAVAILABLE.value, old_date),
+        ]
+    )
+    await db.commit()
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country, filters):
+        if app_id == 2:
+            return {'2': {'success': False}}
+        return {'1': {'success': True, 'data': {'price_overview': {'initial': 10000, 'discount_percent': 10}}}}
+    steam_mock.apps.get_app_details.side_effect = side_effect
+
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 10, logger_mock)
+
+    async with db.execute(
+            "SELECT app_id, status, updated_at > ?, checked_at > ? FROM steam_apps_info ORDER BY app_id",
+            (old_date, old_date)
+    ) as c:
+        assert await c.fetchall() == [
+            (1, usecases.PostStatus.PENDING_PUBLISH.value, 1, 1),
+            (2, usecases.PostStatus.UNAVAILABLE.value, 0, 1),
+        ]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_unchanged_game_waits_for_next_cooldown():
+    """
+    Игра без изменений цены запоминает время проверки и не проверяется снова в каждом проходе,
+    а updated_at остается временем последнего изменения
+    """
+    db, storage = await setup_in_memory_db()
+    old_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=100)).strftime("%Y-%m-%d %H:%M:%S")
+    await db.execute(
+        "INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at, checked_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (1, 0, 25.0, usecases.PostStatus.PUBLISHED.value, old_date, old_date)
+    )
+    await db.commit()
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    steam_mock.apps.get_app_details.return_value = {
+        '1': {'success': True, 'data': {'price_overview': {'initial': 2500, 'discount_percent': 0}}}
+    }
+
+    for _ in range(3):
+        await usecases.update_steam_game_price_and_discount(storage, steam_mock, 10, logger_mock)
+
+    assert steam_mock.apps.get_app_details.call_count == 1
+    async with db.execute("SELECT updated_at, checked_at > ? FROM steam_apps_info", (old_date, )) as c:
+        assert await c.fetchall() == [(old_date, 1)]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_if_archived_game_returns_on_price_change():
+    """
+    Архивная игра тоже проверяется по сроку: с новой ценой она возвращается из архива в очередь публикации,
+    а без изменений остается в архиве до следующей проверки
+    """
+    db, storage = await setup_in_memory_db()
+    old_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=400)).strftime("%Y-%m-%d %H:%M:%S")
+    check_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=31)).strftime("%Y-%m-%d %H:%M:%S")
+    await db.executemany(
+        "INSERT INTO steam_apps_archive (app_id, discount_percent, init_price, status, updated_at, checked_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (1, 0, 25.0, usecases.PostStatus.PUBLISHED.value, old_date, check_date),
+            (2, 0, 25.0, usecases.PostStatus.PUBLISHED.value, old_date, check_date),
+        ]
+    )
+    await db.commit()
+
+    logger_mock = Mock(spec=logging.Logger)
+    steam_mock = Mock(spec=Steam)
+    def side_effect(app_id, country, filters):
+        discount_percent = 50 if app_id == 1 else 0
+        return {str(app_id): {'success': True, 'data': {'price_overview': {'initial': 2500, 'discount_percent': discount_percent}}}}
+    steam_mock.apps.get_app_details.side_effect = side_effect
+
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 10, logger_mock)
+
+    async with db.execute("SELECT app_id, discount_percent, init_price, status FROM steam_apps_info") as c:
+        assert await c.fetchall() == [(1, 50, 25.0, usecases.PostStatus.PENDING_PUBLISH.value)]
+    async with db.execute("SELECT app_id, updated_at, checked_at > ? FROM steam_apps_archive", (check_date, )) as c:
+        assert await c.fetchall() == [(2, old_date, 1)]
+
+    # Проверенная архивная игра ждет следующего срока, как и опубликованная
+    await usecases.update_steam_game_price_and_discount(storage, steam_mock, 10, logger_mock)
+    assert steam_mock.apps.get_app_details.call_count == 2
 
-    await db.close()
\ No newline at end of file
+    await storage.close()
@@ -0,0 +1,88 @@
+import hashlib
+import importlib
+from typing import Protocol
+
+# Язык, на который переводятся описания игр
+TARGET_LANGUAGE = "ru"
+
+SELECT_TRANSLATION_SQL = """
+SELECT translated_text FROM translations WHERE app_id = ? AND source_hash = ?
+"""
+
+# Сохранение уже известного перевода только отмечает, что он актуален для текущей записи игры
+SAVE_TRANSLATION_SQL = """
+INSERT INTO translations (app_id, source_hash, translated_text) VALUES (?, ?, ?)
+ON CONFLICT(app_id, source_hash) DO UPDATE SET
+    translated_text = excluded.translated_text,
+    created_at = CURRENT_TIMESTAMP
+"""
+
+# Ближайшие посты в порядке usecases.SELECT_NEXT_POST_TEMPLATE и по тому же индексу с признаком, есть ли
+# у игры перевод, сохраненный не раньше последнего изменения записи. Переводятся только посты из этого окна,
+# поэтому переведенное начало очереди не заставляет переводить игры все глубже в очереди.
+# {publishable} - условие правил публикации (см. rules.PublishRules). После изменения записи описание
+# игры могло измениться, поэтому оно запрашивается снова, а переводчик вызывается, только если
+# перевода для его хэша еще нет
+SELECT_UPCOMING_TEMPLATE = """
+SELECT app_id, EXISTS (
+    SELECT 1 FROM translations
+    WHERE translations.app_id = steam_apps_info.app_id AND translations.created_at >= steam_apps_info.updated_at
+)
+FROM steam_apps_info INDEXED BY steam_apps_info_status_and_updated_at
+WHERE status = ? AND {publishable}
+ORDER BY updated_at, app_id
+LIMIT ?
+"""
+
+
+class Translator(Protocol):
+    """
+    Локальный переводчик. translate_batch вызывается в отдельном потоке, поэтому может быть
+    синхронным и долгим. Возвращает переводы в том же порядке, что и texts
+    """
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        ...
+
+
+class ArgosTranslator:
+    """
+    Офлайн перевод через argostranslate. Пакет перевода en -> ru должен быть установлен заранее:
+    argospm install translate-en_ru
+    """
+
+    def __init__(self, source_language: str = "en", target_language: str = TARGET_LANGUAGE):
+        try:
+            from argostranslate import translate
+        except ImportError as e:
+            raise RuntimeError("TRANSLATION_BACKEND=argos requires argostranslate: pip install argostranslate") from e
+
+        self._translation = translate.get_translation_from_codes(source_language, target_language)
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        return [self._translation.translate(text) for text in texts]
+
+
+BACKENDS = {
+    "argos": ArgosTranslator,
+}
+
+
+def load_translator(backend: str) -> Translator | None:
+    """
+    Создает переводчик по имени из BACKENDS или по пути "модуль:фабрика" к своему бэкенду.
+    Пустое имя - перевод отключен
+    """
+    if not backend:
+        return None
+    if backend in BACKENDS:
+        return BACKENDS[backend]()
+
+    module_name, _, factory_name = backend.partition(":")
+    if not factory_name:
+        raise ValueError(f"Unknown translation backend {backend!r}. Use one of {sorted(BACKENDS)} or 'module:factory'")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+def source_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
@@ -1,311 +1,935 @@
 import asyncio
+import datetime
 import html
+import json
 import logging
+from contextlib import asynccontextmanager
 from enum import Enum
 from random import Random
+from typing import Callable
 
-import aiosqlite
 from aiogram import Bot
 from aiogram.types import InputMediaPhoto
 from steam_web_api import Steam
 
-from db import db_lock
+import diagnostics
+from counter_file import read_counter, write_counter
+from db import SAVE_CHECKPOINT_SQL, Storage
+from id_density import BACKFILL_SHARE, SAVE_ID_SPACE_STATS_SQL, IdDensityModel
+from job_control import JobControl
+from steam_client import coalescer_for
+from rules import PublishRules
+from translation import (SAVE_TRANSLATION_SQL, SELECT_TRANSLATION_SQL, SELECT_UPCOMING_TEMPLATE,
+                         Translator, source_hash)
+from steam_models import AppDetailsFormatError, BasicData, MediaData, PriceData, parse_app_details
 
 
 class PostStatus(Enum):
     PUBLISHED = 0
     PENDING_PUBLISH = 1
+    # Steam не отдает данные игры: снята с продажи, закрыта в России или ответ не проходит валидацию.
+    # Такие записи не публикуются, обновление цен проверяет их снова по сроку правил
+    UNAVAILABLE = 2
+    # Игра ждет публикации, но правила публикации ее не пропускают: например, сейчас без скидки.
+    # Отдельный статус держит такие записи вне очереди PENDING_PUBLISH, поэтому выборка следующего
+    # поста не перебирает их. Обновление цен проверяет их по сроку правил и возвращает в очередь
+    BLOCKED = 3
+
+INSERT_APP_INFO_SQL = """
+INSERT INTO steam_apps_info (
+    app_id,
+    discount_percent,
+    init_price,
+    status,
+    checked_at
+) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(app_id) DO NOTHING
+"""
+
+# Последняя проверенная запись (checked_at, app_id) в текущем проходе обновления цен опубликованных записей
+REFRESH_CURSOR_CHECKPOINT = "refresh_cursor"
+# То же для записей steam_apps_archive
+ARCHIVE_REFRESH_CURSOR_CHECKPOINT = "archive_refresh_cursor"
+# То же для записей BLOCKED
+BLOCKED_REFRESH_CURSOR_CHECKPOINT = "pending_refresh_cursor"
+# То же для записей UNAVAILABLE
+UNAVAILABLE_REFRESH_CURSOR_CHECKPOINT = "unavailable_refresh_cursor"
+# Последний проверенный app_id поиска игр. Пишется одной транзакцией с найденными играми, поэтому
+# не отстает от базы, даже если процесс убили до записи counter.txt
+DISCOVERY_COUNTER_CHECKPOINT = "discovery_counter"
+# app_id игр, пост с которыми отправляется в Telegram, но еще не помечен PUBLISHED
+PUBLISH_IN_FLIGHT_CHECKPOINT = "publish_in_flight"
+# Время (ISO 8601), раньше которого нельзя отправлять следующий пост или дайджест
+NEXT_POST_AT_CHECKPOINT = "next_post_at"
+# Пауза между постами в секундах: от 45 мин до 2 часов
+POST_PERIOD_RANGE = (2700, 7200)
+
+# Правила по умолчанию пропускают в публикацию все записи
+DEFAULT_RULES = PublishRules()
+
+# Шаблоны ниже дополняются условиями из PublishRules: {refreshable}, {publishable}
+
+# Записи проверяются от самых давно проверенных, в порядке индекса (status, checked_at),
+# поэтому выборка не сканирует таблицу и не сортирует ее
+SELECT_ROWS_TO_REFRESH_TEMPLATE = """
+SELECT app_id, discount_percent, init_price, checked_at FROM steam_apps_info
+WHERE status = ? AND {refreshable} AND (checked_at, app_id) > (?, ?)
+ORDER BY checked_at, app_id
+LIMIT ?
+"""
+
+# Архив проверяется так же, в порядке индекса по checked_at
+SELECT_ARCHIVED_ROWS_TO_REFRESH_TEMPLATE = """
+SELECT app_id, discount_percent, init_price, checked_at FROM steam_apps_archive
+WHERE {refreshable} AND (checked_at, app_id) > (?, ?)
+ORDER BY checked_at, app_id
+LIMIT ?
+"""
+
+UPDATE_APP_PRICE_SQL = """
+UPDATE steam_apps_info
+SET
+    init_price = ?,
+    discount_percent = ?,
+    status = ?,
+    updated_at = CURRENT_TIMESTAMP,
+    checked_at = CURRENT_TIMESTAMP
+WHERE app_id = ?
+"""
+
+# Игра проверена, но ничего не изменилось: следующая проверка - через срок правил от этой
+MARK_CHECKED_SQL = """
+UPDATE steam_apps_info
+SET
+    checked_at = CURRENT_TIMESTAMP
+WHERE app_id = ?
+"""
+
+MARK_ARCHIVED_CHECKED_SQL = """
+UPDATE steam_apps_archive
+SET
+    checked_at = CURRENT_TIMESTAMP
+WHERE app_id = ?
+"""
+
+# Цена архивной игры изменилась: запись возвращается в steam_apps_info с новой ценой и уходит из архива
+RESTORE_ARCHIVED_SQL = """
+INSERT INTO steam_apps_info (app_id, discount_percent, init_price, status, updated_at, checked_at)
+VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+ON CONFLICT(app_id) DO UPDATE SET
+    discount_percent = excluded.discount_percent,
+    init_price = excluded.init_price,
+    status = excluded.status,
+    updated_at = excluded.updated_at,
+    checked_at = excluded.checked_at
+"""
+
+DELETE_RESTORED_SQL = "DELETE FROM steam_apps_archive WHERE app_id = ?"
+
+# С условием на скидку планировщик выбирает индекс по скидке и сортирует всю очередь по updated_at.
+# Очередь идет в порядке индекса (status, updated_at). Записи, которые правила не пропускают, лежат
+# под статусом BLOCKED, поэтому выборка останавливается на первой же записи. Условие правил - на случай
+# записей, которые еще не разложены по статусам (см. apply_publish_rules)
+SELECT_NEXT_POST_TEMPLATE = """
+SELECT app_id, discount_percent, init_price FROM steam_apps_info INDEXED BY steam_apps_info_status_and_updated_at
+WHERE status = ? AND {publishable}
+ORDER BY updated_at, app_id
+LIMIT 1
+"""
+
+# Telegram не принимает в альбоме больше 10 фото
+SELECT_DIGEST_TEMPLATE = """
+SELECT app_id, discount_percent, init_price FROM steam_apps_info
+WHERE status = ? AND discount_percent > 0 AND {publishable}
+ORDER BY discount_percent DESC, init_price DESC
+LIMIT ?
+"""
+
+# В архив уходят опубликованные записи, цена которых не менялась с ?2, если это подтвердила
+# проверка после ?2. Запись, которую с тех пор не проверяли, остается: ее цена могла измениться
+# Унарный плюс оставляет поиск по индексу status, updated_at: под границу updated_at попадает малая
+# часть каталога, а под checked_at > ?2 - почти весь
+COUNT_ARCHIVABLE_SQL = """
+SELECT COUNT(*) FROM steam_apps_info
+WHERE status = ?1 AND updated_at <= ?2 AND +checked_at > ?2
+"""
+
+ARCHIVE_PUBLISHED_SQL = """
+INSERT OR REPLACE INTO steam_apps_archive (app_id, discount_percent, init_price, status, updated_at, checked_at)
+SELECT app_id, discount_percent, init_price, status, updated_at, checked_at FROM steam_apps_info
+WHERE status = ?1 AND updated_at <= ?2 AND +checked_at > ?2
+"""
+
+DELETE_ARCHIVED_SQL = """
+DELETE FROM steam_apps_info
+WHERE status = ?1 AND updated_at <= ?2 AND +checked_at > ?2
+"""
+
+# Записи PENDING_PUBLISH, которые правила не пропускают, уходят в BLOCKED. Выполняется после каждой
+# записи, которая ставит PENDING_PUBLISH: условие правил вычисляется по уже записанной цене
+BLOCK_REJECTED_TEMPLATE = """
+UPDATE steam_apps_info
+SET
+    status = ?
+WHERE app_id = ? AND status = ? AND NOT ({publishable})
+"""
+
+# Раскладка всей очереди по статусам при запуске бота: правила могли измениться с прошлого запуска
+UNBLOCK_PUBLISHABLE_TEMPLATE = """
+UPDATE steam_apps_info
+SET
+    status = ?
+WHERE status = ? AND {publishable}
+"""
+
+BLOCK_ALL_REJECTED_TEMPLATE = """
+UPDATE steam_apps_info
+SET
+    status = ?
+WHERE status = ? AND NOT ({publishable})
+"""
+
+UPDATE_STATUS_SQL = """
+UPDATE steam_apps_info
+SET
+    status = ?
+WHERE app_id = ?
+"""
+
+# Запись уходит из очереди публикации, следующая проверка - через срок правил
+MARK_UNAVAILABLE_SQL = """
+UPDATE steam_apps_info
+SET
+    status = ?,
+    updated_at = CURRENT_TIMESTAMP,
+    checked_at = CURRENT_TIMESTAMP
+WHERE app_id = ?
+"""
+
+DIGEST_MAX_GAMES = 10
+DIGEST_CAPTION_LIMIT = 1024
+DIGEST_HEADER = "<b>🔥 Скидки в Steam</b>\n\n"
+
+
+async def _request_app_details(
+        steam: Steam, app_id: int, filters: str | None, logger: logging.Logger,
+        control: JobControl, retry_request_period: int, retry_attempts: int
+        ) -> dict | None:
+    """
+    Запрашивает appdetails, при превышении лимита Steam API ждет и повторяет запрос.
+    Одновременные запросы к той же игре объединяются в один (см. steam_client).
+    Возвращает None, если попытки закончились или юзкейс должен остановиться
+    """
+    coalescer = coalescer_for(steam)
+    for attempt in range(1, retry_attempts + 1):
+        with diagnostics.phase(diagnostics.STEAM_WAIT):
+            response = await coalescer.get_app_details(app_id, "RU", filters)
+
+        if response is not None:
+            return response
+
+        if attempt == retry_attempts:
+            logger.error(f"Retry attempts for app_id={app_id} exceeded. Task will be delayed")
+            return None
+
+        logger.info(f"Steam API request limit reached. Waiting for {int(retry_request_period / 60)} minutes. Retry attempt: {attempt}")
+        with diagnostics.phase(diagnostics.RATE_LIMIT_SLEEP):
+            slept = await control.sleep(retry_request_period)
+        if not slept:
+            logger.info("Job deadline reached or job was cancelled while waiting for Steam API. Task will be delayed")
+            return None
+
+    return None
+
+
+async def _mark_unavailable(storage: Storage, app_id: int, logger: logging.Logger):
+    await storage.execute(MARK_UNAVAILABLE_SQL, (PostStatus.UNAVAILABLE.value, app_id))
+    logger.info("Game with app_id=%s is unavailable. It's removed from the publishing queue", app_id)
+
+
+def _block_rejected(rules: PublishRules, app_ids: list[int]) -> list[tuple[str, tuple]]:
+    """
+    Выражения, которые переводят только что записанные PENDING_PUBLISH записи в BLOCKED,
+    если правила их не пропускают
+    """
+    publishable = rules.publish_predicate()
+    if publishable == "1":
+        return []
+    block_rejected_sql = BLOCK_REJECTED_TEMPLATE.format(publishable=publishable)
+    return [
+        (block_rejected_sql, (PostStatus.BLOCKED.value, app_id, PostStatus.PENDING_PUBLISH.value))
+        for app_id in app_ids
+    ]
+
+
+async def apply_publish_rules(storage: Storage, logger: logging.Logger, rules: PublishRules | None = None):
+    """
+    Раскладывает очередь публикации по статусам по текущим правилам: записи BLOCKED, которые правила
+    теперь пропускают, возвращаются в PENDING_PUBLISH, а непропускаемые PENDING_PUBLISH уходят в BLOCKED.
+    Вызывается при запуске бота, дальше статус ставится при каждой записи
+    """
+    publishable = (rules or DEFAULT_RULES).publish_predicate()
+    statements = [(UNBLOCK_PUBLISHABLE_TEMPLATE.format(publishable=publishable),
+                   (PostStatus.PENDING_PUBLISH.value, PostStatus.BLOCKED.value))]
+    if publishable != "1":
+        statements.append((BLOCK_ALL_REJECTED_TEMPLATE.format(publishable=publishable),
+                           (PostStatus.BLOCKED.value, PostStatus.PENDING_PUBLISH.value)))
+    await storage.execute_batch(statements)
+    logger.info("Publishing queue is sorted by the publish rules")
+
+
+async def _save_found_games(
+        storage: Storage, rows: list[tuple], density: IdDensityModel, last_checked_id: int, rules: PublishRules
+        ) -> int:
+    """
+    Сохраняет найденные игры, статистику попаданий, пропущенные app_id и последний проверенный
+    app_id одной транзакцией
+    """
+    density.skip_through(last_checked_id)
+    statements = [(INSERT_APP_INFO_SQL, row) for row in rows]
+    statements += _block_rejected(rules, [row[0] for row in rows])
+    statements += [(SAVE_ID_SPACE_STATS_SQL, stats) for stats in density.take_unsaved()]
+    statements += density.take_range_changes()
+    statements.append((SAVE_CHECKPOINT_SQL, (DISCOVERY_COUNTER_CHECKPOINT, str(last_checked_id))))
+    await storage.execute_batch(statements)
+    return len(rows)
 
 
+def _save_counter(counter_path: str, value: int, logger: logging.Logger):
+    write_counter(counter_path, value)
+    logger.info("Counter is updated with value=%s", value)
+
 
 async def find_steam_ids(
-        db: aiosqlite.Connection, steam: Steam,
+        storage: Storage, steam: Steam,
         steam_request_limit: int, logger: logging.Logger, retry_request_period: int = 420,
-        retry_attempts: int = 3
+        retry_attempts: int = 3, control: JobControl | None = None,
+        counter_path: str = "counter.txt", rules: PublishRules | None = None
         ):
     """
     Проверяет, существует ли игра c предположительным app_id. Если да - сохраняет
-    этот app_id, цену игры, скидку на нее в базу
+    этот app_id, цену игры, скидку на нее в базу.
+    Какие app_id проверять, решает IdDensityModel по статистике прошлых запусков: app_id
+    из пустых диапазонов пропускаются, кроме небольшой случайной выборки. Пропущенные app_id
+    сохраняются, и BACKFILL_SHARE лимита каждый запуск тратит на самые перспективные из них.
+    Каждые BATCH_SIZE проверенных app_id сохраняет найденные игры и счетчик, поэтому
+    прерванный запуск продолжается со следующего непроверенного app_id. Счетчик хранится
+    в counter_path и в job_checkpoints, запуск продолжается с большего из них.
+    Найденные игры, которые правила rules не пропускают в публикацию, сохраняются со статусом BLOCKED
     """
     
     BATCH_SIZE = 30
+    control = control or JobControl()
+    rules = rules or DEFAULT_RULES
 
     # Храню счетчик возможных айдишников в файле. Между перезапусками он не должн теряться
-    try:
-        with open("counter.txt", "r") as f:
-            start_value = int(f.read())
-    except FileNotFoundError:
+    file_counter = read_counter(counter_path)
+    checkpoint_counter = await storage.get_checkpoint(DISCOVERY_COUNTER_CHECKPOINT)
+    if file_counter is None and checkpoint_counter is None:
         logger.error("Could not load app id counter. File doesn't exist")
         return
+    counters = [int(checkpoint_counter)] if checkpoint_counter is not None else []
+    if file_counter is not None:
+        counters.append(file_counter)
+    start_value = max(counters)
 
     logger.info("Start finding steam ids from start_value=%s", start_value + 1)
-    
-    async with db_lock:
-        insert_count = 0
-        for possible_app_id in range(start_value + 1, start_value + steam_request_limit + 1):
-            for attempt in range(1, retry_attempts + 1):
-                response = steam.apps.get_app_details(possible_app_id, country="RU", filters="price_overview")
-
-                if response is None:
-                    if attempt != retry_attempts:
-                        logger.info(f"Steam API request limit reached. Waiting for {int(retry_request_period / 60)} minutes. Retry attempt: {attempt}")
-                        await asyncio.sleep(retry_request_period)
-                    else:
-                        logger.error(f"Retry attempts for app_id={possible_app_id} exceeded. Task will be delayed")
-                        return
-                    continue
-
-                break
-
-
-            if str(possible_app_id) not in response:
-                logger.error("The response with app_id=%s has no app_id attribute. "
-                             "General response format might have changed", possible_app_id)
-                return
 
-            if "data" not in response[str(possible_app_id)] and response[str(possible_app_id)]["success"] is True:
-                logger.warning(f"The response with app_id=%s has no data attribute. "
-                               f"app_id=%s may have wrong response format or is unavailable in Russia",
-                               possible_app_id, possible_app_id)
+    density = await IdDensityModel.load(storage)
+    backfill_ids = density.plan_backfill(int(steam_request_limit * BACKFILL_SHARE))
+    candidate_ids, last_planned_id = density.plan(start_value, steam_request_limit - len(backfill_ids))
+    if last_planned_id - start_value > len(candidate_ids):
+        logger.info("Density model selected %d of %d app ids up to app_id=%s",
+                    len(candidate_ids), last_planned_id - start_value, last_planned_id)
+    if backfill_ids:
+        logger.info("Revisiting %d of %d previously skipped app ids", len(backfill_ids), density.skipped_count)
+    
+    insert_count = 0
+    pending_rows = []
+    # Если модель пропустила весь диапазон, он пройден сразу
+    last_checked_id = start_value if candidate_ids else last_planned_id
+    # Сначала app_id по порядку, потом пропущенные раньше: счетчик двигают только первые
+    for checked_count, possible_app_id in enumerate(candidate_ids + backfill_ids, 1):
+        if control.should_stop():
+            logger.info("Job deadline reached or job was cancelled. Stop finding steam ids at app_id=%s", possible_app_id)
+            break
+
+        response = await _request_app_details(
+            steam, possible_app_id, "price_overview", logger,
+            control, retry_request_period, retry_attempts
+        )
+        if response is None:
+            break
+
+        try:
+            price_data = parse_app_details(response, possible_app_id, PriceData, logger)
+        except AppDetailsFormatError:
+            break
+
+        density.record(possible_app_id, price_data is not None)
+        if checked_count > len(candidate_ids):
+            density.backfilled(possible_app_id)
+        elif checked_count == len(candidate_ids):
+            # Все выбранные app_id проверены, пропущенные после последнего выбранного тоже считаются пройденными
+            last_checked_id = last_planned_id
+        else:
+            last_checked_id = possible_app_id
+
+        if price_data is not None:
+            logger.info("Successfully found a game with app_id=%s", possible_app_id)
+
+            app_id = possible_app_id
+            if price_data.price_overview is None:
+                logger.info("The game with app_id=%s has no pricing data. It's probably free", possible_app_id)
+            else:
+                pending_rows.append((
+                    app_id, price_data.price_overview.discount_percent,
+                    price_data.price_overview.init_price, PostStatus.PENDING_PUBLISH.value
+                ))
+
+        if checked_count % BATCH_SIZE == 0:
+            if pending_rows:
+                insert_count += await _save_found_games(storage, pending_rows, density, last_checked_id, rules)
+                pending_rows.clear()
+                logger.info("Inserted %d rows into steam_apps_info", insert_count)
+            else:
+                await _save_found_games(storage, [], density, last_checked_id, rules)
+            _save_counter(counter_path, last_checked_id, logger)
+
+    # Коммит остатка, если есть. Выполняется и тогда, когда запуск прервали
+    if pending_rows:
+        insert_count += await _save_found_games(storage, pending_rows, density, last_checked_id, rules)
+        logger.info("Inserted %d rows into steam_apps_info", insert_count)
+    else:
+        await _save_found_games(storage, [], density, last_checked_id, rules)
+
+    # обновляю счетчик до последнего проверенного app_id
+    _save_counter(counter_path, last_checked_id, logger)
+
+
+
+async def _refresh_rows(
+        storage: Storage, steam: Steam, status: PostStatus, rules: PublishRules, checkpoint: str,
+        update_limit: int, logger: logging.Logger, retry_request_period: int,
+        retry_attempts: int, control: JobControl, archived: bool = False
+        ) -> int | None:
+    """
+    Один проход обновления цен по записям со статусом status, срок проверки которых по правилам rules прошел.
+    С archived=True проход идет по steam_apps_archive, и запись с изменившейся ценой возвращается в очередь публикации.
+    Возвращает, сколько записей проверено, или None, если юзкейс должен остановиться
+    """
+    cursor_checked_at, cursor_app_id = json.loads(await storage.get_checkpoint(checkpoint, '["", 0]'))
+    if archived:
+        rows = await storage.fetchall(
+            SELECT_ARCHIVED_ROWS_TO_REFRESH_TEMPLATE.format(refreshable=rules.refresh_predicate()),
+            (cursor_checked_at, cursor_app_id, update_limit)
+        )
+        logger.info("Found %d requiring update archived rows", len(rows))
+    else:
+        rows = await storage.fetchall(
+            SELECT_ROWS_TO_REFRESH_TEMPLATE.format(refreshable=rules.refresh_predicate()),
+            (status.value, cursor_checked_at, cursor_app_id, update_limit)
+        )
+        logger.info("Found %d requiring update rows with status %s", len(rows), status.name)
+
+    for app_id, old_discount_percent, old_init_price, checked_at in rows:
+        if control.should_stop():
+            logger.info("Job deadline reached or job was cancelled. Stop updating posts info at app_id=%s", app_id)
+            return None
+
+        response = await _request_app_details(
+            steam, app_id, "price_overview", logger,
+            control, retry_request_period, retry_attempts
+        )
+        if response is None:
+            return None
+
+        try:
+            price_data = parse_app_details(response, app_id, PriceData, logger)
+        except AppDetailsFormatError:
+            return None
+
+        # Проверка что за это время не запретили игру в России и она не стала бесплатной
+        if price_data is not None and price_data.price_overview is not None:
+            new_discount_percent = price_data.price_overview.discount_percent
+            new_init_price = price_data.price_overview.init_price
+
+            # Снова доступная игра возвращается в очередь публикации, даже если цена не изменилась
+            if (new_init_price != old_init_price or new_discount_percent != old_discount_percent
+                    or status is PostStatus.UNAVAILABLE):
+                if archived:
+                    update = [
+                        (RESTORE_ARCHIVED_SQL, (
+                            app_id, new_discount_percent, new_init_price,
+                            PostStatus.PENDING_PUBLISH.value
+                        )),
+                        (DELETE_RESTORED_SQL, (app_id, )),
+                    ]
+                else:
+                    update = [
+                        (UPDATE_APP_PRICE_SQL, (
+                            new_init_price, new_discount_percent,
+                            PostStatus.PENDING_PUBLISH.value,
+                            app_id
+                        )),
+                    ]
+                # Обновление и прогресс прохода пишутся одной транзакцией
+                await storage.execute_batch([
+                    *update,
+                    *_block_rejected(rules, [app_id]),
+                    (SAVE_CHECKPOINT_SQL, (checkpoint, json.dumps([checked_at, app_id]))),
+                ])
+
+                logger.info("Successfully updated price info of game with app_id=%s", app_id)
                 continue
 
-            if response[str(possible_app_id)]["success"] is True:
-                logger.info("Successfully found a game with app_id=%s", possible_app_id)
-
-                app_id = possible_app_id
-                if not response[str(app_id)]["data"]:
-                    logger.info("The game with app_id=%s has no pricing data. It's probably free", possible_app_id)
-                    continue
-                discount_percent = response[str(app_id)]["data"]["price_overview"]["discount_percent"]
-                initial_price = float(response[str(app_id)]["data"]["price_overview"]["initial"]) / 100
-
-                await db.execute(
-                    """
-                    INSERT INTO steam_apps_info (
-                        app_id,
-                        discount_percent,
-                        init_price,
-                        status
-                    ) VALUES (?, ?, ?, ?)
-                    """,
-                    (
-                        app_id, discount_percent,
-                        initial_price, PostStatus.PENDING_PUBLISH.value
-                    )
-                )
-                insert_count += 1
-                if insert_count % BATCH_SIZE == 0:
-                    logger.info("Inserted %d rows into steam_apps_info", insert_count)
-                    await db.commit()
-
-        # Коммит остатка, если есть
-        if insert_count % BATCH_SIZE != 0:
-            logger.info("Inserted %d rows into steam_apps_info", insert_count)
-            await db.commit()
-
-        # обновляю счетчик
-        with open("counter.txt", "w") as f:
-            f.write(str(start_value + steam_request_limit))
-            logger.info("Counter is updated with value=%s",
-                        start_value + steam_request_limit)
+        # Ничего не изменилось или игра все еще недоступна: updated_at остается временем последнего
+        # изменения, а следующая проверка будет через срок правил от этой
+        await storage.execute_batch([
+            (MARK_ARCHIVED_CHECKED_SQL if archived else MARK_CHECKED_SQL, (app_id, )),
+            (SAVE_CHECKPOINT_SQL, (checkpoint, json.dumps([checked_at, app_id]))),
+        ])
 
+    # Проход по всем устаревшим записям закончен, следующий запуск начнет сначала
+    if len(rows) < update_limit:
+        await storage.save_checkpoint(checkpoint, json.dumps(["", 0]))
+    return len(rows)
 
 
 async def update_steam_game_price_and_discount(
-        db: aiosqlite.Connection, steam: Steam, update_limit: int,
+        storage: Storage, steam: Steam, update_limit: int,
         logger: logging.Logger, retry_request_period: int = 420,
-        retry_attempts: int = 3
+        retry_attempts: int = 3, control: JobControl | None = None,
+        rules: PublishRules | None = None
         ):
     """
-    Берет {update_limit} уже опубликованных записей из базы, которым больше 1 месяца, и проверяет, изменилась ли
-    скидка или цена на эти игры. Если да - обновляет цену и скидку и меняет на статус PENDING_PUBLISH
+    Берет {update_limit} уже опубликованных записей из базы, срок проверки которых по правилам rules
+    прошел (по умолчанию - 30 дней), и проверяет, изменилась ли скидка или цена на эти игры.
+    Если да - обновляет цену и скидку и меняет на статус PENDING_PUBLISH (или BLOCKED, если правила
+    не пропускают новую цену). Остаток лимита уходит на архивные записи (игра с новой ценой возвращается
+    из архива), на записи BLOCKED, затем на записи UNAVAILABLE: если игра снова доступна,
+    она возвращается в очередь публикации.
+    Записи проверяются от самых давно обновленных, последняя проверенная запись сохраняется в job_checkpoints,
+    поэтому следующий запуск продолжает проход, а не проверяет те же записи заново
     """
     
-    async with db_lock:
-        logger.info("Start updating existing posts info...")
-        async with db.execute("""
-        SELECT app_id, discount_percent, init_price FROM steam_apps_info
-        WHERE updated_at <= datetime('now', '-1 month') AND status = ?
-        LIMIT ?
-        """, (PostStatus.PUBLISHED.value, update_limit)) as c:
-            rows = await c.fetchall()
-            logger.info("Found %d requiring update rows", len(rows))
-
-        for app_id, old_discount_percent, old_init_price in rows:
-
-            for attempt in range(1, retry_attempts + 1):
-                response = steam.apps.get_app_details(app_id, country="RU", filters="price_overview")
-
-                if response is None:
-                    if attempt != retry_attempts:
-                        logger.info(f"Steam API request limit reached. Waiting for {int(retry_request_period / 60)} minutes. Retry attempt: {attempt}")
-                        await asyncio.sleep(retry_request_period)
-                    else:
-                        logger.error(f"Retry attempts for app_id={app_id} exceeded. Task will be delayed")
-                        return
-
-                    continue
+    control = control or JobControl()
+    rules = rules or DEFAULT_RULES
+
+    logger.info("Start updating existing posts info...")
+    refresh_passes = [
+        (PostStatus.PUBLISHED, REFRESH_CURSOR_CHECKPOINT, False),
+        (PostStatus.PUBLISHED, ARCHIVE_REFRESH_CURSOR_CHECKPOINT, True),
+        (PostStatus.BLOCKED, BLOCKED_REFRESH_CURSOR_CHECKPOINT, False),
+        (PostStatus.UNAVAILABLE, UNAVAILABLE_REFRESH_CURSOR_CHECKPOINT, False),
+    ]
+
+    remaining_limit = update_limit
+    for status, checkpoint, archived in refresh_passes:
+        if remaining_limit <= 0:
+            return
+
+        checked = await _refresh_rows(
+            storage, steam, status, rules, checkpoint, remaining_limit, logger,
+            retry_request_period, retry_attempts, control, archived
+        )
+        if checked is None:
+            return
+        remaining_limit -= checked
+    
 
-                break
 
 
-            if str(app_id) not in response:
-                logger.error("The response with app_id=%s has no app_id attribute. "
-                             "General response format might have changed", app_id)
-                return
+async def _mark_published(storage: Storage, app_ids: list[int], next_post_at: datetime.datetime | None = None):
+    # Статус, снятие отметки об отправке и время следующего поста пишутся одной транзакцией
+    statements = [(UPDATE_STATUS_SQL, (PostStatus.PUBLISHED.value, app_id)) for app_id in app_ids]
+    statements.append((SAVE_CHECKPOINT_SQL, (PUBLISH_IN_FLIGHT_CHECKPOINT, "[]")))
+    if next_post_at is not None:
+        statements.append((SAVE_CHECKPOINT_SQL, (NEXT_POST_AT_CHECKPOINT, next_post_at.isoformat())))
+    await storage.execute_batch(statements)
 
-            if "data" not in response[str(app_id)] and response[str(app_id)]["success"] is True:
-                logger.warning(f"The response with app_id=%s has no data attribute. "
-                               f"app_id=%s may have wrong response format or is unavailable in Russia",
-                               app_id, app_id)
-                continue
 
-            # Проверка что за это время не запретили игру в России
-            if response[str(app_id)]["success"] is True:
-                new_discount_percent = response[str(app_id)]["data"]["price_overview"]["discount_percent"]
-                new_init_price = float(response[str(app_id)]["data"]["price_overview"]["initial"]) / 100
-
-                if new_init_price != old_init_price or new_discount_percent != old_discount_percent:
-                    await db.execute("""
-                    UPDATE steam_apps_info
-                    SET
-                        init_price = ?,
-                        discount_percent = ?,
-                        status = ?,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE app_id = ?
-                    """, (
-                        new_init_price, new_discount_percent,
-                        PostStatus.PENDING_PUBLISH.value,
-                        app_id
-                    ))
-
-                    await db.commit()
-                    logger.info("Successfully updated price info of game with app_id=%s", app_id)
-    
+@asynccontextmanager
+async def _publishing(storage: Storage, app_ids: list[int], next_post_at: datetime.datetime):
+    """
+    Отмечает игры отправляемыми на время отправки поста и помечает PUBLISHED после нее,
+    запоминая, раньше какого времени нельзя отправлять следующий пост.
+    Если Telegram вернул ошибку, пост не отправлен, и отметка снимается
+    """
+    await storage.save_checkpoint(PUBLISH_IN_FLIGHT_CHECKPOINT, json.dumps(app_ids))
+    try:
+        yield
+    except Exception:
+        await storage.save_checkpoint(PUBLISH_IN_FLIGHT_CHECKPOINT, "[]")
+        raise
+    await _mark_published(storage, app_ids, next_post_at)
+
+
+async def _wait_for_next_post(
+        storage: Storage, control: JobControl, clock: Callable[[], datetime.datetime]
+        ) -> bool:
+    """
+    Ждет времени, с которого разрешен следующий пост. Время хранится в job_checkpoints, поэтому пауза
+    между постами соблюдается и между запусками юзкейса, и после перезапуска бота.
+    Возвращает False, если это время не наступит до дедлайна
+    """
+    next_post_at = await storage.get_checkpoint(NEXT_POST_AT_CHECKPOINT)
+    if next_post_at is None:
+        return True
 
+    wait = (datetime.datetime.fromisoformat(next_post_at) - clock()).total_seconds()
+    return wait <= 0 or await control.sleep(wait)
+
+
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+async def _finish_interrupted_publish(storage: Storage, logger: logging.Logger):
+    """
+    Если прошлый процесс убили между отправкой поста и пометкой PUBLISHED, помечает игры
+    опубликованными. Был ли пост отправлен, узнать нельзя, а повтор поста хуже пропуска:
+    игра снова попадет в публикацию, когда изменится ее цена
+    """
+    app_ids = json.loads(await storage.get_checkpoint(PUBLISH_IN_FLIGHT_CHECKPOINT, "[]"))
+    if app_ids:
+        logger.warning("Publishing of app_ids=%s was interrupted. Marking them as published", app_ids)
+        await _mark_published(storage, app_ids)
 
 
 async def publish_steam_post(
-        db: aiosqlite.Connection, steam: Steam,
+        storage: Storage, steam: Steam,
         bot: Bot, group_chat_id: int, logger: logging.Logger, retry_attempts: int = 3,
-        request_retry_period: int = 420
+        request_retry_period: int = 420, control: JobControl | None = None,
+        rules: PublishRules | None = None, clock: Callable[[], datetime.datetime] = _utc_now
         ):
     """
-    Берет запись из базы со статусом PENDING_PUBLISH и опубликовывает ее через бота в группу с
-    id=group_chat_id.
-    В день отправляет 2-5 постов с переменной разницей отправки от 45 мин до 2 часов
+    Берет запись из базы со статусом PENDING_PUBLISH, которую пропускают правила rules, и опубликовывает
+    ее через бота в группу с id=group_chat_id.
+    За запуск отправляет 2-5 постов с переменной разницей отправки от 45 мин до 2 часов.
+    Если следующий пост не успевает до дедлайна, публикация останавливается, а следующий запуск
+    ничего не отправит раньше времени следующего поста по часам clock.
+    Недоступная в Steam игра помечается UNAVAILABLE, и публикуется следующая запись очереди
     """
     
-    async with (db_lock):
-        rnd = Random()
-        post_limit = rnd.randint(2, 5)
-        for post_number in range(1, post_limit + 1):
-            logger.info("Start publish game sales posts from steam...")
-            async with db.execute("""
-            SELECT app_id, discount_percent, init_price FROM steam_apps_info
-            WHERE status = ?
-            LIMIT 1
-            """, (PostStatus.PENDING_PUBLISH.value, )) as c:
-                row = await c.fetchone()
-                if not row:
-                    logger.info("No games available for publishing")
-                    return
-                app_id, discount_percent, init_price = row
-
-
-            for attempt in range(1, retry_attempts + 1):
-                response = steam.apps.get_app_details(app_id, country="RU")
-
-                # Если превышен лимит обращений к steam API
-                if response is None:
-                    if attempt != retry_attempts:
-                        logger.info(f"Steam API request limit reached. Waiting for {int(request_retry_period / 60)} minutes. Retry attempt: {attempt}")
-                        await asyncio.sleep(request_retry_period)
-                    else:
-                        logger.error(f"Retry attempts for app_id={app_id} exceeded. Task will be delayed")
-                        return
-                    continue
+    control = control or JobControl()
+    await _finish_interrupted_publish(storage, logger)
+    select_next_post_sql = SELECT_NEXT_POST_TEMPLATE.format(publishable=(rules or DEFAULT_RULES).publish_predicate())
+
+    rnd = Random()
+    post_limit = rnd.randint(2, 5)
+    published_count = 0
+    while published_count < post_limit:
+        if control.should_stop():
+            logger.info("Job deadline reached or job was cancelled. Stop publishing posts")
+            return
+
+        if not await _wait_for_next_post(storage, control, clock):
+            logger.info("Next post doesn't fit into the publishing window. Stop publishing posts")
+            return
+
+        logger.info("Start publish game sales posts from steam...")
+        row = await storage.fetchone(select_next_post_sql, (PostStatus.PENDING_PUBLISH.value, ))
+        if not row:
+            logger.info("No games available for publishing")
+            return
+        app_id, discount_percent, init_price = row
+
+
+        # Оба запроса уходят одновременно и объединяются в один запрос к Steam
+        response, screenshot_and_developers_response = await asyncio.gather(
+            _request_app_details(
+                steam, app_id, None, logger,
+                control, request_retry_period, retry_attempts
+            ),
+            _request_app_details(
+                steam, app_id, "screenshots,developers", logger,
+                control, request_retry_period, retry_attempts
+            ),
+        )
+        if response is None or screenshot_and_developers_response is None:
+            return
+
+        try:
+            basic_data = parse_app_details(response, app_id, BasicData, logger)
+        except AppDetailsFormatError:
+            return
+
+        if basic_data is None:
+            await _mark_unavailable(storage, app_id, logger)
+            continue
+
+        game_title = basic_data.name
+
+        # steam_web_api не позволяет указать язык для запроса. Перевод берется только из кэша,
+        # его заранее заполняет translate_upcoming_descriptions. Без перевода публикуется оригинал
+        game_description = basic_data.short_description
+        if game_description:
+            translation = await storage.fetchone(SELECT_TRANSLATION_SQL, (app_id, source_hash(game_description)))
+            if translation is not None:
+                game_description = translation[0]
+            else:
+                logger.info("No cached translation for app_id=%s, publishing original description", app_id)
+        game_cover = basic_data.header_image
+
+
+        try:
+            media_data = parse_app_details(screenshot_and_developers_response, app_id, MediaData, logger)
+        except AppDetailsFormatError:
+            return
+
+        if media_data is None:
+            await _mark_unavailable(storage, app_id, logger)
+            continue
+
+        # У некоторых игр меньше трех скриншотов
+        screenshot_urls = [screenshot.path_full for screenshot in media_data.screenshots[:3]]
+
+        # Иногда больше одного разработчика
+        developers = ", ".join(media_data.developers)
+
+
+        final_price = init_price - init_price * discount_percent / 100
+        post_caption = (
+        f"<b>{html.escape(game_title)}</b>\n\n"
+        f"Разработчики: <i>{html.escape(developers)}</i>\n\n"
+        f"{html.escape(game_description)}\n\n"
+        f"<s>{init_price}</s> <b>{final_price:.2f} ₽</b>\n\n<b>-{discount_percent}% 🔥</b>\n\n" 
+        f"<a href='https://store.steampowered.com/app/{app_id}'>Открыть в Steam</a>"
+        )
+
+        post = [
+            InputMediaPhoto(
+                media=game_cover,
+                caption=post_caption,
+                parse_mode="HTML"
+            )
+        ]
 
-                break
+        for screenshot_url in screenshot_urls:
+            post.append(InputMediaPhoto(media=screenshot_url))
 
-            if str(app_id) not in response:
-                logger.error("The response with app_id=%s has no app_id attribute. "
-                             "General response format might have changed", app_id)
-                return
+        next_post_at = clock() + datetime.timedelta(seconds=rnd.randint(*POST_PERIOD_RANGE))
+        async with _publishing(storage, [app_id], next_post_at):
+            with diagnostics.phase(diagnostics.TELEGRAM_SEND):
+                await bot.send_media_group(
+                    chat_id=group_chat_id,
+                    media=post
+                )
+        logger.info("Successfully published game with app_id=%s", app_id)
+        published_count += 1
+
+    
 
-            if "data" not in response[str(app_id)] and response[str(app_id)]["success"] is True:
-                logger.warning(f"The response with app_id=%s has no data attribute. "
-                               f"app_id=%s may have wrong response format or is unavailable in Russia",
-                               app_id, app_id)
-                return
 
-            game_title = response[str(app_id)]["data"]["name"]
+async def translate_upcoming_descriptions(
+        storage: Storage, steam: Steam, translator: Translator, logger: logging.Logger,
+        batch_size: int = 20, retry_attempts: int = 3, request_retry_period: int = 420,
+        control: JobControl | None = None, rules: PublishRules | None = None
+        ):
+    """
+    Переводит описания игр среди {batch_size} ближайших к публикации, у которых еще нет перевода,
+    одним вызовом переводчика и сохраняет переводы в кэш translations по app_id и хэшу исходного текста.
+    Если у ближайших игр переводы уже есть, запуск ничего не запрашивает.
+    Запускается вне окна публикации, поэтому publish_steam_post только читает готовый перевод.
+    Запись, изменившаяся после перевода, проверяется заново: новое описание переводится,
+    а для прежнего (повторная публикация после смены цены) перевод берется из кэша
+    """
 
-            # Если нужно описание на русском, тогда надо подключать нейронку переводчика. steam_web_api не позволяет указать язык для запроса
-            game_description_eng = response[str(app_id)]["data"]["short_description"]
-            game_cover = response[str(app_id)]["data"]["header_image"]
+    control = control or JobControl()
 
+    upcoming = await storage.fetchall(
+        SELECT_UPCOMING_TEMPLATE.format(publishable=(rules or DEFAULT_RULES).publish_predicate()),
+        (PostStatus.PENDING_PUBLISH.value, batch_size)
+    )
+    rows = [(app_id, ) for app_id, translated in upcoming if not translated]
+    if not rows:
+        return
 
-            for attempt in range(1, retry_attempts + 1):
-                screenshot_and_developers_response = steam.apps.get_app_details(app_id, country="RU", filters="screenshots,developers")
+    logger.info("Start translating descriptions of %d upcoming posts...", len(rows))
+    sources = []
+    for app_id, in rows:
+        if control.should_stop():
+            logger.info("Job deadline reached or job was cancelled. Stop collecting descriptions at app_id=%s", app_id)
+            break
+
+        response = await _request_app_details(
+            steam, app_id, None, logger,
+            control, request_retry_period, retry_attempts
+        )
+        if response is None:
+            break
+
+        try:
+            basic_data = parse_app_details(response, app_id, BasicData, logger)
+        except AppDetailsFormatError:
+            break
+
+        if basic_data is None:
+            await _mark_unavailable(storage, app_id, logger)
+        else:
+            sources.append((app_id, basic_data.short_description))
+
+    if not sources:
+        return
 
-                if screenshot_and_developers_response is None:
-                    if attempt != retry_attempts:
-                        logger.info(f"Steam API request limit reached. Waiting for {int(request_retry_period / 60)} minutes. Retry attempt: {attempt}")
-                        await asyncio.sleep(request_retry_period)
-                    else:
-                        logger.error(f"Retry attempts for app_id={app_id} exceeded. Task will be delayed")
-                        return
-                    continue
+    # Перевод того же описания уже в кэше: он сохраняется заново только чтобы отметить его актуальным
+    cached = {}
+    for app_id, text in sources:
+        translation = await storage.fetchone(SELECT_TRANSLATION_SQL, (app_id, source_hash(text)))
+        if translation is not None:
+            cached[app_id] = translation[0]
+
+    # Пустое описание переводить не нужно, но оно тоже кэшируется, чтобы игра не запрашивалась снова
+    texts = [text for app_id, text in sources if text and app_id not in cached]
+    # Локальная модель перевода занимает CPU, в потоке она не блокирует event loop
+    translated = iter(await asyncio.to_thread(translator.translate_batch, texts) if texts else [])
+    await storage.executemany(SAVE_TRANSLATION_SQL, [
+        (app_id, source_hash(text), cached[app_id] if app_id in cached else next(translated) if text else "")
+        for app_id, text in sources
+    ])
+    logger.info("Translated descriptions of %d games, %d taken from cache", len(texts), len(cached))
+
+
+
+async def publish_steam_digest(
+        storage: Storage, steam: Steam,
+        bot: Bot, group_chat_id: int, logger: logging.Logger, digest_size: int = 10,
+        retry_attempts: int = 3, request_retry_period: int = 420, control: JobControl | None = None,
+        rules: PublishRules | None = None, clock: Callable[[], datetime.datetime] = _utc_now
+        ):
+    """
+    Публикует дайджест: берет до {digest_size} записей PENDING_PUBLISH с самыми большими скидками,
+    которые пропускают правила rules, и отправляет их одним альбомом из обложек со списком игр в подписи.
+    Все игры дайджеста помечаются PUBLISHED одной транзакцией, недоступные в Steam - UNAVAILABLE.
+    Как и publish_steam_post, отправляет 2-5 дайджестов с разницей от 45 мин до 2 часов
+    и не отправляет дайджест раньше времени следующего поста
+    """
 
+    control = control or JobControl()
+    await _finish_interrupted_publish(storage, logger)
+    select_digest_sql = SELECT_DIGEST_TEMPLATE.format(publishable=(rules or DEFAULT_RULES).publish_predicate())
+
+    rnd = Random()
+    post_limit = rnd.randint(2, 5)
+    for post_number in range(1, post_limit + 1):
+        if control.should_stop():
+            logger.info("Job deadline reached or job was cancelled. Stop publishing digests")
+            return
+
+        if not await _wait_for_next_post(storage, control, clock):
+            logger.info("Next digest doesn't fit into the publishing window. Stop publishing digests")
+            return
+
+        logger.info("Start publish game sales digest from steam...")
+        rows = await storage.fetchall(
+            select_digest_sql, (PostStatus.PENDING_PUBLISH.value, min(digest_size, DIGEST_MAX_GAMES))
+        )
+        if not rows:
+            logger.info("No games available for publishing")
+            return
+
+        caption_lines = []
+        covers = []
+        published_ids = []
+        for app_id, discount_percent, init_price in rows:
+            if control.should_stop():
                 break
 
+            response = await _request_app_details(
+                steam, app_id, None, logger,
+                control, request_retry_period, retry_attempts
+            )
+            if response is None:
+                break
 
-            screenshot_1 = screenshot_and_developers_response[str(app_id)]["data"]["screenshots"][0]["path_full"]
-            screenshot_2 = screenshot_and_developers_response[str(app_id)]["data"]["screenshots"][1]["path_full"]
-            screenshot_3 = screenshot_and_developers_response[str(app_id)]["data"]["screenshots"][2]["path_full"]
-
-            # Иногда больше одного разработчика
-            developers = ", ".join(screenshot_and_developers_response[str(app_id)]["data"]["developers"])
+            try:
+                basic_data = parse_app_details(response, app_id, BasicData, logger)
+            except AppDetailsFormatError:
+                return
 
+            if basic_data is None:
+                # Иначе игра останется наверху рейтинга скидок и будет запрашиваться в каждом дайджесте
+                await _mark_unavailable(storage, app_id, logger)
+                continue
 
             final_price = init_price - init_price * discount_percent / 100
-            post_caption = (
-            f"<b>{html.escape(game_title)}</b>\n\n"
-            f"Разработчики: <i>{html.escape(developers)}</i>\n\n"
-            f"{html.escape(game_description_eng)}\n\n"
-            f"<s>{init_price}</s> <b>{final_price:.2f} ₽</b>\n\n<b>-{discount_percent}% 🔥</b>\n\n" 
-            f"<a href='https://store.steampowered.com/app/{app_id}'>Открыть в Steam</a>"
+            line = (
+                f"{len(caption_lines) + 1}. <a href='https://store.steampowered.com/app/{app_id}'>{html.escape(basic_data.name)}</a> "
+                f"<s>{init_price}</s> <b>{final_price:.2f} ₽</b> <b>-{discount_percent}%</b>"
             )
+            # Подпись к фото в Telegram ограничена 1024 символами. Игры, которые не влезли, попадут в следующий дайджест
+            if len(DIGEST_HEADER) + sum(len(l) + 1 for l in caption_lines) + len(line) > DIGEST_CAPTION_LIMIT:
+                break
 
-            post = [
-                InputMediaPhoto(
-                    media=game_cover,
-                    caption=post_caption,
-                    parse_mode="HTML"
-                )
-            ]
-
-            for screenshot_url in (screenshot_1, screenshot_2, screenshot_3):
-                post.append(InputMediaPhoto(media=screenshot_url))
+            caption_lines.append(line)
+            covers.append(basic_data.header_image)
+            published_ids.append(app_id)
+
+        if not published_ids:
+            logger.info("No games with valid details for the digest")
+            return
+
+        digest_caption = DIGEST_HEADER + "\n".join(caption_lines)
+        next_post_at = clock() + datetime.timedelta(seconds=rnd.randint(*POST_PERIOD_RANGE))
+        async with _publishing(storage, published_ids, next_post_at):
+            with diagnostics.phase(diagnostics.TELEGRAM_SEND):
+                if len(covers) == 1:
+                    await bot.send_photo(
+                        chat_id=group_chat_id,
+                        photo=covers[0],
+                        caption=digest_caption,
+                        parse_mode="HTML"
+                    )
+                else:
+                    post = [InputMediaPhoto(media=covers[0], caption=digest_caption, parse_mode="HTML")]
+                    post.extend(InputMediaPhoto(media=cover) for cover in covers[1:])
+                    await bot.send_media_group(
+                        chat_id=group_chat_id,
+                        media=post
+                    )
+        logger.info("Successfully published digest with %d games: app_ids=%s", len(published_ids), published_ids)
 
-            await bot.send_media_group(
-                chat_id=group_chat_id,
-                media=post
-            )
 
-            await db.execute("""
-                            UPDATE steam_apps_info
-                            SET
-                                status = ?
-                            WHERE app_id = ?
-                            """, (PostStatus.PUBLISHED.value, app_id))
-            logger.info("Successfully published game with app_id=%s", app_id)
-            await db.commit()
 
-            # Пауза между постами от 45 мин до 2 часов
-            post_period = rnd.randint(2700, 7200)
-            await asyncio.sleep(post_period)
+async def maintain_db(
+        storage: Storage, logger: logging.Logger, archive_after_days: int = 365,
+        vacuum_pages: int = 1000
+        ):
+    """
+    Обслуживание базы в простое между юзкейсами: переносит в steam_apps_archive записи,
+    опубликованные и не менявшиеся дольше {archive_after_days} дней (если это подтвердила проверка цены
+    после этого срока), обновляет статистику планировщика, возвращает до {vacuum_pages} свободных страниц и обрезает -wal файл.
+    archive_after_days=0 отключает архивацию
+    """
 
-    
\ No newline at end of file
+    logger.info("Start database maintenance...")
+
+    if archive_after_days > 0:
+        # Граница считается один раз, чтобы копирование и удаление выбрали одни и те же записи
+        cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                  - datetime.timedelta(days=archive_after_days)).strftime("%Y-%m-%d %H:%M:%S")
+        params = (PostStatus.PUBLISHED.value, cutoff)
+        archived = await storage.fetchone(COUNT_ARCHIVABLE_SQL, params)
+        if archived[0]:
+            await storage.execute_batch([(ARCHIVE_PUBLISHED_SQL, params), (DELETE_ARCHIVED_SQL, params)])
+            logger.info("Archived %d rows published before %s", archived[0], cutoff)
+
+    await storage.run_outside_transaction("PRAGMA analysis_limit=1000")
+    await storage.run_outside_transaction("ANALYZE")
+    await storage.run_outside_transaction("PRAGMA optimize")
+
+    (auto_vacuum, ), = await storage.run_outside_transaction("PRAGMA auto_vacuum")
+    if auto_vacuum == 2:
+        await storage.run_outside_transaction(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+    else:
+        # База создана до включения incremental vacuum. Режим меняется только полным VACUUM, он нужен один раз
+        logger.info("Switching database to incremental auto_vacuum with a full VACUUM")
+        await storage.run_outside_transaction("PRAGMA auto_vacuum=INCREMENTAL")
+        await storage.run_outside_transaction("VACUUM")
+
+    (busy, wal_pages, checkpointed_pages), = await storage.run_outside_transaction("PRAGMA wal_checkpoint(TRUNCATE)")
+    if busy:
+        logger.info("WAL checkpoint was blocked by readers: %d of %d pages checkpointed", checkpointed_pages, wal_pages)
+
+    logger.info("Database maintenance finished")